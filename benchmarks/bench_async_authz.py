@@ -0,0 +1,108 @@
+"""
+Compares the synchronous and the asyncio OpenFGA authorization paths.
+
+The sync path is driven the way the server drives it: each check runs on a worker
+of anyio's default threadpool (40 threads). The async path awaits
+`authorize_async` directly on the event loop. Both run against a local FGA stand-in
+with a configurable latency and print one JSON result per path:
+
+    python -m benchmarks.bench_async_authz --latency-ms 20 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import anyio.to_thread
+from chromadb.auth import AuthorizationContext, AuthzAction, AuthzResource, AuthzUser
+from chromadb.config import Settings, System
+
+from benchmarks.common import emit, environment, summarize
+from benchmarks.fga_stub import fga_subprocess
+
+
+def authz_system() -> System:
+    return System(
+        Settings(
+            chroma_server_authz_config_provider="chroma_auth.authz.openfga.OpenFGAAuthorizationConfigurationProvider",
+            allow_reset=True,
+        )
+    )
+
+
+def query_context(collection_id: str) -> AuthorizationContext:
+    return AuthorizationContext(
+        user=AuthzUser(id="admin"),
+        resource=AuthzResource(
+            id=collection_id,
+            type="collection",
+            attributes={"tenant": "default_tenant", "database": "default_database"},
+        ),
+        action=AuthzAction(id="query"),
+    )
+
+
+async def run(
+    name: str, check: Callable[[int], Awaitable[Any]], requests: int, concurrency: int
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            _start = time.perf_counter()
+            await check(i)
+            latencies.append(time.perf_counter() - _start)
+
+    _start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    _elapsed = time.perf_counter() - _start
+    return summarize(
+        "async_authz", f"authorize_{name}", latencies, _elapsed, concurrency=concurrency
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    from chroma_auth.authz.openfga import OpenFGAAsyncAuthorizationProvider
+
+    tuples = [
+        {
+            "user": "user:admin",
+            "relation": "can_query_records",
+            "object": f"collection:default_tenant-default_database-c{i}",
+        }
+        for i in range(args.collections)
+    ]
+    with fga_subprocess(latency=args.latency_ms / 1000, tuples=tuples) as environ:
+        os.environ.update(environ)
+        system = authz_system()
+        system.start()
+        provider = system.instance(OpenFGAAsyncAuthorizationProvider)
+        contexts = [query_context(f"c{i % args.collections}") for i in range(args.requests)]
+
+        async def sync_check(i: int) -> Any:
+            return await anyio.to_thread.run_sync(provider.authorize, contexts[i])
+
+        async def async_check(i: int) -> Any:
+            return await provider.authorize_async(contexts[i])
+
+        results = []
+        for name, check in (("sync", sync_check), ("async", async_check)):
+            await check(0)  # warm up connections
+            result = await run(name, check, args.requests, args.concurrency)
+            result["latency_ms"] = args.latency_ms
+            results.append(result)
+        await provider._async_fga_client.aclose()
+        system.stop()
+    emit(results, environment(**vars(args)), args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--collections", type=int, default=10)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+Check latency with team memberships read from OpenFGA's datastore, and sent as
+contextual tuples from the groupfile and a roles file
+(`FGA_CONTEXTUAL_TEAM_ROLES_FILE`).
+
+Collections are granted to `team:chroma#owner`. In the `stored` run the caller's
+membership is a tuple in the store, in the `contextual` run it only comes from its
+identity. The local FGA stand-in delays every check by `--latency-ms` and by
+`--read-latency-ms` per datastore read it takes:
+
+    python -m benchmarks.bench_contextual_teams --latency-ms 2 --read-latency-ms 1
+
+The decision cache and the prefetching of collection relations are disabled, so
+that every call is a check.
+"""
+import argparse
+import os
+import tempfile
+from typing import Any, Dict, List
+
+from chromadb.auth import AuthorizationContext, AuthzAction, AuthzResource, AuthzUser
+from chromadb.config import Settings, System
+
+from benchmarks.common import emit, environment, measure
+from benchmarks.fga_stub import fga_subprocess
+
+SUITE = "contextual_teams"
+MEMBERSHIP = {"user": "user:admin", "relation": "owner", "object": "team:chroma"}
+
+
+def grants(collections: int) -> List[Dict[str, str]]:
+    return [
+        {
+            "user": "team:chroma#owner",
+            "relation": "can_query_records",
+            "object": f"collection:default_tenant-default_database-c{i}",
+        }
+        for i in range(collections)
+    ]
+
+
+def roles_file() -> str:
+    with tempfile.NamedTemporaryFile("w", suffix=".teamroles", delete=False) as f:
+        f.write(f"chroma#{MEMBERSHIP['relation']}: admin\n")
+    return f.name
+
+
+def team_context(collection_id: str) -> AuthorizationContext:
+    return AuthorizationContext(
+        user=AuthzUser(
+            id="admin", attributes={"team": "chroma", "teams": ("chroma",)}
+        ),
+        resource=AuthzResource(
+            id=collection_id,
+            type="collection",
+            attributes={"tenant": "default_tenant", "database": "default_database"},
+        ),
+        action=AuthzAction(id="query"),
+    )
+
+
+def run(name: str, args: argparse.Namespace, contextual: bool) -> Dict[str, Any]:
+    from chroma_auth.authz.openfga import OpenFGAAuthorizationProvider
+
+    _tuples = grants(args.collections) + ([] if contextual else [MEMBERSHIP])
+    with fga_subprocess(
+        latency=args.latency_ms / 1000,
+        tuples=_tuples,
+        read_latency=args.read_latency_ms / 1000,
+    ) as environ:
+        os.environ.update(environ)
+        os.environ["FGA_CONTEXTUAL_TEAM_ROLES_FILE"] = (
+            roles_file() if contextual else ""
+        )
+        system = System(
+            Settings(
+                chroma_server_authz_config_provider="chroma_auth.authz.openfga.OpenFGAAuthorizationConfigurationProvider",
+                allow_reset=True,
+            )
+        )
+        provider = system.instance(OpenFGAAuthorizationProvider)
+        system.start()
+        contexts = [team_context(f"c{i}") for i in range(args.collections)]
+
+        def authorize(i: int) -> None:
+            if not provider.authorize(contexts[i % len(contexts)]):
+                raise AssertionError(f"The {name} membership was not resolved")
+
+        _result = measure(
+            SUITE,
+            f"authorize_{name}",
+            authorize,
+            args.iterations,
+            latency_ms=args.latency_ms,
+            read_latency_ms=args.read_latency_ms,
+        )
+        system.stop()
+    return _result
+
+
+def main(args: argparse.Namespace) -> None:
+    os.environ["FGA_CHECK_CACHE_SIZE"] = "0"
+    os.environ["FGA_PREFETCH_COLLECTION_RELATIONS"] = "false"
+    results = [
+        run("stored", args, contextual=False),
+        run("contextual", args, contextual=True),
+    ]
+    emit(results, environment(**vars(args)), args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--latency-ms", type=float, default=2)
+    parser.add_argument("--read-latency-ms", type=float, default=1)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--collections", type=int, default=10)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    main(parser.parse_args())
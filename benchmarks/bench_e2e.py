@@ -0,0 +1,142 @@
+"""
+End-to-end request latency through the instrumented FastAPI app
+(`chroma_auth.instr`), with basic auth and OpenFGA authorization against a local
+OpenFGA stand-in with a configurable latency. Requests are made in-process with
+Starlette's test client, one at a time, so the figures are the server-side cost of
+a request including authentication, authorization and permission provisioning:
+
+    python -m benchmarks.bench_e2e --latency-ms 5 --output before.json
+
+`heartbeat` is neither authenticated nor authorized and is the baseline of the
+HTTP stack.
+"""
+import argparse
+import base64
+import itertools
+import os
+import tempfile
+from typing import Any, Dict, List
+
+from chromadb.config import Settings
+
+from benchmarks.common import emit, environment, measure, write_credentials
+from benchmarks.fga_stub import fga_subprocess
+
+SUITE = "e2e"
+DATABASE = "database:default_tenant-default_database"
+
+
+def seed_tuples() -> List[Dict[str, str]]:
+    return [{"user": "user:admin", "relation": "owner", "object": "team:chroma"}] + [
+        {"user": "user:admin", "relation": relation, "object": DATABASE}
+        for relation in (
+            "can_create_collection",
+            "can_list_collections",
+            "can_get_or_create_collection",
+            "can_count_collections",
+        )
+    ]
+
+
+def main(args: argparse.Namespace) -> None:
+    from fastapi.testclient import TestClient
+
+    directory = tempfile.mkdtemp()
+    credentials_file = write_credentials(
+        directory, {"admin": "admin"}, rounds=args.bcrypt_rounds
+    )
+    headers = {"Authorization": "Basic " + base64.b64encode(b"admin:admin").decode()}
+    results = []
+    with fga_subprocess(latency=args.latency_ms / 1000, tuples=seed_tuples()) as environ:
+        os.environ.update(environ)
+        from chroma_auth.instr import FastAPI
+
+        server = FastAPI(
+            Settings(
+                chroma_server_auth_provider="chroma_auth.authn.basic.MultiUserBasicAuthServerProvider",
+                chroma_server_auth_credentials_provider="chroma_auth.authn.basic.MultiUserHtpasswdFileServerAuthCredentialsProvider",
+                chroma_server_auth_credentials_file=credentials_file,
+                chroma_server_authz_provider=args.authz_provider,
+                chroma_server_authz_config_provider="chroma_auth.authz.openfga.OpenFGAAuthorizationConfigurationProvider",
+                is_persistent=True,
+                persist_directory=directory,
+                allow_reset=True,
+                anonymized_telemetry=False,
+            )
+        )
+        with TestClient(server.app()) as client:
+
+            def call(method: str, path: str, **kwargs: Any) -> Any:
+                _response = client.request(method, path, headers=headers, **kwargs)
+                if not 200 <= _response.status_code < 300:
+                    raise RuntimeError(
+                        f"{method} {path} failed with {_response.status_code}: "
+                        f"{_response.text}"
+                    )
+                return _response.json()
+
+            collection = call("POST", "/api/v1/collections", json={"name": "bench"})
+            base = f"/api/v1/collections/{collection['id']}"
+            call(
+                "POST",
+                f"{base}/add",
+                json={"ids": ["seed"], "embeddings": [[0.0, 0.0, 0.0]]},
+            )
+            ids = itertools.count()
+            _extra = {"latency_ms": args.latency_ms, "provider": args.authz_provider}
+            routes = [
+                ("heartbeat", lambda i: client.get("/api/v1/heartbeat")),
+                (
+                    "create_collection",
+                    lambda i: call(
+                        "POST", "/api/v1/collections", json={"name": f"bench-{i}"}
+                    ),
+                ),
+                ("get_collection", lambda i: call("GET", "/api/v1/collections/bench")),
+                ("list_collections", lambda i: call("GET", "/api/v1/collections")),
+                (
+                    "add",
+                    lambda i: call(
+                        "POST",
+                        f"{base}/add",
+                        json={"ids": [f"id-{next(ids)}"], "embeddings": [[i, 0.0, 1.0]]},
+                    ),
+                ),
+                ("count", lambda i: call("GET", f"{base}/count")),
+                ("get", lambda i: call("POST", f"{base}/get", json={"ids": ["seed"]})),
+                (
+                    "query",
+                    lambda i: call(
+                        "POST",
+                        f"{base}/query",
+                        json={"query_embeddings": [[0.0, 0.0, 0.0]], "n_results": 1},
+                    ),
+                ),
+                (
+                    "delete_collection",
+                    lambda i: call("DELETE", f"/api/v1/collections/bench-{i}"),
+                ),
+            ]
+            for name, fn in routes:
+                # created and deleted collections are paired by index, so they
+                # must not be warmed up
+                _warmup = 0 if name in ("create_collection", "delete_collection") else 5
+                results.append(
+                    measure(SUITE, name, fn, args.iterations, warmup=_warmup, **_extra)
+                )
+    emit(results, environment(**vars(args)), args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument(
+        "--authz-provider",
+        default="chroma_auth.authz.openfga.OpenFGAAuthorizationProvider",
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    main(parser.parse_args())
@@ -0,0 +1,305 @@
+"""
+Microbenchmarks of the individual provider methods, against a local OpenFGA
+stand-in with a configurable latency:
+
+- authn: `validate_credentials` (bcrypt, or the credentials cache when
+  `CHROMA_AUTH_CREDENTIALS_CACHE_SIZE` is set), `get_user_identity`, and
+  `validate_session_token` when `CHROMA_AUTH_SESSION_SECRETS` is set;
+- authz: `resolve_resource_action` (per action), and `authorize` for a new object on
+  every call (`authorize_cold`) and for the same object (`authorize_warm`, served by
+  the check cache when `FGA_CHECK_CACHE_SIZE` is set);
+- route: a route handler behind the server's `authz_context`, with the decision
+  served by the check cache, i.e. the authorization overhead added to a request;
+- permissions: provisioning and deprovisioning the tuples of a collection.
+
+The providers are configured from the environment as in the server, so settings
+can be compared by exporting them:
+
+    python -m benchmarks.bench_providers --latency-ms 5 --output before.json
+"""
+import argparse
+import os
+import tempfile
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from chromadb.auth import (
+    AuthorizationContext,
+    AuthzAction,
+    AuthzDynamicParams,
+    AuthzResource,
+    AuthzResourceActions,
+    AuthzResourceTypes,
+    AuthzUser,
+    BasicAuthCredentials,
+    DynamicAuthzResource,
+    ServerAuthorizationProvider,
+    ServerAuthCredentialsProvider,
+)
+from chromadb.auth.fastapi import authz_provider as authz_provider_var, request_var
+from chromadb.auth.registry import resolve_provider
+from chromadb.config import Settings, System
+from pydantic import SecretStr
+from starlette.requests import Request
+
+from benchmarks.bench_async_authz import query_context
+from benchmarks.common import emit, environment, measure, write_credentials
+from benchmarks.fga_stub import fga_subprocess
+
+SUITE = "providers"
+
+
+def seed_tuples(collections: int) -> List[Dict[str, str]]:
+    return [{"user": "user:admin", "relation": "owner", "object": "team:chroma"}] + [
+        {
+            "user": "team:chroma#owner",
+            "relation": "can_query_records",
+            "object": f"collection:default_tenant-default_database-c{i}",
+        }
+        for i in range(collections)
+    ]
+
+
+def action_contexts() -> Dict[str, AuthorizationContext]:
+    """One context per kind of object resolved by `resolve_resource_action`."""
+    _database = {"tenant": "default_tenant", "database": "default_database"}
+    return {
+        "query": query_context("c0"),
+        "create_collection": AuthorizationContext(
+            user=AuthzUser(id="admin"),
+            resource=AuthzResource(id="new", type="db", attributes=_database),
+            action=AuthzAction(id="create_collection"),
+        ),
+        "list_collections": AuthorizationContext(
+            user=AuthzUser(id="admin"),
+            resource=AuthzResource(id="*", type="db", attributes=_database),
+            action=AuthzAction(id="list_collections"),
+        ),
+        "get_tenant": AuthorizationContext(
+            user=AuthzUser(id="admin"),
+            resource=AuthzResource(
+                id="*", type="tenant", attributes={"tenant": "default_tenant"}
+            ),
+            action=AuthzAction(id="get_tenant"),
+        ),
+    }
+
+
+def query_route() -> Callable[..., int]:
+    """A route handler authorized like the server's `query`."""
+    from chroma_auth.instr import authz_context
+
+    @authz_context(
+        action=AuthzResourceActions.QUERY,
+        resource=DynamicAuthzResource(
+            id=AuthzDynamicParams.from_function_kwargs(arg_name="collection_id"),
+            type=AuthzResourceTypes.COLLECTION,
+            attributes=AuthzDynamicParams.dict_from_function_kwargs(
+                arg_names=["tenant", "database"]
+            ),
+        ),
+    )
+    def query(
+        server: Any,
+        collection_id: str,
+        tenant: str = "default_tenant",
+        database: str = "default_database",
+    ) -> int:
+        return 0
+
+    return query
+
+
+def request_for(identity: Any) -> Request:
+    _request = Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/api/v1/collections",
+            "query_string": b"tenant=default_tenant&database=default_database",
+            "headers": [],
+        }
+    )
+    _request.state.user_identity = identity
+    return _request
+
+
+def main(args: argparse.Namespace) -> None:
+    from chroma_auth.authz.openfga.openfga_permissions import OpenFGAPermissionsAPI
+    from chroma_auth.utils.collection_cache import CollectionRef
+
+    directory = tempfile.mkdtemp()
+    credentials_file = write_credentials(
+        directory, {"admin": "admin"}, rounds=args.bcrypt_rounds
+    )
+    results = []
+    with fga_subprocess(
+        latency=args.latency_ms / 1000, tuples=seed_tuples(args.collections)
+    ) as environ:
+        os.environ.update(environ)
+        system = System(
+            Settings(
+                chroma_server_auth_credentials_file=credentials_file,
+                chroma_server_authz_config_provider="chroma_auth.authz.openfga.OpenFGAAuthorizationConfigurationProvider",
+                persist_directory=directory,
+                allow_reset=True,
+            )
+        )
+        credentials = system.instance(
+            resolve_provider(
+                "chroma_auth.authn.basic.MultiUserHtpasswdFileServerAuthCredentialsProvider",
+                ServerAuthCredentialsProvider,
+            )
+        )
+        authz = system.instance(
+            resolve_provider(args.authz_provider, ServerAuthorizationProvider)
+        )
+        permissions = system.instance(OpenFGAPermissionsAPI)
+        system.start()
+
+        _credentials = BasicAuthCredentials(SecretStr("admin"), SecretStr("admin"))
+        _identity = credentials.get_user_identity(_credentials)
+        _context = query_context("c0")
+        _contexts = [query_context(f"cold-{i}") for i in range(args.iterations + 10)]
+        _request = request_for(_identity)
+        _collections = [
+            CollectionRef(
+                id=uuid.uuid4(),
+                name=f"bench-{i}",
+                tenant="default_tenant",
+                database="default_database",
+            )
+            for i in range(args.provisioning_iterations + 1)
+        ]
+        _extra = {"latency_ms": args.latency_ms}
+
+        results.append(
+            measure(
+                SUITE,
+                "authn.validate_credentials",
+                lambda i: credentials.validate_credentials(_credentials),
+                args.authn_iterations,
+                warmup=1,
+                bcrypt_rounds=args.bcrypt_rounds,
+                **_extra,
+            )
+        )
+        results.append(
+            measure(
+                SUITE,
+                "authn.get_user_identity",
+                lambda i: credentials.get_user_identity(_credentials),
+                args.iterations,
+                **_extra,
+            )
+        )
+        if credentials.sessions_enabled:
+            # what a client presenting a session token pays instead of bcrypt
+            _token, _ = credentials.issue_session_token("admin")
+            results.append(
+                measure(
+                    SUITE,
+                    "authn.validate_session_token",
+                    lambda i: credentials.validate_session_token(_token),
+                    args.iterations,
+                    **_extra,
+                )
+            )
+        for action, context in action_contexts().items():
+            results.append(
+                measure(
+                    SUITE,
+                    "authz.resolve_resource_action"
+                    + ("" if action == "query" else f".{action}"),
+                    lambda i, c=context: authz.resolve_resource_action(  # type: ignore
+                        resource=c.resource, action=c.action
+                    ),
+                    args.iterations,
+                    **_extra,
+                )
+            )
+        results.append(
+            measure(
+                SUITE,
+                "authz.authorize_cold",
+                lambda i: authz.authorize(_contexts[i]),
+                args.iterations,
+                warmup=0,
+                provider=args.authz_provider,
+                **_extra,
+            )
+        )
+        results.append(
+            measure(
+                SUITE,
+                "authz.authorize_warm",
+                lambda i: authz.authorize(_context),
+                args.iterations,
+                provider=args.authz_provider,
+                **_extra,
+            )
+        )
+        _route, _server = query_route(), SimpleNamespace(_api=None)
+        request_var.set(_request)
+        authz_provider_var.set(authz)
+        results.append(
+            measure(
+                SUITE,
+                "route.authz_context",
+                lambda i: _route(
+                    _server,
+                    collection_id="c0",
+                    tenant="default_tenant",
+                    database="default_database",
+                ),
+                args.iterations,
+                provider=args.authz_provider,
+                **_extra,
+            )
+        )
+        request_var.set(None)
+        results.append(
+            measure(
+                SUITE,
+                "permissions.provision_collection",
+                lambda i: permissions.create_collection_permissions(
+                    _collections[i], _request  # type: ignore
+                ),
+                args.provisioning_iterations,
+                warmup=0,
+                **_extra,
+            )
+        )
+        results.append(
+            measure(
+                SUITE,
+                "permissions.deprovision_collection",
+                lambda i: permissions.delete_collection_permissions(
+                    _collections[i], _request
+                ),
+                args.provisioning_iterations,
+                warmup=0,
+                **_extra,
+            )
+        )
+        system.stop()
+    emit(results, environment(**vars(args)), args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--authn-iterations", type=int, default=20)
+    parser.add_argument("--provisioning-iterations", type=int, default=50)
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--collections", type=int, default=10)
+    parser.add_argument(
+        "--authz-provider",
+        default="chroma_auth.authz.openfga.OpenFGAAuthorizationProvider",
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    main(parser.parse_args())
@@ -0,0 +1,112 @@
+"""
+Shared helpers of the benchmark suite: timing loops, run metadata and the JSON
+result format read by `benchmarks.compare`.
+
+Every result is one JSON object with a `suite`, a `benchmark` name and latency
+figures in microseconds. A run prints one object per line and, with `--output`,
+also writes `{"environment": ..., "results": [...]}` to a file so that runs on
+different commits can be compared.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import bcrypt
+
+from benchmarks.fga_stub import percentile
+
+# the settings recorded with every run; they change what is being measured
+RECORDED_ENV_PREFIXES = ("FGA_", "CHROMA_AUTH_")
+SECRET_ENV_MARKERS = ("SECRET", "KEY", "TOKEN", "PASSWORD")
+
+
+def measure(
+    suite: str,
+    benchmark: str,
+    fn: Callable[[int], Any],
+    iterations: int,
+    warmup: int = 10,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """Time `iterations` sequential calls of `fn(i)` after `warmup` untimed ones."""
+    for i in range(warmup):
+        fn(i)
+    latencies: List[float] = []
+    _started_at = time.perf_counter()
+    for i in range(iterations):
+        _start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - _start)
+    _elapsed = time.perf_counter() - _started_at
+    return summarize(suite, benchmark, latencies, _elapsed, **extra)
+
+
+def summarize(
+    suite: str, benchmark: str, latencies: List[float], elapsed: float, **extra: Any
+) -> Dict[str, Any]:
+    return {
+        "suite": suite,
+        "benchmark": benchmark,
+        "iterations": len(latencies),
+        "ops_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_us": round(sum(latencies) / len(latencies) * 1e6, 2),
+        "p50_us": round(percentile(latencies, 50) * 1e6, 2),  # type: ignore
+        "p90_us": round(percentile(latencies, 90) * 1e6, 2),  # type: ignore
+        "p99_us": round(percentile(latencies, 99) * 1e6, 2),  # type: ignore
+        **extra,
+    }
+
+
+def environment(**parameters: Any) -> Dict[str, Any]:
+    """What a run was measured on: commit, interpreter, host and settings."""
+    try:
+        _commit: Optional[str] = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        _commit = None
+    return {
+        "commit": _commit,
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            k: v
+            for k, v in sorted(os.environ.items())
+            if k.startswith(RECORDED_ENV_PREFIXES)
+            and not any(m in k for m in SECRET_ENV_MARKERS)
+        },
+        "parameters": parameters,
+    }
+
+
+def emit(
+    results: List[Dict[str, Any]], environment: Dict[str, Any], output: Optional[str]
+) -> None:
+    for result in results:
+        print(json.dumps(result), flush=True)
+    if output:
+        with open(output, "w") as f:
+            json.dump({"environment": environment, "results": results}, f, indent=2)
+
+
+def write_credentials(directory: str, users: Dict[str, str], rounds: int) -> str:
+    """Write an htpasswd file (bcrypt) and a groupfile putting every user in team
+    `chroma`; returns the htpasswd path."""
+    _htpasswd = os.path.join(directory, "server.htpasswd")
+    with open(_htpasswd, "w") as f:
+        for user, password in users.items():
+            _hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+            f.write(f"{user}:{_hash}\n")
+    with open(os.path.join(directory, "groupfile"), "w") as f:
+        f.write(f"chroma:{','.join(users)}\n")
+    return _htpasswd
@@ -0,0 +1,55 @@
+"""
+Compares two result files written with `--output` by the benchmark suites:
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Prints the change of every benchmark present in both files and exits with status 1
+if any of them got slower by more than `--threshold` percent on `--metric`.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Tuple
+
+Key = Tuple[str, str]  # (suite, benchmark)
+
+
+def load(file: str) -> Dict[Key, Dict[str, Any]]:
+    with open(file, "r") as f:
+        _results = json.load(f)["results"]
+    return {(r["suite"], r["benchmark"]): r for r in _results}
+
+
+def main(args: argparse.Namespace) -> int:
+    before, after = load(args.before), load(args.after)
+    regressions = 0
+    for key in sorted(before.keys() & after.keys()):
+        _before, _after = before[key][args.metric], after[key][args.metric]
+        _change = (_after - _before) / _before * 100 if _before else 0.0
+        _regressed = _change > args.threshold
+        regressions += _regressed
+        print(
+            json.dumps(
+                {
+                    "suite": key[0],
+                    "benchmark": key[1],
+                    "metric": args.metric,
+                    "before": _before,
+                    "after": _after,
+                    "change_pct": round(_change, 1),
+                    "regressed": _regressed,
+                }
+            )
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--metric", default="p50_us")
+    parser.add_argument("--threshold", type=float, default=10)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,317 @@
+"""
+A local stand-in for the OpenFGA HTTP API, used by the benchmarks.
+
+It implements the subset of the API the providers use against an in-memory tuple
+store: check (direct grants and `type:id#relation` usersets, plus contextual
+tuples), write/delete, read, list-objects, read-changes and authorization model
+reads. Every request is delayed by a configurable latency to emulate a remote FGA,
+and a check by a latency per datastore read: one for the direct tuple, one for the
+usersets on the object and one per userset membership not given as a contextual
+tuple, as OpenFGA resolves them.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pytest_httpserver import HTTPServer
+from werkzeug import Request, Response
+
+STORE_ID = "01HVMMBCMGZNT3SED4Z17ECXCA"
+MODEL_ID = "01HVMMBCMGZNT3SED4Z17ECXCB"
+
+Tuple3 = Tuple[str, str, str]  # (user, relation, object)
+
+logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+
+class FakeOpenFGAServer:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        tuples: Iterable[Dict[str, str]] = (),
+        host: str = "127.0.0.1",
+        port: int = 0,
+        read_latency: float = 0.0,
+    ) -> None:
+        self.latency = latency
+        self.read_latency = read_latency
+        self.reads = 0
+        self._lock = threading.Lock()
+        self._tuples: Set[Tuple3] = set()
+        self._written_at: Dict[Tuple3, str] = {}
+        self._changes: List[Dict[str, Any]] = []
+        self.requests: Counter[str] = Counter()
+        self._apply([_key(t) for t in tuples], [])
+        self._server = HTTPServer(host=host, port=port, threaded=True)
+        for method, name in (
+            ("POST", "check"),
+            ("POST", "write"),
+            ("POST", "read"),
+            ("POST", "list-objects"),
+            ("GET", "changes"),
+        ):
+            self._server.expect_request(
+                re.compile(rf"^/stores/[^/]+/{name}$"), method=method
+            ).respond_with_handler(self._handler(name))
+        self._server.expect_request(
+            re.compile(r"^/stores/[^/]+/authorization-models.*$"), method="GET"
+        ).respond_with_handler(self._handler("authorization-models"))
+
+    def start(self) -> "FakeOpenFGAServer":
+        self._server.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.clear()
+        if self._server.is_running():
+            self._server.stop()
+
+    def __enter__(self) -> "FakeOpenFGAServer":
+        return self.start()
+
+    def __exit__(self, *_: Any) -> None:
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self._server.host}:{self._server.port}"
+
+    def environ(self) -> Dict[str, str]:
+        """Environment expected by OpenFGAAuthorizationConfigurationProvider."""
+        return {
+            "FGA_API_URL": self.url,
+            "FGA_STORE_ID": STORE_ID,
+            "FGA_MODEL_ID": MODEL_ID,
+        }
+
+    @property
+    def tuples(self) -> Set[Tuple3]:
+        with self._lock:
+            return set(self._tuples)
+
+    def check(
+        self, user: str, relation: str, object: str, contextual: Set[Tuple3] = set()
+    ) -> bool:
+        return self._resolve(user, relation, object, contextual)[0]
+
+    def _resolve(
+        self, user: str, relation: str, object: str, contextual: Set[Tuple3]
+    ) -> Tuple[bool, int]:
+        """The decision, and the number of datastore reads it took."""
+        with self._lock:
+            if (user, relation, object) in contextual:
+                return True, 0
+            if (user, relation, object) in self._tuples:
+                return True, 1
+            _reads = 2
+            for _user, _relation, _object in self._tuples | contextual:
+                if _relation == relation and _object == object and "#" in _user:
+                    _userset_object, _userset_relation = _user.split("#", 1)
+                    _member = (user, _userset_relation, _userset_object)
+                    if _member in contextual:
+                        return True, _reads
+                    _reads += 1
+                    if _member in self._tuples:
+                        return True, _reads
+            return False, _reads
+
+    def _handler(self, name: str) -> Any:
+        def handle(request: Request) -> Response:
+            self.requests[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            body = request.get_json(silent=True) or {}
+            return Response(
+                json.dumps(getattr(self, "_handle_" + name.replace("-", "_"))(body, request)),
+                content_type="application/json",
+            )
+
+        return handle
+
+    def _handle_check(self, body: Dict[str, Any], _: Request) -> Dict[str, Any]:
+        key = body["tuple_key"]
+        _allowed, _reads = self._resolve(
+            key["user"], key["relation"], key["object"], _contextual(body)
+        )
+        with self._lock:
+            self.reads += _reads
+        if self.read_latency:
+            time.sleep(self.read_latency * _reads)
+        return {"allowed": _allowed}
+
+    def _handle_write(self, body: Dict[str, Any], _: Request) -> Dict[str, Any]:
+        self._apply(
+            [_key(t) for t in (body.get("writes") or {}).get("tuple_keys", [])],
+            [_key(t) for t in (body.get("deletes") or {}).get("tuple_keys", [])],
+        )
+        return {}
+
+    def _apply(self, writes: List[Tuple3], deletes: List[Tuple3]) -> None:
+        with self._lock:
+            _now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            for t in writes:
+                self._tuples.add(t)
+                self._written_at[t] = _now
+                self._changes.append(_change(t, "TUPLE_OPERATION_WRITE", _now))
+            for t in deletes:
+                self._tuples.discard(t)
+                self._written_at.pop(t, None)
+                self._changes.append(_change(t, "TUPLE_OPERATION_DELETE", _now))
+
+    def _handle_read(self, body: Dict[str, Any], _: Request) -> Dict[str, Any]:
+        key = body.get("tuple_key") or {}
+        page_size = int(body.get("page_size") or 50)
+        offset = int(body.get("continuation_token") or 0)
+        matches = sorted(
+            t
+            for t in self.tuples
+            if (not key.get("user") or t[0] == key["user"])
+            and (not key.get("relation") or t[1] == key["relation"])
+            and (
+                not key.get("object")
+                or t[2] == key["object"]
+                or (key["object"].endswith(":") and t[2].startswith(key["object"]))
+            )
+        )
+        page = matches[offset : offset + page_size]
+        return {
+            "tuples": [
+                {
+                    "key": {"user": u, "relation": r, "object": o},
+                    "timestamp": self._written_at.get((u, r, o)),
+                }
+                for u, r, o in page
+            ],
+            "continuation_token": str(offset + page_size)
+            if offset + page_size < len(matches)
+            else "",
+        }
+
+    def _handle_list_objects(self, body: Dict[str, Any], _: Request) -> Dict[str, Any]:
+        contextual = _contextual(body)
+        candidates = {
+            o for _, _, o in self.tuples | contextual if o.startswith(body["type"] + ":")
+        }
+        return {
+            "objects": sorted(
+                o
+                for o in candidates
+                if self.check(body["user"], body["relation"], o, contextual)
+            )
+        }
+
+    def _handle_changes(self, _: Dict[str, Any], request: Request) -> Dict[str, Any]:
+        _type = request.args.get("type")
+        page_size = int(request.args.get("page_size") or 50)
+        offset = int(request.args.get("continuation_token") or 0)
+        with self._lock:
+            changes = self._changes[offset : offset + page_size]
+            # the real API returns the token of the last change, even at the end
+            token = str(offset + len(changes))
+        if _type:
+            changes = [
+                c for c in changes if c["tuple_key"]["object"].startswith(_type + ":")
+            ]
+        return {"changes": changes, "continuation_token": token}
+
+    def _handle_authorization_models(self, _: Dict[str, Any], __: Request) -> Dict[str, Any]:
+        model = {"id": MODEL_ID, "schema_version": "1.1", "type_definitions": []}
+        return {"authorization_model": model, "authorization_models": [model]}
+
+
+def _key(t: Dict[str, str]) -> Tuple3:
+    return t["user"], t["relation"], t["object"]
+
+
+def _contextual(body: Dict[str, Any]) -> Set[Tuple3]:
+    return {
+        _key(t) for t in (body.get("contextual_tuples") or {}).get("tuple_keys", [])
+    }
+
+
+def _change(t: Tuple3, operation: str, timestamp: str) -> Dict[str, Any]:
+    return {
+        "tuple_key": {"user": t[0], "relation": t[1], "object": t[2]},
+        "operation": operation,
+        "timestamp": timestamp,
+    }
+
+
+def _serve(
+    latency: float, tuples: List[Dict[str, str]], port: int, read_latency: float = 0.0
+) -> None:
+    with FakeOpenFGAServer(
+        latency=latency, tuples=tuples, port=port, read_latency=read_latency
+    ):
+        threading.Event().wait()
+
+
+@contextmanager
+def fga_subprocess(
+    latency: float = 0.0,
+    tuples: Iterable[Dict[str, str]] = (),
+    read_latency: float = 0.0,
+) -> Iterator[Dict[str, str]]:
+    """Run the stand-in in its own process, so it does not compete for the GIL
+    with the code being measured. Yields the FGA_* environment to use."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serve, args=(latency, list(tuples), port, read_latency), daemon=True
+    )
+    process.start()
+    try:
+        _deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > _deadline:
+                    raise
+                time.sleep(0.05)
+        yield {
+            "FGA_API_URL": f"http://127.0.0.1:{port}",
+            "FGA_STORE_ID": STORE_ID,
+            "FGA_MODEL_ID": MODEL_ID,
+        }
+    finally:
+        process.terminate()
+        process.join()
+
+
+def load_tuples(file: str) -> List[Dict[str, str]]:
+    with open(file, "r") as f:
+        return list(json.load(f))
+
+
+def percentile(samples: List[float], p: float) -> Optional[float]:
+    if not samples:
+        return None
+    _sorted = sorted(samples)
+    return _sorted[min(len(_sorted) - 1, int(round(p / 100 * (len(_sorted) - 1))))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local OpenFGA stand-in")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--read-latency-ms", type=float, default=0)
+    parser.add_argument("--tuples", help="JSON file of tuples to preload")
+    args = parser.parse_args()
+    print(f"Fake OpenFGA listening on http://127.0.0.1:{args.port}, store {STORE_ID}")
+    _serve(
+        args.latency_ms / 1000,
+        load_tuples(args.tuples) if args.tuples else [],
+        args.port,
+        args.read_latency_ms / 1000,
+    )
@@ -1,13 +1,24 @@
+import hashlib
+import hmac
 import importlib
 import logging
+import os
+import sys
+import threading
+import time
 from os import path
-from typing import Dict, cast, TypeVar, Optional
+from typing import Any, Dict, List, NamedTuple, Tuple, cast, TypeVar, Optional
 
 from chromadb.auth import (
     ServerAuthCredentialsProvider,
     AbstractCredentials,
     SimpleUserIdentity,
+    AuthInfoType,
+    BasicAuthCredentials,
+    ServerAuthenticationRequest,
+    SimpleServerAuthenticationResponse,
 )
+from chromadb.auth.basic import BasicAuthServerProvider
 from chromadb.auth.registry import register_provider
 from chromadb.config import System
 from chromadb.telemetry.opentelemetry import (
@@ -15,20 +26,154 @@ from chromadb.telemetry.opentelemetry import (
     trace_method,
     add_attributes_to_current_span,
 )
+from prometheus_client import Counter, Histogram
 from pydantic import SecretStr
 from overrides import override
 
+from chroma_auth.authn.basic.session import SessionTokenSigner, parse_secrets
+from chroma_auth.authn.basic.verifier import (
+    AuthenticationOverloadedError,
+    BcryptVerifierPool,
+)
+from chroma_auth.utils import env_float, env_int
+from chroma_auth.utils.shared_cache import SharedAuthCache
+from chroma_auth.utils.ttl_cache import TTLCache
+
 T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
+BCRYPT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BCRYPT_VERIFY_SECONDS = Histogram(
+    "chroma_auth_bcrypt_verify_seconds",
+    "Time spent hashing a password to verify it.",
+    buckets=BCRYPT_BUCKETS,
+)
+BCRYPT_QUEUE_WAIT_SECONDS = Histogram(
+    "chroma_auth_bcrypt_queue_wait_seconds",
+    "Time a password verification waited for a worker of the bcrypt pool.",
+    buckets=BCRYPT_BUCKETS,
+)
+AUTHENTICATIONS = Counter(
+    "chroma_auth_authentications_total",
+    "Basic auth attempts, by result (success, failure, overloaded).",
+    ["result"],
+)
+SESSION_TOKENS = Counter(
+    "chroma_auth_session_tokens_total",
+    "Session tokens issued and presented, by result (issued, valid, expired, invalid, revoked).",
+    ["result"],
+)
+
+
+class HtpasswdSnapshot(NamedTuple):
+    """An immutable view of the credentials file and groupfile, swapped atomically."""
+
+    creds: Dict[str, SecretStr]  # contains user:password-hash
+    user_teams: Dict[str, Tuple[str, ...]]  # contains user:(team1, ..., teamN)
+    generation: int
+    signature: Tuple[Optional[Tuple[int, int]], ...]  # (mtime_ns, size) per file
+
+
+def _load_credentials_file(file: str) -> Dict[str, SecretStr]:
+    _creds = dict()
+    with open(file, "r") as f:
+        for line in f:
+            _raw_creds = [v for v in line.strip().split(":")]
+            if len(_raw_creds) != 2:
+                raise ValueError(
+                    "Invalid Htpasswd credentials found in "
+                    f"[{file}]. "
+                    "Must be <username>:<bcrypt passwd>."
+                )
+            _creds[_raw_creds[0]] = SecretStr(_raw_creds[1])
+    return _creds
+
+
+def _load_group_file(file: str) -> Dict[str, Tuple[str, ...]]:
+    """Single pass over the groupfile building a user -> teams index.
+
+    Teams keep the order in which they appear in the file, so the first team is the
+    same one previously exposed as the user's only team.
+    """
+    _user_teams: Dict[str, List[str]] = dict()
+    with open(file, "r") as f:
+        for line in f:
+            _raw_group = [v for v in line.strip().split(":")]
+            if len(_raw_group) < 2:
+                raise ValueError(
+                    "Invalid Htpasswd group file found in "
+                    f"[{file}]. "
+                    "Must be <groupname>:<username1>,<username2>,...,<usernameN>."
+                )
+            _group = sys.intern(_raw_group[0].strip())
+            for _user in _raw_group[1].split(","):
+                _user = _user.strip()
+                if not _user:
+                    continue
+                _teams = _user_teams.setdefault(sys.intern(_user), [])
+                if _group not in _teams:
+                    _teams.append(_group)
+    return {_user: tuple(_teams) for _user, _teams in _user_teams.items()}
+
 
 @register_provider("multi_user_htpasswd_file")
 class MultiUserHtpasswdFileServerAuthCredentialsProvider(ServerAuthCredentialsProvider):
-    _creds: Dict[str, SecretStr]  # contains user:password-hash
+    _snapshot: HtpasswdSnapshot
+    _credentials_cache: Optional[TTLCache[bytes, str]]  # keyed hash -> username
+    _verifier_pool: Optional[BcryptVerifierPool]
 
     def __init__(self, system: System) -> None:
         super().__init__(system)
+        # Successful bcrypt verifications can be cached to avoid re-hashing the
+        # password on every request. Disabled unless a cache size is configured.
+        _cache_size = env_int("CHROMA_AUTH_CREDENTIALS_CACHE_SIZE", 0)
+        self._credentials_cache = (
+            TTLCache(
+                capacity=_cache_size,
+                ttl=env_float("CHROMA_AUTH_CREDENTIALS_CACHE_TTL_SECONDS", 300),
+            )
+            if _cache_size > 0
+            else None
+        )
+        # Verifications are shared with the other worker processes of the host
+        # if a shared cache (and its secret) is configured
+        self._shared = self.require(SharedAuthCache)
+        # per-process key so that cache keys cannot be brute-forced offline, or a
+        # key common to the workers but not readable from the shared cache file
+        self._credentials_cache_key = self._shared.credentials_key or os.urandom(32)
+        self._share_credentials = (
+            self._credentials_cache is not None
+            and self._shared.credentials_key is not None
+        )
+        # Optionally move bcrypt off the request-serving threads onto a bounded pool
+        _pool_mode = os.environ.get("CHROMA_AUTH_BCRYPT_POOL", "").strip().lower()
+        self._verifier_pool = (
+            BcryptVerifierPool(
+                mode=_pool_mode,
+                max_workers=env_int("CHROMA_AUTH_BCRYPT_POOL_SIZE", 0) or None,
+                max_queue=env_int("CHROMA_AUTH_BCRYPT_POOL_MAX_QUEUE", 64),
+                timeout=env_float("CHROMA_AUTH_BCRYPT_POOL_TIMEOUT_SECONDS", 5),
+                overload_status_code=env_int(
+                    "CHROMA_AUTH_BCRYPT_POOL_OVERLOAD_STATUS", 503
+                ),
+            )
+            if _pool_mode
+            else None
+        )
+        # Signed session tokens, issued once the password is verified, let clients
+        # skip bcrypt on the requests that follow. Disabled unless secrets are set.
+        _session_secrets = parse_secrets(
+            os.environ.get("CHROMA_AUTH_SESSION_SECRETS", "")
+        )
+        self._sessions = (
+            SessionTokenSigner(
+                _session_secrets,
+                ttl=env_float("CHROMA_AUTH_SESSION_TTL_SECONDS", 900),
+            )
+            if _session_secrets
+            else None
+        )
         try:
             self.bc = importlib.import_module("bcrypt")
         except ImportError:
@@ -37,36 +182,110 @@ class MultiUserHtpasswdFileServerAuthCredentialsProvider(ServerAuthCredentialsPr
                 "Please install it with `pip install bcrypt`"
             )
         system.settings.require("chroma_server_auth_credentials_file")
-        _file = str(system.settings.chroma_server_auth_credentials_file)
-        self._creds = dict()
-        with open(_file, "r") as f:
-            for line in f:
-                _raw_creds = [v for v in line.strip().split(":")]
-                if len(_raw_creds) != 2:
-                    raise ValueError(
-                        "Invalid Htpasswd credentials found in "
-                        f"[{str(system.settings.chroma_server_auth_credentials_file)}]. "
-                        "Must be <username>:<bcrypt passwd>."
-                    )
-                self._creds[_raw_creds[0]] = SecretStr(_raw_creds[1])
-        _basepath = path.dirname(_file)
-        self._user_group_map = dict()
-        if path.exists(path.join(_basepath, "groupfile")):
-            _groups = dict()
-            with open(path.join(_basepath, "groupfile"), "r") as f:
-                for line in f:
-                    _raw_group = [v for v in line.strip().split(":")]
-                    if len(_raw_group) < 2:
-                        raise ValueError(
-                            "Invalid Htpasswd group file found in "
-                            f"[{path.join(_basepath, 'groupfile')}]. "
-                            "Must be <groupname>:<username1>,<username2>,...,<usernameN>."
-                        )
-                    _groups[_raw_group[0]] = [u.strip() for u in _raw_group[1].split(",")]
-                    for _group, _users in _groups.items():
-                        for _user in _users:
-                            if _user not in self._user_group_map:
-                                self._user_group_map[_user] = _group
+        self._credentials_file = str(system.settings.chroma_server_auth_credentials_file)
+        self._group_file = path.join(path.dirname(self._credentials_file), "groupfile")
+        self._snapshot = self._load_snapshot(generation=1)
+        self._reload_interval = env_float(
+            "CHROMA_AUTH_CREDENTIALS_RELOAD_INTERVAL_SECONDS", 0
+        )
+        self._reload_lock = threading.Lock()
+        self._reload_stop = threading.Event()
+        self._reload_thread: Optional[threading.Thread] = None
+        self._last_reload_seconds = 0.0
+        self._last_reload_error: Optional[str] = None
+
+    @property
+    def _creds(self) -> Dict[str, SecretStr]:
+        return self._snapshot.creds
+
+    @property
+    def _user_teams(self) -> Dict[str, Tuple[str, ...]]:
+        return self._snapshot.user_teams
+
+    def _files_signature(self) -> Tuple[Optional[Tuple[int, int]], ...]:
+        def _stat(file: str) -> Optional[Tuple[int, int]]:
+            try:
+                _st = os.stat(file)
+                return _st.st_mtime_ns, _st.st_size
+            except FileNotFoundError:
+                return None
+
+        return _stat(self._credentials_file), _stat(self._group_file)
+
+    def _load_snapshot(self, generation: int) -> HtpasswdSnapshot:
+        # the signature is taken before parsing so a write racing the parse is
+        # picked up on the next poll rather than lost
+        _signature = self._files_signature()
+        return HtpasswdSnapshot(
+            creds=_load_credentials_file(self._credentials_file),
+            user_teams=_load_group_file(self._group_file)
+            if path.exists(self._group_file)
+            else dict(),
+            generation=generation,
+            signature=_signature,
+        )
+
+    def reload(self) -> bool:
+        """Re-parse the credentials file and groupfile and swap in the result.
+
+        On a malformed file the last good snapshot is kept. Returns whether a new
+        snapshot was installed.
+        """
+        with self._reload_lock:
+            _previous = self._snapshot
+            _start = time.perf_counter()
+            try:
+                _snapshot = self._load_snapshot(generation=_previous.generation + 1)
+            except Exception as e:
+                self._last_reload_error = repr(e)
+                logger.error(
+                    "Failed to reload credentials, keeping snapshot generation "
+                    f"{_previous.generation}: {repr(e)}"
+                )
+                return False
+            self._snapshot = _snapshot
+            self._last_reload_seconds = time.perf_counter() - _start
+            self._last_reload_error = None
+        for _user, _hash in _previous.creds.items():
+            _new_hash = _snapshot.creds.get(_user)
+            if _new_hash is None or (
+                _new_hash.get_secret_value() != _hash.get_secret_value()
+            ):
+                self.invalidate_cached_credentials(_user)
+        logger.info(
+            f"Reloaded credentials snapshot generation {_snapshot.generation} "
+            f"({len(_snapshot.creds)} users) in {self._last_reload_seconds:.4f}s"
+        )
+        return True
+
+    def reload_stats(self) -> Dict[str, Any]:
+        """Generation and timing of the currently active credentials snapshot."""
+        return {
+            "generation": self._snapshot.generation,
+            "users": len(self._snapshot.creds),
+            "last_reload_seconds": self._last_reload_seconds,
+            "last_reload_error": self._last_reload_error,
+        }
+
+    def _watch(self) -> None:
+        while not self._reload_stop.wait(self._reload_interval):
+            _signature = self._files_signature()
+            if _signature == self._snapshot.signature:
+                continue
+            if not self.reload():
+                # do not retry a broken file until it changes again
+                with self._reload_lock:
+                    self._snapshot = self._snapshot._replace(signature=_signature)
+
+    @override
+    def start(self) -> None:
+        super().start()
+        if self._reload_interval > 0 and self._reload_thread is None:
+            self._reload_stop.clear()
+            self._reload_thread = threading.Thread(
+                target=self._watch, name="htpasswd-reloader", daemon=True
+            )
+            self._reload_thread.start()
 
     @trace_method(  # type: ignore
         "MultiUserHtpasswdFileServerAuthCredentialsProvider.validate_credentials",
@@ -89,18 +308,41 @@ class MultiUserHtpasswdFileServerAuthCredentialsProvider(ServerAuthCredentialsPr
                 }
             )
             return False  # early exit on wrong format
-        _user_pwd_hash = (
-            self._creds[_creds["username"].get_secret_value()]
-            if _creds["username"].get_secret_value() in self._creds
-            else None
-        )
-        validation_response = _user_pwd_hash is not None and self.bc.checkpw(
-            _creds["password"].get_secret_value().encode("utf-8"),
-            _user_pwd_hash.get_secret_value().encode("utf-8"),
+        _user_pwd_hash = self._creds.get(_creds["username"].get_secret_value())
+        _cache_key = None
+        _cache_hit = False
+        if _user_pwd_hash is not None and self._credentials_cache is not None:
+            _cache_key = self._credentials_cache_key_for(
+                _creds["username"].get_secret_value(),
+                _creds["password"].get_secret_value(),
+                _user_pwd_hash.get_secret_value(),
+            )
+            _cache_hit = self._credentials_cache.get(_cache_key) is not None
+            if not _cache_hit and self._share_credentials:
+                _cache_hit = self._shared_verification(
+                    _creds["username"].get_secret_value(), _cache_key
+                )
+        validation_response = _user_pwd_hash is not None and (
+            _cache_hit
+            or self._checkpw(
+                _creds["password"].get_secret_value().encode("utf-8"),
+                _user_pwd_hash.get_secret_value().encode("utf-8"),
+            )
         )
+        if validation_response and _cache_key is not None and not _cache_hit:
+            self._credentials_cache.set(  # type: ignore
+                _cache_key, _creds["username"].get_secret_value()
+            )
+            if self._share_credentials:
+                self._shared.set(
+                    self._shared.digest("credentials", (_cache_key.hex(),)),
+                    1,
+                    self._credentials_cache.ttl,  # type: ignore
+                )
         add_attributes_to_current_span(
             {
                 "auth_succeeded": validation_response,
+                "auth_cache_hit": _cache_hit,
                 "auth_error": f"Failed to validate credentials for user {_creds['username'].get_secret_value()}"
                 if not validation_response
                 else "",
@@ -108,16 +350,181 @@ class MultiUserHtpasswdFileServerAuthCredentialsProvider(ServerAuthCredentialsPr
         )
         return validation_response
 
+    def _checkpw(self, password: bytes, hashed: bytes) -> bool:
+        if self._verifier_pool is None:
+            with BCRYPT_VERIFY_SECONDS.time():
+                return cast(bool, self.bc.checkpw(password, hashed))
+        _ok, _queue_wait, _hash_time = self._verifier_pool.verify(password, hashed)
+        BCRYPT_VERIFY_SECONDS.observe(_hash_time)
+        BCRYPT_QUEUE_WAIT_SECONDS.observe(_queue_wait)
+        add_attributes_to_current_span(
+            {
+                "auth_bcrypt_queue_wait_seconds": _queue_wait,
+                "auth_bcrypt_hash_seconds": _hash_time,
+            }
+        )
+        return _ok
+
+    def verifier_pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Queue-wait/hash timings and admission counters of the bcrypt pool."""
+        return self._verifier_pool.stats() if self._verifier_pool else None
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        self._reload_stop.set()
+        if self._reload_thread is not None:
+            self._reload_thread.join()
+            self._reload_thread = None
+        if self._verifier_pool is not None:
+            self._verifier_pool.shutdown()
+
+    def _credentials_cache_key_for(
+        self, username: str, password: str, password_hash: str
+    ) -> bytes:
+        # The stored hash is part of the key, so a changed htpasswd entry for the
+        # user can never match a verification cached against the old entry. So is
+        # the user's shared counter, which other workers bump to invalidate it.
+        _counters = self._shared.counters(f"htpasswd:{username}")
+        return hmac.new(
+            self._credentials_cache_key,
+            "\0".join(
+                (username, password, password_hash, *map(str, _counters))
+            ).encode("utf-8"),
+            hashlib.sha256,
+        ).digest()
+
+    def _shared_verification(self, username: str, cache_key: bytes) -> bool:
+        """Whether another worker verified these credentials; if so, they are also
+        cached locally."""
+        _entry = self._shared.get(
+            self._shared.digest("credentials", (cache_key.hex(),))
+        )
+        if _entry is None:
+            return False
+        self._credentials_cache.set(  # type: ignore
+            cache_key, username, ttl=_entry[1] - time.time()
+        )
+        return True
+
+    def invalidate_cached_credentials(self, username: str) -> int:
+        """Drop every cached verification for the given user."""
+        if self._credentials_cache is None:
+            return 0
+        if self._share_credentials:
+            self._shared.invalidate([f"htpasswd:{username}"])
+        return self._credentials_cache.invalidate(lambda _, user: user == username)
+
+    def credentials_cache_stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size of the verified-credentials cache."""
+        if self._credentials_cache is None:
+            return {"hits": 0, "misses": 0, "size": 0}
+        return self._credentials_cache.stats()
+
     @override
     def get_user_identity(
         self, credentials: AbstractCredentials[T]
     ) -> Optional[SimpleUserIdentity]:
         _creds = cast(Dict[str, SecretStr], credentials.get_credentials())
-        if _creds["username"].get_secret_value() in self._user_group_map.keys():
+        _username = _creds["username"].get_secret_value()
+        return self._identity(_username, self._user_teams.get(_username))
+
+    @staticmethod
+    def _identity(
+        username: str, teams: Optional[Tuple[str, ...]]
+    ) -> SimpleUserIdentity:
+        if teams:
             return SimpleUserIdentity(
-                _creds["username"].get_secret_value(),
-                attributes={
-                    "team": self._user_group_map[_creds["username"].get_secret_value()]
-                },
+                username, attributes={"team": teams[0], "teams": teams}
+            )
+        return SimpleUserIdentity(
+            username, attributes={"team": "public", "teams": ("public",)}
+        )
+
+    @property
+    def sessions_enabled(self) -> bool:
+        return self._sessions is not None
+
+    def issue_session_token(self, username: str) -> Optional[Tuple[str, int]]:
+        """A session token for a user whose password was just verified, and the
+        time it expires at; None if sessions are disabled or the user is gone."""
+        _hash = self._creds.get(username)
+        if self._sessions is None or _hash is None:
+            return None
+        SESSION_TOKENS.labels("issued").inc()
+        return self._sessions.issue(username, _hash.get_secret_value())
+
+    def validate_session_token(self, token: str) -> Optional[SimpleUserIdentity]:
+        """The identity a session token was issued for, if it is valid, unexpired
+        and the user's htpasswd entry has not changed since. Its teams are those of
+        the current groupfile, not those at issue time."""
+        if self._sessions is None:
+            return None
+        _claims, _result = self._sessions.validate(token)
+        if _claims is not None:
+            _hash = self._creds.get(_claims.username)
+            if _hash is None or not hmac.compare_digest(
+                self._sessions.fingerprint(
+                    self._sessions.key_id(token), _hash.get_secret_value()
+                ),
+                _claims.credentials,
+            ):
+                _claims, _result = None, "revoked"
+        SESSION_TOKENS.labels(_result).inc()
+        add_attributes_to_current_span({"auth_session_token": _result})
+        if _claims is None:
+            return None
+        return self._identity(_claims.username, self._user_teams.get(_claims.username))
+
+
+@register_provider("multi_user_basic")
+class MultiUserBasicAuthServerProvider(BasicAuthServerProvider):
+    """Basic auth server provider that lets auth overload errors surface.
+
+    Chroma's `BasicAuthServerProvider` turns every error into a 401. When password
+    verification is refused because the bcrypt pool is saturated the client should
+    instead receive a retryable 429/503, so `AuthenticationOverloadedError` is
+    propagated to the server, which renders it.
+
+    With `MultiUserHtpasswdFileServerAuthCredentialsProvider` and session tokens
+    enabled, an `Authorization: Bearer <session token>` header is also accepted,
+    without verifying a password.
+    """
+
+    @trace_method(
+        "MultiUserBasicAuthServerProvider.authenticate", OpenTelemetryGranularity.ALL
+    )
+    @override
+    def authenticate(
+        self, request: ServerAuthenticationRequest[Any]
+    ) -> SimpleServerAuthenticationResponse:
+        try:
+            _auth_header = request.get_auth_info(AuthInfoType.HEADER, "Authorization")
+            if _auth_header.startswith("Bearer ") and isinstance(
+                self._credentials_provider,
+                MultiUserHtpasswdFileServerAuthCredentialsProvider,
+            ):
+                # a session token: no password to verify
+                _identity = self._credentials_provider.validate_session_token(
+                    _auth_header[len("Bearer "):].strip()
+                )
+                AUTHENTICATIONS.labels(
+                    "success" if _identity is not None else "failure"
+                ).inc()
+                return SimpleServerAuthenticationResponse(
+                    _identity is not None, _identity
+                )
+            _credentials = BasicAuthCredentials.from_header(_auth_header)
+            _validation = self._credentials_provider.validate_credentials(_credentials)
+            AUTHENTICATIONS.labels("success" if _validation else "failure").inc()
+            return SimpleServerAuthenticationResponse(
+                _validation,
+                self._credentials_provider.get_user_identity(_credentials),
             )
-        return SimpleUserIdentity(_creds["username"].get_secret_value(),attributes={"team":"public"})
+        except AuthenticationOverloadedError:
+            AUTHENTICATIONS.labels("overloaded").inc()
+            raise
+        except Exception as e:
+            logger.error(f"MultiUserBasicAuthServerProvider.authenticate failed: {repr(e)}")
+            AUTHENTICATIONS.labels("failure").inc()
+            return SimpleServerAuthenticationResponse(False, None)
@@ -0,0 +1,116 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# the version of the token format
+TOKEN_VERSION = "v1"
+
+
+class SessionClaims(NamedTuple):
+    username: str
+    expires_at: int
+    credentials: str  # fingerprint of the user's htpasswd entry at issue time
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SessionTokenSigner:
+    """Issues and validates HMAC-SHA256 signed session tokens.
+
+    A token is `v1.<key id>.<claims>.<signature>`: the claims (username, expiry and
+    a fingerprint of the user's htpasswd entry) are base64url JSON,
+    readable by the client but not forgeable without a key. Tokens are signed with
+    the first of `secrets` and validated with any of them, so a key is rotated by
+    putting the new secret first and dropping the old one once the tokens it signed
+    have expired. Validation is an HMAC and a constant-time comparison.
+    """
+
+    def __init__(self, secrets: Sequence[str], ttl: float) -> None:
+        if not secrets:
+            raise ValueError("At least one session token secret is required")
+        self._keys: Dict[str, bytes] = {}
+        self._signing_key_id = ""
+        for _secret in secrets:
+            _key = hmac.new(
+                _secret.encode("utf-8"), b"session-token", hashlib.sha256
+            ).digest()
+            _key_id = hashlib.sha256(_key).hexdigest()[:8]
+            self._keys.setdefault(_key_id, _key)
+            self._signing_key_id = self._signing_key_id or _key_id
+        self._ttl = ttl
+
+    @property
+    def ttl(self) -> float:
+        return self._ttl
+
+    def fingerprint(self, key_id: str, credentials: str) -> str:
+        """Binds a token to a htpasswd entry, so that changing or removing it
+        revokes the tokens issued for it."""
+        return _b64encode(
+            hmac.new(
+                self._keys[key_id], credentials.encode("utf-8"), hashlib.sha256
+            ).digest()[:12]
+        )
+
+    def issue(self, username: str, credentials: str) -> Tuple[str, int]:
+        """A token for `username`, and the time it expires at."""
+        _expires_at = int(time.time() + self._ttl)
+        _claims = _b64encode(
+            json.dumps(
+                {
+                    "sub": username,
+                    "exp": _expires_at,
+                    "cred": self.fingerprint(self._signing_key_id, credentials),
+                },
+                separators=(",", ":"),
+            ).encode("utf-8")
+        )
+        _signed = f"{TOKEN_VERSION}.{self._signing_key_id}.{_claims}"
+        return f"{_signed}.{self._sign(self._signing_key_id, _signed)}", _expires_at
+
+    def validate(self, token: str) -> Tuple[Optional[SessionClaims], str]:
+        """The claims of a token and `valid`, or None and why it is not valid
+        (`invalid` or `expired`). The fingerprint is left to the caller."""
+        _parts = token.split(".")
+        if len(_parts) != 4 or _parts[0] != TOKEN_VERSION or _parts[1] not in self._keys:
+            return None, "invalid"
+        _signed = token.rsplit(".", 1)[0]
+        if not hmac.compare_digest(
+            self._sign(_parts[1], _signed).encode("ascii"), _parts[3].encode("utf-8")
+        ):
+            return None, "invalid"
+        try:
+            _payload: Dict[str, Any] = json.loads(_b64decode(_parts[2]))
+            _claims = SessionClaims(
+                username=str(_payload["sub"]),
+                expires_at=int(_payload["exp"]),
+                credentials=str(_payload["cred"]),
+            )
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            return None, "invalid"
+        if _claims.expires_at <= time.time():
+            return None, "expired"
+        return _claims, "valid"
+
+    def key_id(self, token: str) -> str:
+        return token.split(".")[1]
+
+    def _sign(self, key_id: str, signed: str) -> str:
+        return _b64encode(
+            hmac.new(self._keys[key_id], signed.encode("utf-8"), hashlib.sha256).digest()
+        )
+
+
+def parse_secrets(value: str) -> List[str]:
+    """Comma-separated secrets, the signing one first."""
+    return [s.strip() for s in value.split(",") if s.strip()]
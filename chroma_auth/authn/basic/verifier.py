@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+)
+from typing import Any, Dict, Optional, Tuple
+
+from chromadb.errors import ChromaError
+from overrides import overrides
+
+logger = logging.getLogger(__name__)
+
+
+class AuthenticationOverloadedError(ChromaError):
+    """Raised when password verification is refused because the pool is saturated."""
+
+    def __init__(self, message: str, status_code: int = 503) -> None:
+        super().__init__(message)
+        self._status_code = status_code
+
+    @overrides
+    def code(self) -> int:
+        return self._status_code
+
+    @classmethod
+    @overrides
+    def name(cls) -> str:
+        return "AuthenticationOverloaded"
+
+
+def _timed_checkpw(
+    password: bytes, hashed: bytes, enqueued_at: float
+) -> Tuple[bool, float, float]:
+    # Runs inside the pool worker (thread or process). time.monotonic() is
+    # system-wide on Linux, so the queue wait is meaningful across processes too.
+    import bcrypt
+
+    _started_at = time.monotonic()
+    _ok = bcrypt.checkpw(password, hashed)
+    return _ok, _started_at - enqueued_at, time.monotonic() - _started_at
+
+
+class BcryptVerifierPool:
+    """A dedicated, bounded pool for bcrypt password verification.
+
+    At most `max_workers + max_queue` verifications are admitted at once; anything
+    beyond that fails fast with `AuthenticationOverloadedError` instead of tying up
+    request-serving threads. bcrypt releases the GIL, so the thread mode scales with
+    cores; the process mode isolates hashing from the server process entirely.
+    """
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        max_workers: Optional[int] = None,
+        max_queue: int = 64,
+        timeout: float = 5.0,
+        overload_status_code: int = 503,
+    ) -> None:
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._timeout = timeout
+        self._overload_status_code = overload_status_code
+        self._executor: Executor
+        if mode == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_workers, thread_name_prefix="bcrypt-verifier"
+            )
+        elif mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self._max_workers)
+        else:
+            raise ValueError(
+                f"Unknown bcrypt pool mode [{mode}]. Must be 'thread' or 'process'."
+            )
+        self._mode = mode
+        self._slots = threading.BoundedSemaphore(self._max_workers + max_queue)
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._verified = 0
+        self._rejected = 0
+        self._queue_wait_total = 0.0
+        self._hash_time_total = 0.0
+        self._last_queue_wait = 0.0
+        self._last_hash_time = 0.0
+
+    def verify(self, password: bytes, hashed: bytes) -> Tuple[bool, float, float]:
+        """Verify `password` against `hashed` on the pool.
+
+        Returns a tuple of (matches, queue wait seconds, hash seconds).
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise AuthenticationOverloadedError(
+                "Too many concurrent credential verifications, retry later",
+                self._overload_status_code,
+            )
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            _future: Future[Tuple[bool, float, float]] = self._executor.submit(
+                _timed_checkpw, password, hashed, time.monotonic()
+            )
+        except Exception:
+            self._release(None)
+            raise
+        _future.add_done_callback(self._release)
+        try:
+            _ok, _queue_wait, _hash_time = _future.result(timeout=self._timeout)
+        except FutureTimeoutError:
+            with self._stats_lock:
+                self._rejected += 1
+            raise AuthenticationOverloadedError(
+                f"Credential verification did not complete within {self._timeout}s",
+                self._overload_status_code,
+            )
+        with self._stats_lock:
+            self._verified += 1
+            self._queue_wait_total += _queue_wait
+            self._hash_time_total += _hash_time
+            self._last_queue_wait = _queue_wait
+            self._last_hash_time = _hash_time
+        return _ok, _queue_wait, _hash_time
+
+    def _release(self, _: Optional["Future[Tuple[bool, float, float]]"]) -> None:
+        with self._stats_lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "mode": self._mode,
+                "max_workers": self._max_workers,
+                "in_flight": self._in_flight,
+                "verified": self._verified,
+                "rejected": self._rejected,
+                "queue_wait_seconds_total": self._queue_wait_total,
+                "hash_seconds_total": self._hash_time_total,
+                "last_queue_wait_seconds": self._last_queue_wait,
+                "last_hash_seconds": self._last_hash_time,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,25 @@
+import asyncio
+import itertools
 import json
 import logging
 import os
-from typing import cast
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
 
 
 from chromadb.auth import (
@@ -9,6 +27,7 @@ from chromadb.auth import (
     ServerAuthorizationConfigurationProvider,
     ServerAuthorizationProvider, AuthzResourceActions, AuthzResource, AuthzResourceTypes, AuthzAction,
 )
+from chromadb.auth.fastapi import request_var
 from chromadb.auth.registry import register_provider, resolve_provider
 from chromadb.config import System
 from chromadb.telemetry.opentelemetry import (
@@ -16,13 +35,84 @@ from chromadb.telemetry.opentelemetry import (
     trace_method,
 )
 from openfga_sdk import ClientConfiguration
-from openfga_sdk.sync import OpenFgaClient
 from openfga_sdk.client import ClientCheckRequest
+from openfga_sdk.client.models import ClientTuple
 from overrides import override
 from chromadb.api import ServerAPI
 
+from chroma_auth.authz.openfga.change_feed import OpenFGAChangeFeed
+from chroma_auth.authz.openfga.check_guard import (
+    CircuitOpenError,
+    DeadlineExceededError,
+    OpenFGACheckGuard,
+)
+from chroma_auth.authz.openfga.client import (
+    SharedAsyncOpenFGAClient,
+    SharedOpenFGAClient,
+)
+from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+from chroma_auth.authz.openfga.metrics import (
+    AUTHZ_DECISIONS,
+    FGA_CHECK_FAILURES,
+    FGA_CHECK_SECONDS,
+)
+from chroma_auth.authz.openfga.outbox import OpenFGATupleOutbox
+from chroma_auth.authz.openfga.team_memberships import ContextualTeamMemberships
+from chroma_auth.authz.openfga.tuple_store import LocalTupleStore
+from chroma_auth.utils import env_bool, env_int
+from chroma_auth.utils.collection_cache import CollectionMetadataCache
+from chroma_auth.utils.single_flight import AsyncSingleFlight, SingleFlight
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+Decisions = Dict[str, Optional[bool]]  # relation -> allowed, None if the check failed
+FlightKey = Tuple[str, Tuple[str, ...], str, int]  # (user, relations, object, generation)
+
+# OpenFGA's limit on contextual tuples per check
+MAX_CONTEXTUAL_TUPLES = 100
+
+# the relations defined on `collection` in the authorization model, by the object
+# they are checked on: getting and deleting a collection on the object keyed by its
+# name, the other operations on the object keyed by its id. Clients usually run
+# several record operations against a collection in a row, so the relations of an
+# object are resolved together on the first check for a (user, object) pair
+COLLECTION_NAME_RELATIONS = (
+    "can_delete_collection",
+    "can_get_collection",
+)
+COLLECTION_ID_RELATIONS = (
+    "can_update_collection",
+    "can_add_records",
+    "can_delete_records",
+    "can_update_records",
+    "can_get_records",
+    "can_upsert_records",
+    "can_count_records",
+    "can_query_records",
+)
+COLLECTION_RELATIONS = COLLECTION_NAME_RELATIONS + COLLECTION_ID_RELATIONS
+
+
+# (action, resource type, has a tenant, has a database, is a wildcard resource)
+PlanKey = Tuple[str, str, bool, bool, bool]
+
+
+class AuthzPlan(NamedTuple):
+    """The OpenFGA check for one kind of (action, resource): a fixed relation and an
+    object template, with a `%s` per parameter bound from the resource."""
+
+    relation: str
+    template: str
+    params: Tuple[str, ...]  # resource attribute names, or "id" for the resource id
+    existing: Optional["AuthzPlan"] = None  # when the collection to create exists
+
+    def object(self, resource: AuthzResource, attributes: Dict[str, Any]) -> str:
+        return self.template % tuple(
+            resource.id if p == "id" else attributes[p] for p in self.params
+        )
+
 
 @register_provider("openfga_config_provider")
 class OpenFGAAuthorizationConfigurationProvider(
@@ -81,6 +171,26 @@ class OpenFGAAuthorizationProvider(ServerAuthorizationProvider):
                 ServerAuthorizationConfigurationProvider[ClientConfiguration],
                 self.require(_cls),
             )
+        self._fga_client = self.require(SharedOpenFGAClient)
+        self._decision_cache = self.require(OpenFGADecisionCache)
+        self._collections = self.require(CollectionMetadataCache)
+        self._outbox = self.require(OpenFGATupleOutbox)
+        # deadlines, circuit breaking and hedging of checks, and the degraded mode
+        self._guard = self.require(OpenFGACheckGuard)
+        # keeps the decision cache (and the local replica) in line with OpenFGA
+        self._change_feed = self.require(OpenFGAChangeFeed)
+        # prefetched decisions are only useful if they can be kept around
+        self._prefetch_relations = self._decision_cache.enabled and env_bool(
+            "FGA_PREFETCH_COLLECTION_RELATIONS", True
+        )
+        self._prefetch_concurrency = env_int("FGA_PREFETCH_CONCURRENCY", 4)
+        self._prefetch_executor: Optional[ThreadPoolExecutor] = None
+        self._prefetch_lock = threading.Lock()
+        self._prefetching: Set[Tuple[str, str]] = set()
+        # concurrent identical checks share one in-flight request
+        self._flights: SingleFlight[FlightKey, Decisions] = SingleFlight()
+        # the caller's teams, sent along with its checks
+        self._memberships = self.require(ContextualTeamMemberships)
         self._authz_to_model_action_map = {
             AuthzResourceActions.CREATE_DATABASE.value: "can_create_database",
             AuthzResourceActions.GET_DATABASE.value: "can_get_database",
@@ -109,54 +219,516 @@ class OpenFGAAuthorizationProvider(ServerAuthorizationProvider):
             AuthzResourceTypes.COLLECTION.value: "collection",
         }
 
+        # every (action, resource) shape the server can ask about, compiled once
+        self._plans = self._compile_plans()
+
         logger.info(
             "Authorization Provider 'OpenFGAAuthorizationProvider' initialized"
         )
 
+    def _compile_plans(self) -> Dict[PlanKey, AuthzPlan]:
+        _plans: Dict[PlanKey, AuthzPlan] = {}
+        for action, relation in self._authz_to_model_action_map.items():
+            for resource_type, object_type in self._authz_to_model_object_map.items():
+                for has_tenant, has_database, wildcard in itertools.product(
+                    (False, True), repeat=3
+                ):
+                    _params = ("tenant",) * has_tenant + ("database",) * has_database
+                    _attrs = "%s" * has_tenant + "-%s" * has_database
+                    if action in (
+                        AuthzResourceActions.GET_TENANT.value,
+                        AuthzResourceActions.CREATE_TENANT.value,
+                    ):
+                        _plan = AuthzPlan(relation, "server:localhost", ())
+                    elif action in (
+                        AuthzResourceActions.GET_DATABASE.value,
+                        AuthzResourceActions.CREATE_DATABASE.value,
+                    ):
+                        _plan = AuthzPlan(relation, f"tenant:{_attrs}", _params)
+                    elif action == AuthzResourceActions.CREATE_COLLECTION.value:
+                        # creating a collection that exists is getting it
+                        _plan = AuthzPlan(
+                            relation,
+                            f"{object_type}:{_attrs}",
+                            _params,
+                            existing=AuthzPlan(
+                                self._authz_to_model_action_map[
+                                    AuthzResourceActions.GET_COLLECTION.value
+                                ],
+                                f"collection:{_attrs}-%s",
+                                _params + ("id",),
+                            ),
+                        )
+                    elif wildcard:
+                        _plan = AuthzPlan(relation, f"{object_type}:{_attrs}", _params)
+                    else:
+                        _plan = AuthzPlan(
+                            relation, f"{object_type}:{_attrs}-%s", _params + ("id",)
+                        )
+                    _plans[(action, resource_type, has_tenant, has_database, wildcard)] = _plan
+        return _plans
 
-    def resolve_resource_action(self, resource: AuthzResource, action: AuthzAction) -> tuple:
-        attrs = ""
-        tenant = None,
-        database = None
-        if "tenant" in resource.attributes:
-            attrs += f"{resource.attributes['tenant']}"
-            tenant = resource.attributes['tenant']
-        if "database" in resource.attributes:
-            attrs += f"-{resource.attributes['database']}"
-            database = resource.attributes['database']
-        if action.id == AuthzResourceActions.GET_TENANT.value or action.id == AuthzResourceActions.CREATE_TENANT.value:
-            return "server:localhost",self._authz_to_model_action_map[action.id]
-        if action.id == AuthzResourceActions.GET_DATABASE.value or action.id == AuthzResourceActions.CREATE_DATABASE.value:
-            return f"tenant:{attrs}",self._authz_to_model_action_map[action.id]
-        if action.id == AuthzResourceActions.CREATE_COLLECTION.value:
+    def resolve_resource_action(
+        self, resource: AuthzResource, action: AuthzAction
+    ) -> Tuple[str, str]:
+        """The (object, relation) to check for `action` on `resource`."""
+        attributes = resource.attributes or {}
+        plan = self._plans[
+            (
+                action.id,
+                resource.type,
+                "tenant" in attributes,
+                "database" in attributes,
+                resource.id == "*",
+            )
+        ]
+        if plan.existing is not None:
             try:
-                cole_exists =  self._api.get_collection(
-                    resource.id, tenant=tenant, database=database
+                existing = self._collections.by_name(
+                    resource.id,
+                    tenant=attributes.get("tenant"),
+                    database=attributes.get("database"),
+                )
+            except Exception:
+                existing = None
+            if existing is not None:
+                return plan.existing.object(resource, attributes), plan.existing.relation
+        return plan.object(resource, attributes), plan.relation
+
+    def relations_to_check(self, relation: str, object: str) -> List[str]:
+        """`relation`, then the relations to prefetch when it is checked on
+        `object`."""
+        if not self._prefetch_relations or not object.startswith("collection:"):
+            return [relation]
+        # only the relations checked on the same (name- or id-keyed) object
+        for _relations in (COLLECTION_NAME_RELATIONS, COLLECTION_ID_RELATIONS):
+            if relation in _relations:
+                return [relation] + [r for r in _relations if r != relation]
+        return [relation]
+
+    @staticmethod
+    def flight_key(
+        user: str, relations: List[str], object: str, generation: int
+    ) -> FlightKey:
+        # calls started before an invalidation are not joined by later callers
+        return user, tuple(sorted(relations)), object, generation
+
+    def membership_tuples(self, context: AuthorizationContext) -> List[ClientTuple]:
+        """The caller's team memberships (see `ContextualTeamMemberships`)."""
+        return self._memberships.tuples(context.user.id, context.user.attributes)
+
+    def pending_tuples(
+        self, object: str, memberships: Sequence[ClientTuple] = ()
+    ) -> Tuple[Optional[List[ClientTuple]], List[str]]:
+        """Tuple writes on `object` still queued in the outbox, to be sent along as
+        contextual tuples after the caller's `memberships`, and the relations with a
+        queued revocation."""
+        _writes, _deletes = self._outbox.pending(object)
+        _contextual = list(memberships) + _writes
+        if len(_contextual) > MAX_CONTEXTUAL_TUPLES:
+            logger.warning(
+                f"{len(_contextual)} contextual tuples on {object}, "
+                f"only {MAX_CONTEXTUAL_TUPLES} are considered"
+            )
+        return (
+            _contextual[:MAX_CONTEXTUAL_TUPLES] or None,
+            [t.relation for t in _deletes],
+        )
+
+    def fetch_decisions(
+        self,
+        user: str,
+        relations: List[str],
+        object: str,
+        generation: int,
+        memberships: Sequence[ClientTuple] = (),
+    ) -> Decisions:
+        _contextual, _revoked = self.pending_tuples(object, memberships)
+        resp = self.guarded_check(
+            relations[0],
+            object,
+            lambda: self._fga_client.client.check(body=ClientCheckRequest(
+                user=user,
+                relation=relations[0],
+                object=object,
+                contextual_tuples=_contextual,
+            ))
+        )
+        # openfga_sdk.models.check_response.CheckResponse
+        decisions = {relations[0]: bool(resp.allowed)}
+        return self.apply_revocations(user, object, decisions, _revoked, generation)
+
+    def prefetch(
+        self,
+        user: str,
+        relations: List[str],
+        object: str,
+        generation: int,
+        memberships: Sequence[ClientTuple] = (),
+    ) -> None:
+        """Resolve and cache `relations` on `object` in the background, so that the
+        caller's next operations on it are cache hits. Dropped while
+        `FGA_PREFETCH_CONCURRENCY` prefetches are already running for other
+        (user, object) pairs, or one is for this pair."""
+        _key = (user, object)
+        with self._prefetch_lock:
+            if (
+                _key in self._prefetching
+                or len(self._prefetching) >= self._prefetch_concurrency
+            ):
+                return
+            self._prefetching.add(_key)
+            if self._prefetch_executor is None:
+                self._prefetch_executor = ThreadPoolExecutor(
+                    max_workers=self._prefetch_concurrency,
+                    thread_name_prefix="openfga-prefetch",
+                )
+            _executor = self._prefetch_executor
+        try:
+            _executor.submit(self._prefetch, _key, relations, generation, memberships)
+        except RuntimeError:
+            # shutting down
+            with self._prefetch_lock:
+                self._prefetching.discard(_key)
+
+    def _prefetch(
+        self,
+        key: Tuple[str, str],
+        relations: List[str],
+        generation: int,
+        memberships: Sequence[ClientTuple],
+    ) -> None:
+        user, object = key
+        try:
+            _contextual, _revoked = self.pending_tuples(object, memberships)
+            for relation in relations:
+                # not sent through the guard: an opportunistic check must not
+                # open the breaker for the checks requests wait on
+                if not self._guard.closed:
+                    return
+                if self._decision_cache.get(user, relation, object) is not None:
+                    continue
+                resp = self._fga_client.client.check(
+                    body=ClientCheckRequest(
+                        user=user,
+                        relation=relation,
+                        object=object,
+                        contextual_tuples=_contextual,
+                    )
+                )
+                self.apply_revocations(
+                    user, object, {relation: bool(resp.allowed)}, _revoked, generation
                 )
-                return f"collection:{attrs}-{cole_exists.name}",self._authz_to_model_action_map[AuthzResourceActions.GET_COLLECTION.value]
-            except Exception as e:
-                return f"{self._authz_to_model_object_map[resource.type]}:{attrs}",self._authz_to_model_action_map[action.id]
-        if resource.id == "*":
-            return f"{self._authz_to_model_object_map[resource.type]}:{attrs}",self._authz_to_model_action_map[action.id]
-        else:
-            return f"{self._authz_to_model_object_map[resource.type]}:{attrs}-{resource.id}",self._authz_to_model_action_map[action.id]
+        except Exception as e:
+            FGA_CHECK_FAILURES.labels("prefetch").inc()
+            logger.debug(f"Prefetching relations on {object} failed: {str(e)}")
+        finally:
+            with self._prefetch_lock:
+                self._prefetching.discard(key)
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        with self._prefetch_lock:
+            if self._prefetch_executor is not None:
+                self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+                self._prefetch_executor = None
+
+    def apply_revocations(
+        self,
+        user: str,
+        object: str,
+        decisions: Decisions,
+        revoked: List[str],
+        generation: int,
+    ) -> Decisions:
+        # a queued revocation can't be expressed as a contextual tuple; deny the
+        # relation (uncached) until the outbox has applied it
+        self.store_decisions(
+            user,
+            object,
+            {r: a for r, a in decisions.items() if r not in revoked},
+            generation,
+        )
+        for relation in revoked:
+            if relation in decisions:
+                decisions[relation] = False
+        return decisions
+
+    def store_decisions(
+        self, user: str, object: str, decisions: Decisions, generation: int
+    ) -> None:
+        for relation, allowed in decisions.items():
+            if allowed is not None:
+                self._decision_cache.set(user, relation, object, allowed, generation)
+
+    def guarded_check(self, relation: str, object: str, fn: Callable[[], T]) -> T:
+        """Run an OpenFGA check through the guard, recording its round trip."""
+        _started_at = time.perf_counter()
+        try:
+            _result = self._guard.call(fn)
+        except CircuitOpenError:
+            # not sent: no round trip to record
+            FGA_CHECK_FAILURES.labels("circuit_open").inc()
+            raise
+        except BaseException as e:
+            _count_failure(e)
+            _observe_check(relation, object, _started_at)
+            raise
+        _observe_check(relation, object, _started_at)
+        return _result
+
+    @staticmethod
+    def count_decision(context: AuthorizationContext, decision: str) -> None:
+        # actions and resource types are str enums; label them by value
+        AUTHZ_DECISIONS.labels(
+            getattr(context.action.id, "value", context.action.id),
+            getattr(context.resource.type, "value", context.resource.type),
+            decision,
+        ).inc()
+
+    def coalescing_stats(self) -> Dict[str, int]:
+        return self._flights.stats()
+
+    def guard_stats(self) -> Dict[str, Any]:
+        return self._guard.stats()
+
+    def decide(
+        self,
+        context: AuthorizationContext,
+        user: str,
+        relation: str,
+        object: str,
+        decisions: Optional[Decisions],
+    ) -> bool:
+        """The decision on `relation`, falling back to the degraded mode if OpenFGA
+        could not answer it."""
+        allowed = decisions.get(relation) if decisions is not None else None
+        if allowed is None:
+            self.count_decision(context, "error")
+            return self._guard.degraded(user, relation, object)
+        self.count_decision(context, "allow" if allowed else "deny")
+        return allowed
+
     @trace_method(
         "SimpleRBACAuthorizationProvider.authorize",
         OpenTelemetryGranularity.ALL,
     )
     @override
     def authorize(self, context: AuthorizationContext) -> bool:
-        with OpenFgaClient(self._authz_config_provider.get_configuration()) as fga_client:
-            try:
-                obj,act = self.resolve_resource_action(resource=context.resource,action=context.action)
-                resp = fga_client.check(body=ClientCheckRequest(
-                    user=f"user:{context.user.id}",
-                    relation=act,
-                    object=obj,
-                ))
-                # openfga_sdk.models.check_response.CheckResponse
-                return resp.allowed
-            except Exception as e:
-                logger.error(f"Error while authorizing: {str(e)}")
-                return False
+        try:
+            obj,act = self.resolve_resource_action(resource=context.resource,action=context.action)
+            user = f"user:{context.user.id}"
+            cached = self._decision_cache.get(user, act, obj)
+            if cached is not None:
+                self.count_decision(context, "allow" if cached else "deny")
+                return cached
+        except Exception as e:
+            logger.error(f"Error while authorizing: {str(e)}")
+            self.count_decision(context, "error")
+            return False
+        decisions: Optional[Decisions] = None
+        try:
+            generation = self._decision_cache.generation
+            relations = self.relations_to_check(act, obj)
+            memberships = self.membership_tuples(context)
+            decisions = self._flights.do(
+                self.flight_key(user, relations[:1], obj, generation),
+                lambda: self.fetch_decisions(
+                    user, relations[:1], obj, generation, memberships
+                ),
+            )
+            if len(relations) > 1:
+                self.prefetch(user, relations[1:], obj, generation, memberships)
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            logger.error(f"Error while authorizing: {str(e)}")
+        return self.decide(context, user, act, obj, decisions)
+
+
+@register_provider("openfga_async_authz_provider")
+class OpenFGAAsyncAuthorizationProvider(OpenFGAAuthorizationProvider):
+    """OpenFGA authorization with checks issued from the event loop.
+
+    `authorize_async` uses the asyncio SDK client, so a check waiting on OpenFGA does
+    not hold a threadpool worker. The instrumented server evaluates each route's
+    authorization with it before dispatching the handler and stores the decisions on
+    the request; the synchronous `authorize` (still called by `authz_context` from
+    the handler thread) then only looks them up. Requests whose authorization could
+    not be evaluated ahead of time fall back to the synchronous check.
+    """
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._async_fga_client = self.require(SharedAsyncOpenFGAClient)
+        self._async_flights: AsyncSingleFlight[FlightKey, Decisions] = (
+            AsyncSingleFlight()
+        )
+
+    @staticmethod
+    def decision_key(context: AuthorizationContext) -> Tuple[Any, ...]:
+        return (
+            context.user.id,
+            context.action.id,
+            context.resource.type,
+            context.resource.id,
+            tuple(
+                sorted((k, str(v)) for k, v in (context.resource.attributes or {}).items())
+            ),
+        )
+
+    async def fetch_decisions_async(
+        self,
+        user: str,
+        relations: List[str],
+        object: str,
+        generation: int,
+        memberships: Sequence[ClientTuple] = (),
+    ) -> Decisions:
+        # the outbox is a SQLite file, not read on the event loop
+        _contextual, _revoked = (
+            await asyncio.to_thread(self.pending_tuples, object, memberships)
+            if self._outbox.enabled
+            else self.pending_tuples(object, memberships)
+        )
+        fga_client = await self._async_fga_client.client()
+        resp = await self.guarded_check_async(
+            relations[0],
+            object,
+            lambda: fga_client.check(
+                body=ClientCheckRequest(
+                    user=user,
+                    relation=relations[0],
+                    object=object,
+                    contextual_tuples=_contextual,
+                )
+            )
+        )
+        decisions = {relations[0]: bool(resp.allowed)}
+        return self.apply_revocations(user, object, decisions, _revoked, generation)
+
+    async def guarded_check_async(
+        self, relation: str, object: str, fn: Callable[[], Awaitable[T]]
+    ) -> T:
+        _started_at = time.perf_counter()
+        try:
+            _result = await self._guard.call_async(fn)
+        except CircuitOpenError:
+            # not sent: no round trip to record
+            FGA_CHECK_FAILURES.labels("circuit_open").inc()
+            raise
+        except BaseException as e:
+            _count_failure(e)
+            _observe_check(relation, object, _started_at)
+            raise
+        _observe_check(relation, object, _started_at)
+        return _result
+
+    @override
+    def coalescing_stats(self) -> Dict[str, int]:
+        _sync, _async = self._flights.stats(), self._async_flights.stats()
+        return {k: _sync[k] + _async[k] for k in _sync}
+
+    @trace_method(
+        "OpenFGAAsyncAuthorizationProvider.authorize_async",
+        OpenTelemetryGranularity.ALL,
+    )
+    async def authorize_async(self, context: AuthorizationContext) -> bool:
+        try:
+            obj, act = self.resolve_resource_action(
+                resource=context.resource, action=context.action
+            )
+            user = f"user:{context.user.id}"
+            cached = self._decision_cache.get(user, act, obj)
+            if cached is not None:
+                self.count_decision(context, "allow" if cached else "deny")
+                return cached
+        except Exception as e:
+            logger.error(f"Error while authorizing: {str(e)}")
+            self.count_decision(context, "error")
+            return False
+        decisions: Optional[Decisions] = None
+        try:
+            generation = self._decision_cache.generation
+            relations = self.relations_to_check(act, obj)
+            memberships = self.membership_tuples(context)
+            decisions = await self._async_flights.do(
+                self.flight_key(user, relations[:1], obj, generation),
+                lambda: self.fetch_decisions_async(
+                    user, relations[:1], obj, generation, memberships
+                ),
+            )
+            if len(relations) > 1:
+                # in threads: off the request path and off the event loop
+                self.prefetch(user, relations[1:], obj, generation, memberships)
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            logger.error(f"Error while authorizing: {str(e)}")
+        return self.decide(context, user, act, obj, decisions)
+
+    @override
+    def authorize(self, context: AuthorizationContext) -> bool:
+        _request = request_var.get()
+        _decisions = (
+            getattr(_request.state, "authz_decisions", None) if _request else None
+        )
+        if _decisions:
+            _decision = _decisions.get(self.decision_key(context))
+            if _decision is not None:
+                return cast(bool, _decision)
+        return super().authorize(context)
+
+
+@register_provider("openfga_local_authz_provider")
+class LocalOpenFGAAuthorizationProvider(OpenFGAAuthorizationProvider):
+    """OpenFGA authorization evaluated in-process against a local tuple replica.
+
+    The model and the tuples are loaded by `LocalTupleStore` (see
+    `FGA_LOCAL_MODEL_FILE` and `FGA_LOCAL_TUPLES_FILE`) and checks are plain memory
+    lookups, so authorization never calls OpenFGA. Tuples written through
+    `OpenFGAPermissionsAPI` are applied to the replica as they are written (and still
+    sent to OpenFGA, which remains the source of truth).
+    """
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._tuples = self.require(LocalTupleStore)
+        self._tuples.load()
+
+    @trace_method(
+        "LocalOpenFGAAuthorizationProvider.authorize",
+        OpenTelemetryGranularity.ALL,
+    )
+    @override
+    def authorize(self, context: AuthorizationContext) -> bool:
+        try:
+            obj, act = self.resolve_resource_action(
+                resource=context.resource, action=context.action
+            )
+            allowed = self._tuples.check(
+                f"user:{context.user.id}",
+                act,
+                obj,
+                contextual_tuples=self.membership_tuples(context),
+            )
+        except Exception as e:
+            logger.error(f"Error while authorizing: {str(e)}")
+            self.count_decision(context, "error")
+            return False
+        self.count_decision(context, "allow" if allowed else "deny")
+        return allowed
+
+
+def _observe_check(relation: str, object: str, started_at: float) -> None:
+    FGA_CHECK_SECONDS.labels(relation, object.split(":", 1)[0]).observe(
+        time.perf_counter() - started_at
+    )
+
 
+def _count_failure(e: BaseException) -> None:
+    if isinstance(e, DeadlineExceededError):
+        FGA_CHECK_FAILURES.labels("deadline").inc()
+    else:
+        FGA_CHECK_FAILURES.labels("error").inc()
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from chromadb.config import Component, System
+from openfga_sdk.client.models import ClientReadChangesRequest
+from overrides import override
+
+from chroma_auth.authz.openfga.client import SharedOpenFGAClient
+from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+from chroma_auth.authz.openfga.tuple_store import LocalTupleStore
+from chroma_auth.utils import env_bool, env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+
+class OpenFGAChangeFeed(Component):
+    """Follows OpenFGA's ReadChanges API to keep local authorization state fresh.
+
+    Tuples written outside this server (by `fga tuple write`, admin tooling or other
+    replicas) are turned into targeted invalidations of the decision cache and
+    applied to the local tuple replica. The continuation token is persisted, so a
+    restarted server resumes where it stopped; without a token the whole change
+    history is replayed. Enabled by `FGA_CHANGE_FEED_ENABLED`.
+    """
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._enabled = env_bool("FGA_CHANGE_FEED_ENABLED", False)
+        self._poll_interval = env_float("FGA_CHANGE_FEED_POLL_SECONDS", 2)
+        self._page_size = env_int("FGA_CHANGE_FEED_PAGE_SIZE", 100)
+        self._type = os.environ.get("FGA_CHANGE_FEED_TYPE") or None
+        self._token_file = os.environ.get("FGA_CHANGE_FEED_TOKEN_FILE") or os.path.join(
+            system.settings.persist_directory, "fga_changes.json"
+        )
+        self._fga_client = self.require(SharedOpenFGAClient)
+        self._decision_cache = self.require(OpenFGADecisionCache)
+        self._local_tuples = self.require(LocalTupleStore)
+        self._store_id = self._fga_client.configuration.store_id
+        self._token: Optional[str] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._applied = 0
+        self._errors = 0
+        self._last_poll_at: Optional[float] = None
+        self._last_change_at: Optional[float] = None
+        self._caught_up = False
+        self._last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @override
+    def start(self) -> None:
+        super().start()
+        if not self._enabled:
+            return
+        self._token = self._load_token()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._follow, name="fga-change-feed", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Following OpenFGA changes of store {self._store_id} "
+            f"from {'token ' + self._token if self._token else 'the beginning'}"
+        )
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _load_token(self) -> Optional[str]:
+        try:
+            with open(self._token_file, "r") as f:
+                _state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable change feed state {self._token_file}: {e}")
+            return None
+        # a token is only meaningful for the store it was issued by
+        if _state.get("store_id") != self._store_id:
+            return None
+        return _state.get("continuation_token") or None
+
+    def _save_token(self, token: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self._token_file)), exist_ok=True)
+        _tmp = f"{self._token_file}.tmp"
+        with open(_tmp, "w") as f:
+            json.dump({"store_id": self._store_id, "continuation_token": token}, f)
+        os.replace(_tmp, self._token_file)
+
+    def _follow(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                _changes = self.poll_once()
+            except Exception as e:
+                self._errors += 1
+                self._last_error = str(e)
+                logger.error(f"Error while reading OpenFGA changes: {str(e)}")
+                _changes = 0
+            # keep reading while there is a backlog
+            if _changes < self._page_size:
+                self._stopped.wait(self._poll_interval)
+
+    def poll_once(self) -> int:
+        """Read and apply the next page of changes; returns the number of changes."""
+        _options: Dict[str, Any] = {"page_size": self._page_size}
+        if self._token:
+            _options["continuation_token"] = self._token
+        _response = self._fga_client.client.read_changes(
+            ClientReadChangesRequest(self._type), _options
+        )
+        _changes = _response.changes or []
+        self._apply(_changes)
+        self._last_poll_at = time.time()
+        self._caught_up = len(_changes) < self._page_size
+        if _response.continuation_token and _response.continuation_token != self._token:
+            self._token = _response.continuation_token
+            self._save_token(self._token)
+        return len(_changes)
+
+    def _apply(self, changes: List[Any]) -> None:
+        if not changes:
+            return
+        _objects: Set[str] = set()
+        _users: Set[str] = set()
+        _clear = False
+        # applied in order: the same tuple may be written and deleted within a page
+        for change in changes:
+            _key = change.tuple_key
+            if str(change.operation).endswith("DELETE"):
+                self._local_tuples.apply(deletes=[_key])
+            else:
+                self._local_tuples.apply(writes=[_key])
+            _objects.add(_key.object)
+            # a membership change (e.g. user:x owner team:y) changes decisions of
+            # that user on any object granted to the team
+            _users.add(_key.user)
+            # wildcard grants can't be targeted
+            _clear = _clear or _key.user.endswith(":*")
+            if change.timestamp is not None:
+                self._last_change_at = parse_timestamp(change.timestamp)
+        if _clear:
+            self._decision_cache.clear()
+        else:
+            self._decision_cache.invalidate_objects(_objects)
+            self._decision_cache.invalidate_users(_users)
+        self._applied += len(changes)
+        logger.debug(f"Applied {len(changes)} OpenFGA changes")
+
+    def stats(self) -> Dict[str, Any]:
+        _now = time.time()
+        if self._caught_up:
+            _lag = _now - self._last_poll_at if self._last_poll_at else None
+        else:
+            # still working through a backlog: behind by the age of the last change
+            _lag = _now - self._last_change_at if self._last_change_at else None
+        return {
+            "enabled": self._enabled,
+            "applied": self._applied,
+            "errors": self._errors,
+            "caught_up": self._caught_up,
+            "lag_seconds": _lag,
+            "last_poll_at": self._last_poll_at,
+            "last_change_at": self._last_change_at,
+            "last_error": self._last_error,
+        }
+
+
+def parse_timestamp(value: Any) -> float:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, TypeVar
+
+from chromadb.config import Component, System
+from openfga_sdk.exceptions import ApiException
+from overrides import override
+
+from chroma_auth.authz.openfga.client import SharedOpenFGAClient
+from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+from chroma_auth.utils import env_float, env_int
+from chroma_auth.utils.circuit_breaker import CLOSED, CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEGRADED_MODES = ("deny", "last_known")
+
+# latencies kept to derive the hedging delay from, and the least needed to do so
+LATENCY_WINDOW = 1000
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OpenFGA while the circuit breaker is open."""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a check did not complete within its deadline."""
+
+
+def _is_failure(e: BaseException) -> bool:
+    # a rejected request (bad object, unknown relation) says nothing about the
+    # health of OpenFGA; throttling and server errors do
+    if isinstance(e, ApiException) and e.status is not None:
+        return e.status == 429 or e.status >= 500
+    return True
+
+
+class OpenFGACheckGuard(Component):
+    """Bounds the time and the damage of OpenFGA checks when OpenFGA is degraded.
+
+    Every check gets a deadline (`FGA_CHECK_DEADLINE_SECONDS`), after which it is
+    abandoned and the socket timeout of the attempt is cut to what remains, so that
+    workers are not held up by a slow dependency. A circuit breaker opens after
+    `FGA_BREAKER_FAILURE_THRESHOLD` consecutive failed (or, with
+    `FGA_BREAKER_SLOW_CALL_SECONDS`, slow) checks and fails further checks
+    immediately until a trial check succeeds. With `FGA_HEDGE_PERCENTILE`, a check
+    still outstanding after that percentile of recent latencies is sent a second
+    time and the first response wins. Checks that could not be answered are decided
+    by `FGA_DEGRADED_MODE`: `deny`, or `last_known` to serve the last decision seen.
+    """
+
+    _executor: Optional[ThreadPoolExecutor]
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._deadline = env_float("FGA_CHECK_DEADLINE_SECONDS", 0)
+        self._slow_call = env_float("FGA_BREAKER_SLOW_CALL_SECONDS", 0)
+        self._breaker = CircuitBreaker(
+            failure_threshold=env_int("FGA_BREAKER_FAILURE_THRESHOLD", 5),
+            open_seconds=env_float("FGA_BREAKER_OPEN_SECONDS", 5),
+            clock=time.monotonic,
+        )
+        self._hedge_percentile = env_float("FGA_HEDGE_PERCENTILE", 0)
+        if not 0 <= self._hedge_percentile < 100:
+            raise ValueError(
+                f"FGA_HEDGE_PERCENTILE must be within [0, 100), got [{self._hedge_percentile}]"
+            )
+        self._degraded_mode = os.environ.get("FGA_DEGRADED_MODE", "deny")
+        if self._degraded_mode not in DEGRADED_MODES:
+            raise ValueError(
+                f"FGA_DEGRADED_MODE must be one of {DEGRADED_MODES}, got [{self._degraded_mode}]"
+            )
+        self._fga_client = self.require(SharedOpenFGAClient)
+        self._decision_cache = self.require(OpenFGADecisionCache)
+        self._executor = None
+        # guards the executor, the latencies and the counters below
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._hedge_delay: Optional[float] = None
+        self._samples_since_update = 0
+        self._deadlines_exceeded = 0
+        self._hedged = 0
+        self._hedges_won = 0
+        self._degraded = 0
+        self._degraded_served = 0
+
+    @property
+    def deadline(self) -> float:
+        return self._deadline
+
+    @property
+    def closed(self) -> bool:
+        """Whether the circuit breaker lets checks through without a trial."""
+        return self._breaker.state == CLOSED
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._fga_client.configuration.connection_pool_maxsize,
+                        thread_name_prefix="openfga-guard",
+                    )
+        return self._executor
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """Run an OpenFGA request under the breaker, the deadline and hedging."""
+        if not self._breaker.allow():
+            raise CircuitOpenError("OpenFGA circuit breaker is open")
+        _started_at = time.monotonic()
+        try:
+            _result = self._run(fn, _started_at)
+        except BaseException as e:
+            self._record(_started_at, e)
+            raise
+        self._record(_started_at)
+        return _result
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Like `call`, for requests made with the asyncio client."""
+        if not self._breaker.allow():
+            raise CircuitOpenError("OpenFGA circuit breaker is open")
+        _started_at = time.monotonic()
+        try:
+            _result = await self._run_async(fn, _started_at)
+        except BaseException as e:
+            self._record(_started_at, e)
+            raise
+        self._record(_started_at)
+        return _result
+
+    def _run(self, fn: Callable[[], T], started_at: float) -> T:
+        _hedge_delay = self._current_hedge_delay()
+        if not self._deadline and _hedge_delay is None:
+            return fn()
+        _deadline_at = started_at + self._deadline if self._deadline else None
+        _primary = self.executor.submit(self._attempt, fn, _deadline_at)
+        _pending: Set["Future[T]"] = {_primary}
+        if _hedge_delay is not None:
+            _done, _ = wait(_pending, timeout=_hedge_delay)
+            if not _done and (
+                _deadline_at is None or time.monotonic() + 0.001 < _deadline_at
+            ):
+                with self._lock:
+                    self._hedged += 1
+                _pending.add(self.executor.submit(self._attempt, fn, _deadline_at))
+        _error: Optional[BaseException] = None
+        while _pending:
+            _remaining = (
+                _deadline_at - time.monotonic() if _deadline_at is not None else None
+            )
+            if _remaining is not None and _remaining <= 0:
+                break
+            _done, _pending = wait(
+                _pending, timeout=_remaining, return_when=FIRST_COMPLETED
+            )
+            for _future in _done:
+                _error = _future.exception()
+                if _error is None:
+                    if _future is not _primary:
+                        with self._lock:
+                            self._hedges_won += 1
+                    for _other in _pending:
+                        _other.cancel()
+                    return _future.result()
+        if _error is not None and not _pending:
+            raise _error
+        for _other in _pending:
+            _other.cancel()
+        with self._lock:
+            self._deadlines_exceeded += 1
+        raise DeadlineExceededError(f"OpenFGA check exceeded {self._deadline}s")
+
+    def _attempt(self, fn: Callable[[], T], deadline_at: Optional[float]) -> T:
+        if deadline_at is None:
+            return fn()
+        _remaining = deadline_at - time.monotonic()
+        if _remaining <= 0:
+            # queued behind other attempts for longer than the whole budget
+            raise DeadlineExceededError("OpenFGA check expired before it was sent")
+        with self._fga_client.timeout(_remaining):
+            return fn()
+
+    async def _run_async(self, fn: Callable[[], Awaitable[T]], started_at: float) -> T:
+        _hedge_delay = self._current_hedge_delay()
+        if not self._deadline and _hedge_delay is None:
+            return await fn()
+        _deadline_at = started_at + self._deadline if self._deadline else None
+        _primary = asyncio.ensure_future(fn())
+        _pending: Set["asyncio.Future[T]"] = {_primary}
+        try:
+            if _hedge_delay is not None:
+                _done, _ = await asyncio.wait(_pending, timeout=_hedge_delay)
+                if not _done and (
+                    _deadline_at is None or time.monotonic() + 0.001 < _deadline_at
+                ):
+                    with self._lock:
+                        self._hedged += 1
+                    _pending.add(asyncio.ensure_future(fn()))
+            _error: Optional[BaseException] = None
+            while _pending:
+                _remaining = (
+                    _deadline_at - time.monotonic() if _deadline_at is not None else None
+                )
+                if _remaining is not None and _remaining <= 0:
+                    break
+                _done, _pending = await asyncio.wait(
+                    _pending, timeout=_remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for _future in _done:
+                    _error = _future.exception()
+                    if _error is None:
+                        if _future is not _primary:
+                            with self._lock:
+                                self._hedges_won += 1
+                        return _future.result()
+            if _error is not None and not _pending:
+                raise _error
+            with self._lock:
+                self._deadlines_exceeded += 1
+            raise DeadlineExceededError(f"OpenFGA check exceeded {self._deadline}s")
+        finally:
+            for _other in _pending:
+                _other.cancel()
+
+    def _record(self, started_at: float, error: Optional[BaseException] = None) -> None:
+        _elapsed = time.monotonic() - started_at
+        if error is not None and _is_failure(error):
+            self._breaker.record_failure()
+            return
+        if self._slow_call and _elapsed > self._slow_call:
+            self._breaker.record_failure()
+        else:
+            self._breaker.record_success()
+        if error is None and self._hedge_percentile:
+            with self._lock:
+                self._latencies.append(_elapsed)
+                self._samples_since_update += 1
+                # recomputed every few samples rather than sorting on every check
+                if self._samples_since_update >= MIN_LATENCY_SAMPLES:
+                    self._samples_since_update = 0
+                    _sorted = sorted(self._latencies)
+                    self._hedge_delay = _sorted[
+                        min(len(_sorted) - 1, int(len(_sorted) * self._hedge_percentile / 100))
+                    ]
+
+    def _current_hedge_delay(self) -> Optional[float]:
+        if not self._hedge_percentile:
+            return None
+        return self._hedge_delay
+
+    def degraded(self, user: str, relation: str, object: str) -> bool:
+        """The decision for a check OpenFGA could not answer."""
+        _last_known = (
+            self._decision_cache.last_known(user, relation, object)
+            if self._degraded_mode == "last_known"
+            else None
+        )
+        with self._lock:
+            self._degraded += 1
+            if _last_known is not None:
+                self._degraded_served += 1
+        return bool(_last_known)
+
+    def stats(self) -> Dict[str, Any]:
+        _breaker = self._breaker.stats()
+        with self._lock:
+            return {
+                **_breaker,
+                "deadlines_exceeded": self._deadlines_exceeded,
+                "hedged": self._hedged,
+                "hedges_won": self._hedges_won,
+                "hedge_delay_seconds": self._hedge_delay,
+                "degraded": self._degraded,
+                "degraded_served_last_known": self._degraded_served,
+            }
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple, cast
+
+from chromadb.auth import ServerAuthorizationConfigurationProvider
+from chromadb.auth.registry import resolve_provider
+from chromadb.config import Component, System
+from openfga_sdk import ClientConfiguration
+from openfga_sdk import OpenFgaClient as AsyncOpenFgaClient
+from openfga_sdk.configuration import RetryParams
+from openfga_sdk.sync import OpenFgaClient
+from overrides import override
+
+from chroma_auth.utils import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+
+def error_message(e: Exception) -> str:
+    """The message of an error raised by the OpenFGA client, including the reason
+    returned by OpenFGA: the SDK moves it from the response body into
+    `parsed_exception`, which `str()` leaves out."""
+    _message = getattr(getattr(e, "parsed_exception", None), "message", None)
+    return f"{str(e).strip()}: {_message}" if _message else str(e)
+
+
+class SharedOpenFGAClient(Component):
+    """A single, long-lived OpenFGA client shared by all authz components.
+
+    Creating an `OpenFgaClient` per call pays for a new connection pool (and TCP/TLS
+    handshake) on every check or tuple write. This component keeps one client with a
+    keep-alive connection pool for the lifetime of the system and closes it on
+    `System.stop()`. The client is thread-safe and can be used concurrently.
+    """
+
+    _client: Optional[OpenFgaClient]
+    _executor: Optional[ThreadPoolExecutor]
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._settings = system.settings
+        system.settings.require("chroma_server_authz_config_provider")
+        _cls = resolve_provider(
+            self._settings.chroma_server_authz_config_provider,
+            ServerAuthorizationConfigurationProvider,
+        )
+        self._configuration = cast(
+            ServerAuthorizationConfigurationProvider[ClientConfiguration],
+            self.require(_cls),
+        ).get_configuration()
+        # max number of kept-alive connections to the FGA server
+        self._configuration.connection_pool_maxsize = env_int(
+            "FGA_CONNECTION_POOL_SIZE", 32
+        )
+        _max_retry = env_int("FGA_MAX_RETRY", -1)
+        if _max_retry >= 0:
+            self._configuration.retry_params = RetryParams(
+                max_retry=_max_retry,
+                min_wait_in_ms=env_int("FGA_MIN_RETRY_WAIT_MS", 100),
+            )
+        self._request_timeout: Tuple[float, float] = (
+            env_float("FGA_CONNECT_TIMEOUT_SECONDS", 2),
+            env_float("FGA_REQUEST_TIMEOUT_SECONDS", 10),
+        )
+        self._client = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def configuration(self) -> ClientConfiguration:
+        return self._configuration
+
+    @property
+    def request_timeout(self) -> Tuple[float, float]:
+        return self._request_timeout
+
+    @property
+    def client(self) -> OpenFgaClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Workers for issuing several requests with the shared client in parallel."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._configuration.connection_pool_maxsize,
+                        thread_name_prefix="openfga-client",
+                    )
+        return self._executor
+
+    @contextmanager
+    def timeout(self, seconds: Optional[float]) -> Iterator[None]:
+        """Bound the timeouts of the requests made by this thread to `seconds`."""
+        if not seconds:
+            yield
+            return
+        _connect, _read = self._request_timeout
+        self._local.timeout = (min(_connect, seconds), min(_read, seconds))
+        try:
+            yield
+        finally:
+            self._local.timeout = None
+
+    def _create_client(self) -> OpenFgaClient:
+        _client = OpenFgaClient(self._configuration)
+        # The high level client does not forward per-call timeouts, so apply the
+        # configured (connect, read) timeout to every request it issues.
+        _api_client = _client._api_client
+        _call_api = _api_client.call_api
+        _timeout = self._request_timeout
+        _local = self._local
+
+        def call_api(*args: Any, **kwargs: Any) -> Any:
+            if kwargs.get("_request_timeout") is None:
+                kwargs["_request_timeout"] = getattr(_local, "timeout", None) or _timeout
+            return _call_api(*args, **kwargs)
+
+        _api_client.call_api = call_api
+        logger.info(
+            "Shared OpenFGA client created "
+            f"(pool size {self._configuration.connection_pool_maxsize}, "
+            f"timeout {_timeout})"
+        )
+        return _client
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                # OpenFgaClient.close() does not release pooled connections
+                self._client._api_client.rest_client.close()
+                self._client = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+class SharedAsyncOpenFGAClient(Component):
+    """A single asyncio OpenFGA client bound to the server's event loop.
+
+    The asyncio SDK client owns an aiohttp session, which must be created on (and
+    only used from) the loop that serves requests. The client is therefore created
+    lazily on first use from that loop and shares the configuration, pool size and
+    timeouts of `SharedOpenFGAClient`.
+    """
+
+    _client: Optional[AsyncOpenFgaClient]
+    _loop: Optional[asyncio.AbstractEventLoop]
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._sync_client = self.require(SharedOpenFGAClient)
+        self._client = None
+        self._loop = None
+
+    async def client(self) -> AsyncOpenFgaClient:
+        _loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not _loop:
+            # no await between the check and the assignment, so this cannot race
+            # with another coroutine on the same loop
+            self._client = self._create_client()
+            self._loop = _loop
+        return self._client
+
+    def _create_client(self) -> AsyncOpenFgaClient:
+        import aiohttp
+
+        _client = AsyncOpenFgaClient(self._sync_client.configuration)
+        _api_client = _client._api_client
+        _call_api = _api_client.call_api
+        _connect, _read = self._sync_client.request_timeout
+        _timeout = aiohttp.ClientTimeout(sock_connect=_connect, sock_read=_read)
+
+        async def call_api(*args: Any, **kwargs: Any) -> Any:
+            if kwargs.get("_request_timeout") is None:
+                kwargs["_request_timeout"] = _timeout
+            return await _call_api(*args, **kwargs)
+
+        _api_client.call_api = call_api
+        return _client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            _client, self._client, self._loop = self._client, None, None
+            await _client.close()
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        if self._client is None or self._loop is None or self._loop.is_closed():
+            return
+        if self._loop.is_running():
+            self._loop.create_task(self.aclose())
+        else:
+            self._loop.run_until_complete(self.aclose())
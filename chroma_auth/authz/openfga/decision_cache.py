@@ -0,0 +1,144 @@
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from chromadb.config import Component, System
+
+from chroma_auth.utils import env_float, env_int
+from chroma_auth.utils.shared_cache import SharedAuthCache
+from chroma_auth.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DecisionKey = Tuple[str, str, str]  # (user, relation, object)
+# (user, relation, object, *shared counters of the user and the object)
+CacheKey = Tuple[Any, ...]
+
+
+class OpenFGADecisionCache(Component):
+    """A bounded cache of OpenFGA check decisions keyed on (user, relation, object).
+
+    Allowed and denied decisions have separate TTLs so that denials (e.g. for a
+    collection that is about to be created) can be kept short-lived. Writers of
+    relationship tuples invalidate the affected objects so that new grants are
+    visible immediately. Disabled unless `FGA_CHECK_CACHE_SIZE` is set.
+
+    With `FGA_DEGRADED_MODE=last_known`, decisions are also kept for much longer in
+    a separate "last known" cache, which is only consulted while OpenFGA is
+    unavailable and is invalidated along with the main cache.
+
+    With a `SharedAuthCache`, decisions are also shared with the other worker
+    processes of the host, and invalidations made by any of them apply to all.
+    """
+
+    _cache: Optional[TTLCache[CacheKey, bool]]
+    _last_known: Optional[TTLCache[DecisionKey, bool]]
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        _size = env_int("FGA_CHECK_CACHE_SIZE", 0)
+        self._positive_ttl = env_float("FGA_CHECK_CACHE_POSITIVE_TTL_SECONDS", 60)
+        self._negative_ttl = env_float("FGA_CHECK_CACHE_NEGATIVE_TTL_SECONDS", 5)
+        self._cache = (
+            TTLCache(capacity=_size, ttl=self._positive_ttl) if _size > 0 else None
+        )
+        _last_known_size = (
+            env_int("FGA_LAST_KNOWN_CACHE_SIZE", 10000)
+            if os.environ.get("FGA_DEGRADED_MODE", "deny") == "last_known"
+            else 0
+        )
+        self._last_known = (
+            TTLCache(
+                capacity=_last_known_size,
+                ttl=env_float("FGA_LAST_KNOWN_TTL_SECONDS", 3600),
+            )
+            if _last_known_size > 0
+            else None
+        )
+        # bumped on every invalidation; a decision fetched before an invalidation
+        # must not be stored after it
+        self._generation = 0
+        self._shared = self.require(SharedAuthCache)
+
+    @property
+    def enabled(self) -> bool:
+        return self._cache is not None
+
+    @property
+    def generation(self) -> int:
+        # the shared epoch counts the invalidations made by every worker
+        return self._generation + self._shared.epoch
+
+    def _key(self, user: str, relation: str, object: str) -> CacheKey:
+        return (user, relation, object) + self._shared.counters(user, object)
+
+    def get(self, user: str, relation: str, object: str) -> Optional[bool]:
+        if self._cache is None:
+            return None
+        _key = self._key(user, relation, object)
+        _allowed = self._cache.get(_key)
+        if _allowed is None and self._shared.enabled:
+            _entry = self._shared.get(self._shared.digest("decision", _key))
+            if _entry is not None:
+                _allowed = bool(_entry[0])
+                self._cache.set(_key, _allowed, ttl=_entry[1] - time.time())
+        return _allowed
+
+    def last_known(self, user: str, relation: str, object: str) -> Optional[bool]:
+        """The last decision fetched for (user, relation, object), if still kept."""
+        if self._last_known is None:
+            return None
+        return self._last_known.get((user, relation, object))
+
+    def set(
+        self,
+        user: str,
+        relation: str,
+        object: str,
+        allowed: bool,
+        generation: Optional[int] = None,
+    ) -> None:
+        if generation is not None and generation != self.generation:
+            return
+        if self._last_known is not None:
+            self._last_known.set((user, relation, object), allowed)
+        if self._cache is None:
+            return
+        _key = self._key(user, relation, object)
+        _ttl = self._positive_ttl if allowed else self._negative_ttl
+        self._cache.set(_key, allowed, ttl=_ttl)
+        self._shared.set(self._shared.digest("decision", _key), int(allowed), _ttl)
+
+    def invalidate_objects(self, objects: Iterable[str]) -> int:
+        """Drop every cached decision on any of the given objects."""
+        _objects = set(objects)
+        self._shared.invalidate(_objects)
+        return self._invalidate(lambda key, _: key[2] in _objects)
+
+    def invalidate_users(self, users: Iterable[str]) -> int:
+        """Drop every cached decision for any of the given users."""
+        _users = set(users)
+        self._shared.invalidate(_users)
+        return self._invalidate(lambda key, _: key[0] in _users)
+
+    def _invalidate(self, predicate: Callable[[CacheKey, bool], bool]) -> int:
+        self._generation += 1
+        if self._last_known is not None:
+            self._last_known.invalidate(predicate)
+        if self._cache is None:
+            return 0
+        return self._cache.invalidate(predicate)
+
+    def clear(self) -> None:
+        self._shared.flush()
+        self._generation += 1
+        if self._last_known is not None:
+            self._last_known.clear()
+        if self._cache is not None:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        if self._cache is None:
+            return {"hits": 0, "misses": 0, "size": 0}
+        return self._cache.stats()
@@ -0,0 +1,35 @@
+"""Prometheus metrics of the OpenFGA authorization path.
+
+Label values must come from small, fixed sets (actions, resource types, routes),
+never from users or collections, as every distinct combination is kept forever.
+"""
+from prometheus_client import Counter, Histogram
+
+# from half a millisecond (a cached decision) to 10s (a timed-out FGA call)
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+FGA_CHECK_SECONDS = Histogram(
+    "chroma_auth_fga_check_seconds",
+    "Round trip of OpenFGA check requests, by relation and object type.",
+    ["relation", "object_type"],
+    buckets=LATENCY_BUCKETS,
+)
+FGA_CHECK_FAILURES = Counter(
+    "chroma_auth_fga_check_failures_total",
+    "OpenFGA checks that got no answer, by reason "
+    "(error, deadline, circuit_open, prefetch).",
+    ["reason"],
+)
+AUTHZ_DECISIONS = Counter(
+    "chroma_auth_authz_decisions_total",
+    "Authorization decisions (allow, deny, or error when OpenFGA could not answer).",
+    ["action", "resource_type", "decision"],
+)
+TUPLE_WRITE_SECONDS = Histogram(
+    "chroma_auth_fga_tuple_write_seconds",
+    "Latency of tuple write requests to OpenFGA, made within requests or by the outbox.",
+    ["path"],
+    buckets=LATENCY_BUCKETS,
+)
@@ -0,0 +1,150 @@
+"""
+A parser for the subset of the OpenFGA modeling language (schema 1.1) needed to
+evaluate our models locally: direct type restrictions (`[user, team#owner, user:*]`),
+computed relations (`owner`), tuple-to-userset (`viewer from parent`) and unions of
+those (`or`). Intersections, exclusions and conditions are rejected.
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+
+class DirectType(NamedTuple):
+    """A type allowed as the user of a tuple, e.g. `user`, `user:*` or `team#owner`."""
+
+    type: str
+    relation: Optional[str] = None
+    wildcard: bool = False
+
+
+class Direct(NamedTuple):
+    types: Tuple[DirectType, ...]
+
+
+class Computed(NamedTuple):
+    relation: str
+
+
+class TupleToUserset(NamedTuple):
+    relation: str  # evaluated on the related object
+    tupleset: str  # the relation linking to the related object
+
+
+Rewrite = Union[Direct, Computed, TupleToUserset]
+
+# type -> relation -> union of rewrites
+TypeDefinitions = Dict[str, Dict[str, List[Rewrite]]]
+
+_IDENT = r"[A-Za-z0-9_\-]+"
+_TYPE_RE = re.compile(rf"^type\s+({_IDENT})$")
+_DEFINE_RE = re.compile(rf"^define\s+({_IDENT})\s*:\s*(.+)$")
+_TTU_RE = re.compile(rf"^({_IDENT})\s+from\s+({_IDENT})$")
+_DIRECT_TYPE_RE = re.compile(rf"^({_IDENT})(?::(\*)|#({_IDENT}))?$")
+
+
+class AuthorizationModel:
+    def __init__(self, type_definitions: TypeDefinitions) -> None:
+        self.type_definitions = type_definitions
+        for _type, _relations in type_definitions.items():
+            for _relation, _rewrites in _relations.items():
+                for _rewrite in _rewrites:
+                    _referenced: List[Tuple[str, str]] = []
+                    if isinstance(_rewrite, Computed):
+                        _referenced.append((_type, _rewrite.relation))
+                    elif isinstance(_rewrite, TupleToUserset):
+                        _referenced.append((_type, _rewrite.tupleset))
+                    else:
+                        _referenced += [
+                            (t.type, t.relation) for t in _rewrite.types if t.relation
+                        ]
+                        _referenced += [
+                            (t.type, "") for t in _rewrite.types if not t.relation
+                        ]
+                    for _t, _r in _referenced:
+                        if _t not in type_definitions or (
+                            _r and _r not in type_definitions[_t]
+                        ):
+                            raise ValueError(
+                                f"{_type}#{_relation} references undefined "
+                                f"{_t}{'#' + _r if _r else ''}"
+                            )
+
+    @classmethod
+    def parse(cls, dsl: str) -> "AuthorizationModel":
+        type_definitions: TypeDefinitions = {}
+        _type: Optional[str] = None
+        for lineno, raw in enumerate(dsl.splitlines(), start=1):
+            line = raw.strip()
+            if not line or line.startswith("#") or line in ("model", "relations"):
+                continue
+            if line.startswith("schema"):
+                if line.split()[-1] != "1.1":
+                    raise ValueError(f"line {lineno}: unsupported schema [{line}]")
+                continue
+            _match = _TYPE_RE.match(line)
+            if _match:
+                _type = _match.group(1)
+                type_definitions[_type] = {}
+                continue
+            _match = _DEFINE_RE.match(line)
+            if _match and _type is not None:
+                type_definitions[_type][_match.group(1)] = _parse_rewrites(
+                    _match.group(2), lineno
+                )
+                continue
+            raise ValueError(f"line {lineno}: unsupported model statement [{line}]")
+        return cls(type_definitions)
+
+    @classmethod
+    def from_file(cls, file: str) -> "AuthorizationModel":
+        with open(file, "r") as f:
+            return cls.parse(f.read())
+
+    def rewrites(self, type: str, relation: str) -> List[Rewrite]:
+        return self.type_definitions.get(type, {}).get(relation, [])
+
+    def allows(self, type: str, relation: str, user: str) -> bool:
+        """Whether a tuple with `user` may be written for `relation` on `type`."""
+        _user_type, _, _rest = user.partition(":")
+        _user_relation = _rest.partition("#")[2] or None
+        _wildcard = _rest == "*"
+        for _rewrite in self.rewrites(type, relation):
+            if isinstance(_rewrite, Direct):
+                for t in _rewrite.types:
+                    if (
+                        t.type == _user_type
+                        and t.relation == _user_relation
+                        and t.wildcard == _wildcard
+                    ):
+                        return True
+        return False
+
+
+def _parse_rewrites(expression: str, lineno: int) -> List[Rewrite]:
+    if re.search(r"\s(and|but not)\s", expression) or " with " in expression:
+        raise ValueError(
+            f"line {lineno}: intersections, exclusions and conditions are not supported"
+        )
+    _rewrites: List[Rewrite] = []
+    for term in (t.strip() for t in re.split(r"\s+or\s+", expression)):
+        if term.startswith("[") and term.endswith("]"):
+            _types = []
+            for _t in (t.strip() for t in term[1:-1].split(",")):
+                _match = _DIRECT_TYPE_RE.match(_t)
+                if not _match:
+                    raise ValueError(f"line {lineno}: invalid type restriction [{_t}]")
+                _types.append(
+                    DirectType(
+                        type=_match.group(1),
+                        relation=_match.group(3),
+                        wildcard=_match.group(2) == "*",
+                    )
+                )
+            _rewrites.append(Direct(tuple(_types)))
+        elif _TTU_RE.match(term):
+            _match = _TTU_RE.match(term)
+            _rewrites.append(TupleToUserset(_match.group(1), _match.group(2)))  # type: ignore
+        elif re.fullmatch(_IDENT, term):
+            _rewrites.append(Computed(term))
+        else:
+            raise ValueError(f"line {lineno}: unsupported relation definition [{term}]")
+    return _rewrites
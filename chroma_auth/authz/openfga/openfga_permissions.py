@@ -1,20 +1,78 @@
 import logging
-from typing import cast
+import os
+import threading
+import time
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
 
 from chromadb.api.models import Collection
 from chromadb.auth import ServerAuthorizationConfigurationProvider
 from chromadb.auth.registry import resolve_provider
-from chromadb.config import Component, System
+from chromadb.config import DEFAULT_DATABASE, DEFAULT_TENANT, Component, System
 from chromadb.server.fastapi import CreateTenant, CreateDatabase
+from chromadb.telemetry.opentelemetry import add_attributes_to_current_span
 from openfga_sdk import ListObjectsResponse, ClientConfiguration
-from openfga_sdk.client.models import ClientTuple, ClientListObjectsRequest
-from openfga_sdk.sync import OpenFgaClient
+from openfga_sdk.client.models import (
+    ClientListObjectsRequest,
+    ClientTuple,
+    ClientWriteRequest,
+)
+from openfga_sdk.exceptions import ValidationException
+from openfga_sdk.models import ReadRequestTupleKey
 from starlette.requests import Request
 
+from chroma_auth.authz.openfga.client import SharedOpenFGAClient, error_message
+from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+from chroma_auth.authz.openfga.metrics import TUPLE_WRITE_SECONDS
+from chroma_auth.authz.openfga.outbox import OpenFGATupleOutbox
+from chroma_auth.authz.openfga.team_memberships import ContextualTeamMemberships
+from chroma_auth.authz.openfga.tuple_store import LocalTupleStore, TupleKey, tuple_key
+from chroma_auth.utils import env_bool, env_float, env_int
+from chroma_auth.utils.collection_cache import CollectionRef
+from chroma_auth.utils.ttl_cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
+# OpenFGA truncates ListObjects responses (OPENFGA_LIST_OBJECTS_MAX_RESULTS)
+LIST_OBJECTS_MAX_RESULTS = 1000
+
+# direct: the `can_*` tuples of data/models/model-article-p4.fga; roles: the
+# team/database/collection tuples of data/models/model-article-p4-roles.fga
+MODEL_VARIANTS = ("direct", "roles")
+
+# the relations granted to a collection's writers and readers in the direct model,
+# on its id-keyed object and on its name-keyed object
+WRITER_RELATIONS = frozenset(
+    {
+        "can_add_records",
+        "can_delete_records",
+        "can_update_records",
+        "can_get_records",
+        "can_upsert_records",
+        "can_count_records",
+        "can_query_records",
+        "can_update_collection",
+    }
+)
+WRITER_NAME_RELATIONS = frozenset({"can_get_collection", "can_delete_collection"})
+READER_RELATIONS = frozenset({"can_get_records", "can_query_records", "can_count_records"})
+READER_NAME_RELATIONS = frozenset({"can_get_collection"})
+
 
 class OpenFGAPermissionsAPI(Component):
+    _visible: Optional[TTLCache[Tuple[str, int], FrozenSet[str]]]
+
     def __init__(self, system: System) -> None:
         super().__init__(system)
         self._settings = system.settings
@@ -27,6 +85,45 @@ class OpenFGAPermissionsAPI(Component):
             ServerAuthorizationConfigurationProvider[ClientConfiguration],
             self.require(_cls),
         ).get_configuration()
+        self._fga_client = self.require(SharedOpenFGAClient)
+        self._decision_cache = self.require(OpenFGADecisionCache)
+        self._outbox = self.require(OpenFGATupleOutbox)
+        self._local_tuples = self.require(LocalTupleStore)
+        self._memberships = self.require(ContextualTeamMemberships)
+        # OpenFGA rejects writes with more tuples than this (OPENFGA_MAX_TUPLES_PER_WRITE)
+        self._max_tuples_per_write = env_int("FGA_MAX_TUPLES_PER_WRITE", 100)
+        self._stats_lock = threading.Lock()
+        self._provisioned = 0
+        self._provisioning_seconds_total = 0.0
+        self._last_provisioning_seconds = 0.0
+        self._filter_list_collections = env_bool("FGA_FILTER_LIST_COLLECTIONS", False)
+        _visible_size = env_int("FGA_LIST_OBJECTS_CACHE_SIZE", 1024)
+        self._visible = (
+            TTLCache(
+                capacity=_visible_size,
+                ttl=env_float("FGA_LIST_OBJECTS_CACHE_TTL_SECONDS", 10),
+            )
+            if _visible_size > 0
+            else None
+        )
+        self._list_objects_calls = 0
+        # delete every tuple on a deleted collection, not only those written for it
+        self._purge_deleted_collections = env_bool(
+            "FGA_PURGE_DELETED_COLLECTIONS", False
+        )
+        self._model_variant = os.environ.get("FGA_MODEL_VARIANT", "direct")
+        if self._model_variant not in MODEL_VARIANTS:
+            raise ValueError(
+                f"FGA_MODEL_VARIANT must be one of {MODEL_VARIANTS}, got [{self._model_variant}]"
+            )
+
+    @property
+    def model_variant(self) -> str:
+        return self._model_variant
+
+    @property
+    def filter_list_collections(self) -> bool:
+        return self._filter_list_collections
 
     def create_tenant_permissions(self, create: CreateTenant, request: Request) -> None:
         if not hasattr(request.state, "user_identity"):
@@ -35,14 +132,14 @@ class OpenFGAPermissionsAPI(Component):
         _object = f"tenant:{create.name}"
         _user = identity.attributes['team'] if identity.get_user_attributes() and hasattr(
             identity.get_user_attributes(), "team") else identity.get_user_id()
-        with OpenFgaClient(self._fga_configuration) as fga_client:
-            # Write the relationship tuple
-            fga_client.write_tuples(
-                body=[
-                    ClientTuple(_user, "can_create_database", _object),
-                    ClientTuple(_user, "can_get_database", _object)
-                ]
-            )
+        # Write the relationship tuple
+        self.write(
+            [
+                ClientTuple(_user, "can_create_database", _object),
+                ClientTuple(_user, "can_get_database", _object)
+            ]
+        )
+        self._decision_cache.invalidate_objects([_object])
 
     def create_database_permissions(self, db: CreateDatabase, request: Request) -> None:
         if not hasattr(request.state, "user_identity"):
@@ -52,114 +149,305 @@ class OpenFGAPermissionsAPI(Component):
         _object = f"database:{tenant}:{db.name}"
         _user = identity.attributes['team'] if identity.get_user_attributes() and hasattr(
             identity.get_user_attributes(), "team") else identity.get_user_id()
-        with OpenFgaClient(self._fga_configuration) as fga_client:
-            # Write the relationship tuple
-            fga_client.write_tuples(
-                body=[
-                    ClientTuple(_user, "can_create_collection", _object),
-                    ClientTuple(_user, "can_list_collections", _object),
-                    ClientTuple(_user, "can_get_or_create_collection", _object),
-                    ClientTuple(_user, "can_count_collections", _object),
-                ]
-            )
+        # Write the relationship tuple
+        self.write(
+            [
+                ClientTuple(_user, "can_create_collection", _object),
+                ClientTuple(_user, "can_list_collections", _object),
+                ClientTuple(_user, "can_get_or_create_collection", _object),
+                ClientTuple(_user, "can_count_collections", _object),
+            ]
+        )
+        self._decision_cache.invalidate_objects([_object])
 
-    def create_collection_permissions(self, collection: Collection, request: Request) -> None:
-        if not hasattr(request.state, "user_identity"):
-            return
-        identity = request.state.user_identity  # AuthzUser
-        tenant = request.query_params.get("tenant")
-        database = request.query_params.get("database")
+    @staticmethod
+    def collection_tuples(
+        identity: Any,
+        tenant: str,
+        database: str,
+        collection: Union[Collection, CollectionRef],
+        variant: str = "direct",
+    ) -> Tuple[List[ClientTuple], List[str]]:
+        """The full set of tuples granting the identity (or its team) access to a
+        collection, and the objects they are written on."""
         _object = f"collection:{tenant}-{database}-{collection.id}"
         _object_for_get_collection = f"collection:{tenant}-{database}-{collection.name}"  # this is a bug in the Chroma Authz that feeds in the name of the collection instead of ID
+        if variant == "roles":
+            return (
+                OpenFGAPermissionsAPI.role_tuples(
+                    identity, tenant, database, _object, _object_for_get_collection
+                ),
+                [_object, _object_for_get_collection],
+            )
         _user = f"team:{identity.get_user_attributes()['team']}#owner" if identity.get_user_attributes() and "team" in identity.get_user_attributes() else f"user:{identity.get_user_id()}"
         _user_writer = f"team:{identity.get_user_attributes()['team']}#writer" if identity.get_user_attributes() and "team" in identity.get_user_attributes() else None
         _user_reader = f"team:{identity.get_user_attributes()['team']}#reader" if identity.get_user_attributes() and "team" in identity.get_user_attributes() else None
-        with OpenFgaClient(self._fga_configuration) as fga_client:
-            fga_client.write_tuples(
-                body=[
-                    ClientTuple(_user, "can_add_records", _object),
-                    ClientTuple(_user, "can_delete_records", _object),
-                    ClientTuple(_user, "can_update_records", _object),
-                    ClientTuple(_user, "can_get_records", _object),
-                    ClientTuple(_user, "can_upsert_records", _object),
-                    ClientTuple(_user, "can_count_records", _object),
-                    ClientTuple(_user, "can_query_records", _object),
-                    ClientTuple(_user, "can_get_collection", _object_for_get_collection),
-                    ClientTuple(_user, "can_delete_collection", _object_for_get_collection),
-                    ClientTuple(_user, "can_update_collection", _object),
+        _tuples = []
+        for _u in (_user, _user_writer):
+            if _u:
+                _tuples += [
+                    ClientTuple(_u, "can_add_records", _object),
+                    ClientTuple(_u, "can_delete_records", _object),
+                    ClientTuple(_u, "can_update_records", _object),
+                    ClientTuple(_u, "can_get_records", _object),
+                    ClientTuple(_u, "can_upsert_records", _object),
+                    ClientTuple(_u, "can_count_records", _object),
+                    ClientTuple(_u, "can_query_records", _object),
+                    ClientTuple(_u, "can_get_collection", _object_for_get_collection),
+                    ClientTuple(_u, "can_delete_collection", _object_for_get_collection),
+                    ClientTuple(_u, "can_update_collection", _object),
                 ]
-            )
-            if _user_writer:
-                fga_client.write_tuples(
-                    body=[
-                        ClientTuple(_user_writer, "can_add_records", _object),
-                        ClientTuple(_user_writer, "can_delete_records", _object),
-                        ClientTuple(_user_writer, "can_update_records", _object),
-                        ClientTuple(_user_writer, "can_get_records", _object),
-                        ClientTuple(_user_writer, "can_upsert_records", _object),
-                        ClientTuple(_user_writer, "can_count_records", _object),
-                        ClientTuple(_user_writer, "can_query_records", _object),
-                        ClientTuple(_user_writer, "can_get_collection", _object_for_get_collection),
-                        ClientTuple(_user_writer, "can_delete_collection", _object_for_get_collection),
-                        ClientTuple(_user_writer, "can_update_collection", _object),
-                    ]
+        if _user_reader:
+            _tuples += [
+                ClientTuple(_user_reader, "can_get_records", _object),
+                ClientTuple(_user_reader, "can_query_records", _object),
+                ClientTuple(_user_reader, "can_count_records", _object),
+                ClientTuple(_user_reader, "can_get_collection", _object_for_get_collection),
+            ]
+        return _tuples, [_object, _object_for_get_collection]
+
+    @staticmethod
+    def role_tuples(
+        identity: Any, tenant: str, database: str, object: str, object_for_get: str
+    ) -> List[ClientTuple]:
+        """The tuples of the roles model: the owning team (whose owners, writers and
+        readers get the same access as with the direct model) or user, the parent
+        database, and the link from the name-keyed object to the id-keyed one."""
+        _attributes = identity.get_user_attributes()
+        _owner = (
+            ClientTuple(f"team:{_attributes['team']}", "team", object)
+            if _attributes and "team" in _attributes
+            else ClientTuple(f"user:{identity.get_user_id()}", "owner", object)
+        )
+        return [
+            _owner,
+            ClientTuple(f"database:{tenant}-{database}", "database", object),
+            ClientTuple(object, "collection", object_for_get),
+        ]
+
+    def write(
+        self, writes: Sequence[ClientTuple] = (), deletes: Sequence[ClientTuple] = ()
+    ) -> int:
+        """Write and delete tuples in as few transactional requests as the server's
+        per-write limit allows; returns the number of requests made. With the outbox
+        enabled, the tuples are journaled and written in the background instead."""
+        self._local_tuples.apply(writes, deletes)
+        if self._outbox.enabled:
+            self._outbox.enqueue(writes, deletes)
+            return 0
+        _ops = [(t, True) for t in writes] + [(t, False) for t in deletes]
+        fga_client = self._fga_client.client
+        _requests = 0
+        for _start in range(0, len(_ops), self._max_tuples_per_write):
+            _chunk = _ops[_start:_start + self._max_tuples_per_write]
+            with TUPLE_WRITE_SECONDS.labels("request").time():
+                fga_client.write(
+                    ClientWriteRequest(
+                        writes=[t for t, w in _chunk if w] or None,
+                        deletes=[t for t, w in _chunk if not w] or None,
+                    )
                 )
-            if _user_reader:
-                fga_client.write_tuples(
-                    body=[
-                        ClientTuple(_user_reader, "can_get_records", _object),
-                        ClientTuple(_user_reader, "can_query_records", _object),
-                        ClientTuple(_user_reader, "can_count_records", _object),
-                        ClientTuple(_user_reader, "can_get_collection", _object_for_get_collection),
-                    ]
+            _requests += 1
+        return _requests
+
+    def read(self, object: Optional[str] = None, page_size: int = 100) -> Iterator[Any]:
+        """Page through the tuples in OpenFGA on `object`, or through all of them;
+        yields the SDK's tuples (`key` and `timestamp`)."""
+        _options: Dict[str, Any] = {"page_size": page_size}
+        while True:
+            # the client pops the paging options from the dict it is given
+            _response = self._fga_client.client.read(
+                ReadRequestTupleKey(object=object), dict(_options)
+            )
+            yield from _response.tuples or []
+            if not _response.continuation_token:
+                return
+            _options["continuation_token"] = _response.continuation_token
+
+    def object_tuples(self, objects: Iterable[str]) -> List[ClientTuple]:
+        """Every tuple on `objects`, in OpenFGA or queued in the outbox."""
+        _tuples: Dict[TupleKey, ClientTuple] = {}
+        for _object in objects:
+            for t in self.read(_object):
+                _tuples[tuple_key(t.key)] = ClientTuple(
+                    t.key.user, t.key.relation, t.key.object
                 )
+            _writes, _deletes = self._outbox.pending(_object)
+            for t in _writes:
+                _tuples[tuple_key(t)] = t
+            for t in _deletes:
+                _tuples.pop(tuple_key(t), None)
+        return list(_tuples.values())
+
+    def delete(self, tuples: Sequence[ClientTuple]) -> int:
+        """Delete tuples some of which may already be gone, e.g. deleted by another
+        server since they were read; returns the number of tuples deleted."""
+        _deleted = len(tuples)
+        try:
+            self.write(deletes=tuples)
+        except ValidationException:
+            _deleted = self._delete_each(tuples)
+        self._decision_cache.invalidate_objects({t.object for t in tuples})
+        return _deleted
+
+    def _delete_each(self, tuples: Sequence[ClientTuple]) -> int:
+        # a transactional write fails as a whole: retry the tuples one by one
+        _deleted = 0
+        for t in tuples:
+            try:
+                self.write(deletes=[t])
+                _deleted += 1
+            except ValidationException as e:
+                if "does not exist" not in error_message(e):
+                    raise
+        return _deleted
 
-    def delete_collection_permissions(self, collection: Collection, request: Request) -> None:
+    def purge_objects(self, objects: Iterable[str]) -> int:
+        """Delete every tuple on `objects`; returns the number of tuples deleted."""
+        return self.delete(self.object_tuples(objects))
+
+    def _provision(
+        self,
+        collection: Union[Collection, CollectionRef],
+        writes: Sequence[ClientTuple] = (),
+        deletes: Sequence[ClientTuple] = (),
+    ) -> None:
+        _started_at = time.perf_counter()
+        try:
+            _requests = self.write(writes, deletes)
+        except ValidationException:
+            if writes:
+                raise
+            # the collection's tuples may have been written with the other model
+            # variant (FGA_MODEL_VARIANT), or migrated since
+            _requests = len(deletes)
+            self._delete_each(deletes)
+        _elapsed = time.perf_counter() - _started_at
+        with self._stats_lock:
+            self._provisioned += 1
+            self._provisioning_seconds_total += _elapsed
+            self._last_provisioning_seconds = _elapsed
+        add_attributes_to_current_span(
+            {
+                "fga_provisioning_seconds": _elapsed,
+                "fga_provisioning_tuples": len(writes) + len(deletes),
+                "fga_provisioning_requests": _requests,
+            }
+        )
+        logger.info(
+            f"Provisioned permissions of collection {collection.id} "
+            f"({len(writes)} written, {len(deletes)} deleted, "
+            f"{f'{_requests} requests' if _requests else 'queued'}) "
+            f"in {_elapsed * 1000:.1f}ms"
+        )
+
+    def provisioning_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "collections": self._provisioned,
+                "seconds_total": self._provisioning_seconds_total,
+                "last_seconds": self._last_provisioning_seconds,
+            }
+
+    @staticmethod
+    def collection_object_for_get(tenant: str, database: str, name: str) -> str:
+        """The object `can_get_collection` is checked on (keyed on the name)."""
+        return f"collection:{tenant}-{database}-{name}"
+
+    def visible_collections(self, request: Request) -> Optional[FrozenSet[str]]:
+        """The collection objects the requesting user can get, from one ListObjects
+        call cached per user; None when the request carries no identity."""
         if not hasattr(request.state, "user_identity"):
-            return
-        identity = request.state.user_identity
+            return None
+        _identity = request.state.user_identity
+        _user = f"user:{_identity.get_user_id()}"
+        # any tuple write or invalidation bumps the generation, so a cached set is
+        # only served while no permission changed since it was fetched
+        _generation = self._decision_cache.generation
+        if self._visible is not None:
+            _cached = self._visible.get((_user, _generation))
+            if _cached is not None:
+                return _cached
+        _objects = frozenset(
+            self._list_objects(
+                _user,
+                "can_get_collection",
+                "collection",
+                self._memberships.tuples(
+                    _identity.get_user_id(), _identity.get_user_attributes()
+                ),
+            )
+        )
+        if self._visible is not None:
+            self._visible.set((_user, _generation), _objects)
+        return _objects
 
-        _object = f"collection:{collection.tenant}-{collection.database}-{collection.id}"
-        _object_for_get_collection = f"collection:{collection.tenant}-{collection.database}-{collection.name}"  # this is a bug in the Chroma Authz that feeds in the name of the collection instead of ID
-        _user = f"team:{identity.get_user_attributes()['team']}#owner" if identity.get_user_attributes() and "team" in identity.get_user_attributes() else f"user:{identity.get_user_id()}"
-        _user_writer = f"team:{identity.get_user_attributes()['team']}#writer" if identity.get_user_attributes() and "team" in identity.get_user_attributes() else None
-        _user_reader = f"team:{identity.get_user_attributes()['team']}#reader" if identity.get_user_attributes() and "team" in identity.get_user_attributes() else None
-        with OpenFgaClient(self._fga_configuration) as fga_client:
-            fga_client.delete_tuples(
-                body=[
-                    ClientTuple(_user, "can_add_records", _object),
-                    ClientTuple(_user, "can_delete_records", _object),
-                    ClientTuple(_user, "can_update_records", _object),
-                    ClientTuple(_user, "can_get_records", _object),
-                    ClientTuple(_user, "can_upsert_records", _object),
-                    ClientTuple(_user, "can_count_records", _object),
-                    ClientTuple(_user, "can_query_records", _object),
-                    ClientTuple(_user, "can_get_collection", _object_for_get_collection),
-                    ClientTuple(_user, "can_delete_collection", _object_for_get_collection),
-                    ClientTuple(_user, "can_update_collection", _object),
-                ]
+    def _list_objects(
+        self,
+        user: str,
+        relation: str,
+        type: str,
+        memberships: Sequence[ClientTuple] = (),
+    ) -> List[str]:
+        if self._local_tuples.loaded:
+            # the replica already has the tuples queued in the outbox applied
+            return list(
+                self._local_tuples.list_objects(user, relation, type, memberships)
             )
-            if _user_writer:
-                fga_client.delete_tuples(
-                    body=[
-                        ClientTuple(_user_writer, "can_add_records", _object),
-                        ClientTuple(_user_writer, "can_delete_records", _object),
-                        ClientTuple(_user_writer, "can_update_records", _object),
-                        ClientTuple(_user_writer, "can_get_records", _object),
-                        ClientTuple(_user_writer, "can_upsert_records", _object),
-                        ClientTuple(_user_writer, "can_count_records", _object),
-                        ClientTuple(_user_writer, "can_query_records", _object),
-                        ClientTuple(_user_writer, "can_get_collection", _object_for_get_collection),
-                        ClientTuple(_user_writer, "can_delete_collection", _object_for_get_collection),
-                        ClientTuple(_user_writer, "can_update_collection", _object),
-                    ]
-                )
-            if _user_reader:
-                fga_client.delete_tuples(
-                    body=[
-                        ClientTuple(_user_reader, "can_get_records", _object),
-                        ClientTuple(_user_reader, "can_query_records", _object),
-                        ClientTuple(_user_reader, "can_count_records", _object),
-                        ClientTuple(_user_reader, "can_get_collection", _object_for_get_collection),
-                    ]
-                )
+        _writes, _deletes = self._outbox.pending_of_type(type)
+        _writes = [t for t in _writes if t.relation == relation]
+        _revoked = {t.object for t in _deletes if t.relation == relation}
+        self._list_objects_calls += 1
+        _response: ListObjectsResponse = self._fga_client.client.list_objects(
+            ClientListObjectsRequest(
+                user=user,
+                relation=relation,
+                type=type,
+                # the caller's teams, and queued grants so that a collection
+                # just created shows up
+                contextual_tuples=(list(memberships) + _writes)[:100] or None,
+            )
+        )
+        _objects = _response.objects or []
+        if len(_objects) >= LIST_OBJECTS_MAX_RESULTS:
+            logger.warning(
+                f"ListObjects of {relation} for {user} returned {len(_objects)} "
+                f"objects and may have been truncated"
+            )
+        # a queued revocation may still be in OpenFGA
+        return [o for o in _objects if o not in _revoked]
+
+    def list_objects_stats(self) -> Dict[str, int]:
+        _stats = {"calls": self._list_objects_calls}
+        if self._visible is not None:
+            _stats.update(self._visible.stats())
+        return _stats
+
+    def create_collection_permissions(self, collection: Collection, request: Request) -> None:
+        if not hasattr(request.state, "user_identity"):
+            return
+        identity = request.state.user_identity  # AuthzUser
+        tenant = request.query_params.get("tenant") or DEFAULT_TENANT
+        database = request.query_params.get("database") or DEFAULT_DATABASE
+        _tuples, _objects = self.collection_tuples(
+            identity, tenant, database, collection, self._model_variant
+        )
+        self._provision(collection, writes=_tuples)
+        self._decision_cache.invalidate_objects(_objects)
+
+    def delete_collection_permissions(self, collection: Union[Collection, CollectionRef], request: Request) -> None:
+        if not hasattr(request.state, "user_identity"):
+            return
+        identity = request.state.user_identity
+        _tuples, _objects = self.collection_tuples(
+            identity,
+            collection.tenant,
+            collection.database,
+            collection,
+            self._model_variant,
+        )
+        if self._purge_deleted_collections:
+            # also the grants written on the collection since, e.g. by admins
+            _tuples = self.object_tuples(_objects)
+        self._provision(collection, deletes=_tuples)
+        self._decision_cache.invalidate_objects(_objects)
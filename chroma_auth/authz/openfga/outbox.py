@@ -0,0 +1,354 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from chromadb.config import Component, System
+from openfga_sdk.client.models import ClientTuple, ClientWriteRequest
+from openfga_sdk.exceptions import ValidationException
+from overrides import override
+
+from chroma_auth.authz.openfga.client import SharedOpenFGAClient, error_message
+from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+from chroma_auth.authz.openfga.metrics import TUPLE_WRITE_SECONDS
+from chroma_auth.utils import env_bool, env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+WRITE = "write"
+DELETE = "delete"
+
+# (seq, op, user, relation, object, attempts)
+_Row = Tuple[int, str, str, str, str, int]
+
+
+def _idempotent_failure(e: ValidationException) -> bool:
+    # a retried write may already have been applied by an earlier, timed-out attempt
+    _message = error_message(e)
+    return "already exists" in _message or "does not exist" in _message
+
+
+class OpenFGATupleOutbox(Component):
+    """A durable write-behind journal for permission tuple writes.
+
+    When enabled (`FGA_OUTBOX_ENABLED`), `OpenFGAPermissionsAPI` appends tuple
+    writes and deletes to a local SQLite journal (next to the persist directory)
+    instead of sending them to OpenFGA within the request. A background thread
+    drains the journal in order, in transactional batches, retrying failures with
+    exponential backoff. Until a tuple is drained, `pending` reports it so that the
+    authorization provider can take it into account. The journal is shared by all
+    server processes using the same file and survives restarts.
+
+    Only the process holding the journal's lease drains it, so that entries are sent
+    in order; the lease is renewed on every drain and taken over by another process
+    once it has not been for `FGA_OUTBOX_LEASE_SECONDS`.
+    """
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._enabled = env_bool("FGA_OUTBOX_ENABLED", False)
+        self._path = os.environ.get("FGA_OUTBOX_PATH") or os.path.join(
+            system.settings.persist_directory, "fga_outbox.sqlite3"
+        )
+        self._batch_size = env_int(
+            "FGA_OUTBOX_BATCH_SIZE", env_int("FGA_MAX_TUPLES_PER_WRITE", 100)
+        )
+        self._poll_interval = env_float("FGA_OUTBOX_POLL_SECONDS", 1)
+        self._retry_base = env_float("FGA_OUTBOX_RETRY_BASE_SECONDS", 0.5)
+        self._retry_max = env_float("FGA_OUTBOX_RETRY_MAX_SECONDS", 60)
+        self._max_attempts = env_int("FGA_OUTBOX_MAX_ATTEMPTS", 0)  # 0: retry forever
+        self._lease_ttl = env_float("FGA_OUTBOX_LEASE_SECONDS", 30)
+        self._holder = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._leased = False
+        self._fga_client = self.require(SharedOpenFGAClient)
+        self._decision_cache = self.require(OpenFGADecisionCache)
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._drained = 0
+        self._retries = 0
+        self._last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @override
+    def start(self) -> None:
+        super().start()
+        if not self._enabled:
+            return
+        self._connect()
+        self._stopped.clear()
+        self._worker = threading.Thread(
+            target=self._drain_loop, name="fga-outbox", daemon=True
+        )
+        self._worker.start()
+        logger.info(f"OpenFGA tuple outbox enabled at {self._path}")
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        self._stopped.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        with self._db_lock:
+            if self._db is not None:
+                # hand the journal over to the other processes without delay
+                with self._db:
+                    self._db.execute(
+                        "UPDATE outbox_lease SET expires_at = 0 WHERE holder = ?",
+                        (self._holder,),
+                    )
+                self._db.close()
+                self._db = None
+
+    def _connect(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        _db = sqlite3.connect(self._path, check_same_thread=False, timeout=30)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                user TEXT NOT NULL,
+                relation TEXT NOT NULL,
+                object TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                dead INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS outbox_object ON outbox (object, dead);
+            CREATE TABLE IF NOT EXISTS outbox_lease (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """
+        )
+        _db.commit()
+        with self._db_lock:
+            self._db = _db
+
+    def enqueue(
+        self, writes: Sequence[ClientTuple] = (), deletes: Sequence[ClientTuple] = ()
+    ) -> None:
+        """Durably journal tuple writes and deletes, in order, in one transaction."""
+        _now = time.time()
+        _rows = [(WRITE, t.user, t.relation, t.object, _now) for t in writes] + [
+            (DELETE, t.user, t.relation, t.object, _now) for t in deletes
+        ]
+        with self._db_lock:
+            if self._db is None:
+                raise RuntimeError("The OpenFGA tuple outbox is not running")
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO outbox (op, user, relation, object, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    _rows,
+                )
+        self._wakeup.set()
+
+    def pending(self, object: str) -> Tuple[List[ClientTuple], List[ClientTuple]]:
+        """The not yet drained (writes, deletes) on `object`, latest op per tuple."""
+        return self._pending("object = ?", object)
+
+    def pending_of_type(self, type: str) -> Tuple[List[ClientTuple], List[ClientTuple]]:
+        """The not yet drained (writes, deletes) on any object of `type`."""
+        return self._pending("object >= ? AND object < ?", f"{type}:", f"{type};")
+
+    def _pending(
+        self, where: str, *args: str
+    ) -> Tuple[List[ClientTuple], List[ClientTuple]]:
+        if not self._enabled:
+            return [], []
+        with self._db_lock:
+            if self._db is None:
+                return [], []
+            _rows = self._db.execute(
+                "SELECT op, user, relation, object FROM outbox "
+                f"WHERE {where} AND dead = 0 ORDER BY seq",
+                args,
+            ).fetchall()
+        _latest: Dict[Tuple[str, str, str], str] = {}
+        for op, user, relation, object in _rows:
+            _latest[(user, relation, object)] = op
+        _writes = [ClientTuple(*key) for key, op in _latest.items() if op == WRITE]
+        _deletes = [ClientTuple(*key) for key, op in _latest.items() if op == DELETE]
+        return _writes, _deletes
+
+    def _acquire_lease(self) -> bool:
+        """Take or renew the lease on the journal; False if another process holds
+        it."""
+        _now = time.time()
+        with self._db_lock:
+            if self._db is None:
+                return False
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO outbox_lease (id, holder, expires_at) VALUES (0, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET holder = excluded.holder, "
+                    "expires_at = excluded.expires_at "
+                    "WHERE outbox_lease.holder = excluded.holder "
+                    "OR outbox_lease.expires_at < ?",
+                    (self._holder, _now + self._lease_ttl, _now),
+                )
+                (_holder,) = self._db.execute(
+                    "SELECT holder FROM outbox_lease WHERE id = 0"
+                ).fetchone()
+        if (_holder == self._holder) != self._leased:
+            self._leased = _holder == self._holder
+            logger.info(
+                "Draining the OpenFGA tuple outbox"
+                if self._leased
+                else f"The OpenFGA tuple outbox is drained by {_holder}"
+            )
+        return self._leased
+
+    def _next_batch(self) -> List[_Row]:
+        with self._db_lock:
+            if self._db is None:
+                return []
+            _rows = self._db.execute(
+                "SELECT seq, op, user, relation, object, attempts, next_attempt_at "
+                "FROM outbox WHERE dead = 0 ORDER BY seq LIMIT ?",
+                (self._batch_size,),
+            ).fetchall()
+        # entries are applied strictly in order, so a backing-off head holds up the
+        # entries behind it
+        if not _rows or _rows[0][6] > time.time():
+            return []
+        # OpenFGA rejects a request touching the same tuple twice, so a batch ends
+        # before the first repeated tuple
+        _batch: List[_Row] = []
+        _seen = set()
+        for row in _rows:
+            if row[2:5] in _seen:
+                break
+            _seen.add(row[2:5])
+            _batch.append(row[:6])
+        return _batch
+
+    def _drain_loop(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                _drained = self.drain_once()
+            except Exception as e:
+                logger.error(f"Error while draining the OpenFGA tuple outbox: {str(e)}")
+                _drained = 0
+            if not _drained:
+                self._wakeup.wait(self._poll_interval)
+                self._wakeup.clear()
+
+    def drain_once(self) -> int:
+        """Send the next batch to OpenFGA; returns the number of drained entries."""
+        if not self._acquire_lease():
+            return 0
+        _batch = self._next_batch()
+        if not _batch:
+            return 0
+        try:
+            self._send(_batch)
+        except ValidationException:
+            # find the offending entries one by one
+            return sum(self._drain_single(row) for row in _batch)
+        except Exception as e:
+            self._retry(_batch, e)
+            return 0
+        self._done(_batch)
+        return len(_batch)
+
+    def _drain_single(self, row: _Row) -> int:
+        try:
+            self._send([row])
+        except ValidationException as e:
+            if not _idempotent_failure(e):
+                self._bury(row, e)
+                return 0
+        except Exception as e:
+            self._retry([row], e)
+            return 0
+        self._done([row])
+        return 1
+
+    def _send(self, rows: List[_Row]) -> None:
+        _writes = [ClientTuple(u, r, o) for _, op, u, r, o, _ in rows if op == WRITE]
+        _deletes = [ClientTuple(u, r, o) for _, op, u, r, o, _ in rows if op == DELETE]
+        with TUPLE_WRITE_SECONDS.labels("outbox").time():
+            self._fga_client.client.write(
+                ClientWriteRequest(writes=_writes or None, deletes=_deletes or None)
+            )
+
+    def _done(self, rows: List[_Row]) -> None:
+        with self._db_lock, self._db:  # type: ignore
+            self._db.executemany(  # type: ignore
+                "DELETE FROM outbox WHERE seq = ?", [(row[0],) for row in rows]
+            )
+        self._drained += len(rows)
+        # decisions made while the entries were queued assumed their writes, but
+        # not their deletes, beyond the revoked relation
+        self._decision_cache.invalidate_objects({row[4] for row in rows})
+
+    def _retry(self, rows: List[_Row], e: Exception) -> None:
+        _attempts = max(row[5] for row in rows) + 1
+        if self._max_attempts and _attempts >= self._max_attempts:
+            for row in rows:
+                self._bury(row, e)
+            return
+        _backoff = min(self._retry_max, self._retry_base * 2 ** (_attempts - 1))
+        _next_attempt_at = time.time() + _backoff * random.uniform(0.5, 1.0)
+        with self._db_lock, self._db:  # type: ignore
+            self._db.executemany(  # type: ignore
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? "
+                "WHERE seq = ?",
+                [(_attempts, _next_attempt_at, str(e), row[0]) for row in rows],
+            )
+        self._retries += 1
+        self._last_error = str(e)
+        logger.warning(
+            f"OpenFGA tuple outbox write failed (attempt {_attempts}), "
+            f"retrying in {_backoff:.1f}s: {str(e)}"
+        )
+
+    def _bury(self, row: _Row, e: Exception) -> None:
+        with self._db_lock, self._db:  # type: ignore
+            self._db.execute(  # type: ignore
+                "UPDATE outbox SET dead = 1, last_error = ? WHERE seq = ?",
+                (str(e), row[0]),
+            )
+        self._last_error = str(e)
+        # decisions may have been made with this tuple assumed to be written
+        self._decision_cache.invalidate_objects([row[4]])
+        logger.error(
+            f"OpenFGA tuple outbox gave up on {row[1]} of "
+            f"({row[2]}, {row[3]}, {row[4]}): {str(e)}"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        _pending, _dead, _oldest = 0, 0, None
+        with self._db_lock:
+            if self._db is not None:
+                _pending, _dead, _oldest = self._db.execute(
+                    "SELECT SUM(dead = 0), SUM(dead = 1), MIN(CASE WHEN dead = 0 "
+                    "THEN created_at END) FROM outbox"
+                ).fetchone()
+        return {
+            "pending": _pending or 0,
+            "dead": _dead or 0,
+            "oldest_pending_age_seconds": time.time() - _oldest if _oldest else 0.0,
+            "drained": self._drained,
+            "draining": self._leased,
+            "retries": self._retries,
+            "last_error": self._last_error,
+        }
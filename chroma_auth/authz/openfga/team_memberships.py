@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from chromadb.config import Component, System
+from openfga_sdk.client.models import ClientTuple
+
+from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+
+logger = logging.getLogger(__name__)
+
+# the relations of a team a groupfile membership can stand for
+TEAM_RELATIONS = ("owner", "writer", "reader")
+# a roles file entry for every groupfile member of the team
+ALL_MEMBERS = "*"
+# how often the roles file is looked at for changes
+RELOAD_CHECK_SECONDS = 1.0
+
+# team -> (relations of every member, user -> relations)
+TeamRoles = Dict[str, Tuple[FrozenSet[str], Dict[str, FrozenSet[str]]]]
+
+
+def load_team_roles(file: str) -> TeamRoles:
+    """Parses a team roles file: one `<team>#<relation>: <user1>, ..., <userN>` line
+    per team relation, with `*` standing for every groupfile member of the team."""
+    _all: Dict[str, Set[str]] = {}
+    _users: Dict[str, Dict[str, Set[str]]] = {}
+    with open(file, "r") as f:
+        for _number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            _userset, _, _members = line.partition(":")
+            _team, _, _relation = _userset.strip().partition("#")
+            if not _team or _relation not in TEAM_RELATIONS or not _members.strip():
+                raise ValueError(
+                    f"Invalid team roles entry at [{file}:{_number}]. Must be "
+                    f"<team>#<{'|'.join(TEAM_RELATIONS)}>: <user1>,...,<userN> or *."
+                )
+            for _member in _members.split(","):
+                _member = _member.strip()
+                if _member == ALL_MEMBERS:
+                    _all.setdefault(_team, set()).add(_relation)
+                elif _member:
+                    _users.setdefault(_team, {}).setdefault(_member, set()).add(
+                        _relation
+                    )
+    return {
+        _team: (
+            frozenset(_all.get(_team, ())),
+            {u: frozenset(r) for u, r in _users.get(_team, {}).items()},
+        )
+        for _team in set(_all) | set(_users)
+    }
+
+
+class ContextualTeamMemberships(Component):
+    """The team memberships of a caller, as contextual tuples for checks and
+    ListObjects calls.
+
+    The server already knows a user's teams from the groupfile (the `teams`
+    attribute of its identity), but not its role in them. With
+    `FGA_CONTEXTUAL_TEAM_ROLES_FILE` set, the roles file maps the members of each
+    team to their relations (`owner`, `writer`, `reader`), and each of a caller's
+    teams is sent as one `user:<id> <relation> team:<team>` tuple per mapped
+    relation, so that resolving a `team:<team>#<relation>` userset reads no
+    membership from OpenFGA's datastore. A team the caller is not mapped a role in
+    is not sent, and its memberships are read from the store as before, so the
+    option never grants a relation that is not written down. Teams in
+    `FGA_CONTEXTUAL_TEAM_EXCLUDE` (by default `public`, the team of users missing
+    from the groupfile) are not sent either. The file is reloaded when it changes;
+    a malformed file keeps the last good roles.
+    """
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        if os.environ.get("FGA_CONTEXTUAL_TEAM_RELATION"):
+            raise ValueError(
+                "FGA_CONTEXTUAL_TEAM_RELATION is no longer supported, as it gave "
+                "every team member the same relation; map each team's members to "
+                "their relations in FGA_CONTEXTUAL_TEAM_ROLES_FILE instead"
+            )
+        self._file = os.environ.get("FGA_CONTEXTUAL_TEAM_ROLES_FILE") or None
+        self._exclude = frozenset(
+            t.strip()
+            for t in os.environ.get("FGA_CONTEXTUAL_TEAM_EXCLUDE", "public").split(",")
+            if t.strip()
+        )
+        self._decision_cache = self.require(OpenFGADecisionCache)
+        self._roles: TeamRoles = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        if self._file is not None:
+            self._signature = self._stat()
+            self._roles = load_team_roles(self._file)
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            _st = os.stat(self._file)  # type: ignore
+            return _st.st_mtime_ns, _st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _current_roles(self) -> TeamRoles:
+        _now = time.monotonic()
+        if _now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return self._roles
+        with self._lock:
+            if _now - self._checked_at < RELOAD_CHECK_SECONDS:
+                return self._roles
+            self._checked_at = _now
+            _signature = self._stat()
+            if _signature == self._signature:
+                return self._roles
+            # taken before parsing, so a write racing the parse is picked up next
+            self._signature = _signature
+            try:
+                _roles = load_team_roles(self._file)  # type: ignore
+            except Exception as e:
+                logger.error(f"Failed to reload team roles, keeping the last: {e!r}")
+                return self._roles
+            self._roles = _roles
+        # decisions were made with the previous roles; changes are rare enough
+        # not to work out whose
+        self._decision_cache.clear()
+        logger.info(f"Reloaded team roles for {len(_roles)} teams")
+        return _roles
+
+    def relations(self, user_id: str, team: str) -> FrozenSet[str]:
+        """The relations of `user_id` to `team` in the roles file."""
+        _all, _users = self._current_roles().get(team, (frozenset(), {}))
+        return _all | _users.get(user_id, frozenset())
+
+    def tuples(
+        self, user_id: str, attributes: Optional[Dict[str, Any]]
+    ) -> List[ClientTuple]:
+        """The memberships of `user_id` in the teams of its identity attributes, in
+        the relations the roles file maps it to."""
+        if self._file is None:
+            return []
+        _attributes = attributes or {}
+        _teams = _attributes.get("teams") or (
+            (_attributes["team"],) if "team" in _attributes else ()
+        )
+        return [
+            ClientTuple(f"user:{user_id}", r, f"team:{t}")
+            for t in _teams
+            if t not in self._exclude
+            for r in sorted(self.relations(user_id, t))
+        ]
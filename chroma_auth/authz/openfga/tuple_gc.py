@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from chromadb.config import Component, System
+from chromadb.db.system import SysDB
+from openfga_sdk.client.models import ClientTuple
+from overrides import override
+
+from chroma_auth.authz.openfga.change_feed import parse_timestamp
+from chroma_auth.authz.openfga.openfga_permissions import OpenFGAPermissionsAPI
+from chroma_auth.utils import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_PREFIX = "collection:"
+
+
+class OpenFGATupleCollector(Component):
+    """Deletes orphaned tuples: tuples on `collection:` objects of collections that
+    no longer exist in the sysdb, e.g. grants added by admins, the name-keyed
+    tuples of renamed collections and tuples left by failed deletes.
+
+    A run lists the live collections, then pages through the tuples of the store
+    and deletes those on other collection objects in batches. Tuples younger than
+    `FGA_GC_MIN_AGE_SECONDS` at the start of the run are kept, as they may belong
+    to a collection created since the sysdb was read. Runs every
+    `FGA_GC_INTERVAL_SECONDS` when set (on a single server, ideally), or on demand
+    with `collect()` or `python -m chroma_auth.tools.gc_tuples`.
+    """
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._interval = env_float("FGA_GC_INTERVAL_SECONDS", 0)
+        self._min_age = env_float("FGA_GC_MIN_AGE_SECONDS", 300)
+        self._max_deletes = env_int("FGA_GC_MAX_DELETES", 100000)
+        self._page_size = env_int("FGA_GC_PAGE_SIZE", 100)
+        self._batch_size = env_int("FGA_MAX_TUPLES_PER_WRITE", 100)
+        self._sysdb = self.require(SysDB)
+        self._permissions = self.require(OpenFGAPermissionsAPI)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._runs = 0
+        self._deleted = 0
+        self._errors = 0
+        self._last_run: Optional[Dict[str, Any]] = None
+        self._last_error: Optional[str] = None
+
+    @override
+    def start(self) -> None:
+        super().start()
+        if self._interval <= 0:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._collect_loop, name="fga-tuple-gc", daemon=True
+        )
+        self._thread.start()
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _collect_loop(self) -> None:
+        while not self._stopped.wait(self._interval):
+            try:
+                self.collect()
+            except Exception as e:
+                self._errors += 1
+                self._last_error = str(e)
+                logger.error(f"Error while collecting orphaned OpenFGA tuples: {e}")
+
+    def live_objects(self) -> Set[str]:
+        """The objects of the collections in the sysdb, by id and by name."""
+        _objects = set()
+        # no tenant and database: the collections of all of them
+        _collections = self._sysdb.get_collections(
+            tenant=None, database=None  # type: ignore
+        )
+        for c in _collections:
+            _tenant, _database = c["tenant"], c["database"]
+            _objects.add(f"{COLLECTION_PREFIX}{_tenant}-{_database}-{c['id']}")
+            _objects.add(
+                OpenFGAPermissionsAPI.collection_object_for_get(
+                    _tenant, _database, c["name"]
+                )
+            )
+        return _objects
+
+    def collect(
+        self, dry_run: bool = False, min_age: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Find and, unless `dry_run`, delete the orphaned tuples; returns the
+        statistics of the run. At most `FGA_GC_MAX_DELETES` tuples are deleted per
+        run; the next run continues with the rest."""
+        with self._lock:
+            _started_at = time.perf_counter()
+            # tuples are written after their collection is created, so a tuple older
+            # than the sysdb snapshot is not on a collection missing from it
+            _cutoff = time.time() - (self._min_age if min_age is None else min_age)
+            _live = self.live_objects()
+            _scanned = _young = 0
+            _orphans: List[ClientTuple] = []
+            _objects: Set[str] = set()
+            # deleting while paging could make the store skip tuples, so orphans are
+            # deleted once the scan is done
+            for t in self._permissions.read(page_size=self._page_size):
+                _scanned += 1
+                _key = t.key
+                if not _key.object.startswith(COLLECTION_PREFIX):
+                    continue
+                if _key.object in _live:
+                    continue
+                if t.timestamp is not None and parse_timestamp(t.timestamp) > _cutoff:
+                    _young += 1
+                    continue
+                _orphans.append(ClientTuple(_key.user, _key.relation, _key.object))
+                _objects.add(_key.object)
+                if len(_orphans) >= self._max_deletes:
+                    break
+            _deleted = 0
+            if not dry_run:
+                for _start in range(0, len(_orphans), self._batch_size):
+                    _deleted += self._permissions.delete(
+                        _orphans[_start : _start + self._batch_size]
+                    )
+            _run = {
+                "dry_run": dry_run,
+                "live_objects": len(_live),
+                "scanned": _scanned,
+                "orphaned": len(_orphans),
+                "orphaned_objects": len(_objects),
+                "young": _young,
+                "deleted": _deleted,
+                "complete": len(_orphans) < self._max_deletes,
+                "seconds": time.perf_counter() - _started_at,
+            }
+            self._runs += 1
+            self._deleted += _deleted
+            self._last_run = _run
+        logger.info(
+            f"{'Found' if dry_run else 'Deleted'} "
+            f"{len(_orphans) if dry_run else _deleted} "
+            f"orphaned tuples on {len(_objects)} collection objects, "
+            f"{_scanned} tuples scanned in {_run['seconds']:.1f}s"
+        )
+        return _run
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self._runs,
+            "deleted": self._deleted,
+            "errors": self._errors,
+            "last_run": self._last_run,
+            "last_error": self._last_error,
+        }
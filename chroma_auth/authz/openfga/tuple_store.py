@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from chromadb.config import Component, System
+
+from chroma_auth.authz.openfga.model import (
+    AuthorizationModel,
+    Computed,
+    Direct,
+    TupleToUserset,
+)
+
+logger = logging.getLogger(__name__)
+
+TupleKey = Tuple[str, str, str]  # (user, relation, object)
+
+# OpenFGA's default resolution depth limit
+MAX_DEPTH = 25
+
+# the model of each FGA_MODEL_VARIANT, in FGA_LOCAL_MODEL_DIR
+MODEL_FILES = {
+    "direct": "model-article-p4.fga",
+    "roles": "model-article-p4-roles.fga",
+}
+
+
+def tuple_key(t: Any) -> TupleKey:
+    """Accepts a ClientTuple/TupleKey-like object or a {user, relation, object} dict."""
+    if isinstance(t, dict):
+        return t["user"], t["relation"], t["object"]
+    return t.user, t.relation, t.object
+
+
+class _Index:
+    """Tuples indexed by (object, relation): the plain users (`type:id`, `type:*`)
+    and the usersets (`type:id#relation`) related to it; and in reverse, by user
+    or userset: the (object, relation) pairs it is related to."""
+
+    def __init__(self) -> None:
+        self.users: Dict[Tuple[str, str], FrozenSet[str]] = {}
+        self.usersets: Dict[Tuple[str, str], FrozenSet[Tuple[str, str]]] = {}
+        self.objects: Dict[str, FrozenSet[Tuple[str, str]]] = {}
+
+    def add(self, user: str, relation: str, object: str) -> bool:
+        _key = (object, relation)
+        if "#" in user:
+            _userset = tuple(user.split("#", 1))
+            _current = self.usersets.get(_key, frozenset())
+            if _userset in _current:
+                return False
+            # sets are replaced, never mutated, so readers need no lock
+            self.usersets[_key] = _current | {_userset}  # type: ignore
+        else:
+            _current_users = self.users.get(_key, frozenset())
+            if user in _current_users:
+                return False
+            self.users[_key] = _current_users | {user}
+        self.objects[user] = self.objects.get(user, frozenset()) | {_key}
+        return True
+
+    def remove(self, user: str, relation: str, object: str) -> bool:
+        _key = (object, relation)
+        _index: Dict[Tuple[str, str], FrozenSet[Any]]
+        _member: Any
+        if "#" in user:
+            _index, _member = self.usersets, tuple(user.split("#", 1))
+        else:
+            _index, _member = self.users, user
+        _current = _index.get(_key, frozenset())
+        if _member not in _current:
+            return False
+        if len(_current) == 1:
+            _index.pop(_key, None)
+        else:
+            _index[_key] = _current - {_member}
+        _objects = self.objects.get(user, frozenset()) - {_key}
+        if _objects:
+            self.objects[user] = _objects
+        else:
+            self.objects.pop(user, None)
+        return True
+
+
+class LocalTupleStore(Component):
+    """An in-memory replica of the relationship tuples, evaluated against the
+    authorization model without a round trip to OpenFGA.
+
+    The model is parsed from the DSL (`FGA_LOCAL_MODEL_FILE`, by default the model
+    of `FGA_MODEL_VARIANT` in `FGA_LOCAL_MODEL_DIR`) and the tuples are
+    loaded from a JSON file of `{user, relation, object}` entries
+    (`FGA_LOCAL_TUPLES_FILE`). The replica only does work once `load()` has been
+    called, i.e. when the local authorization provider is in use; tuple writers
+    call `apply()` so that their changes are visible immediately.
+    """
+
+    _model: Optional[AuthorizationModel]
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        _variant = os.environ.get("FGA_MODEL_VARIANT", "direct")
+        if _variant not in MODEL_FILES:
+            raise ValueError(
+                f"FGA_MODEL_VARIANT must be one of {tuple(MODEL_FILES)}, got [{_variant}]"
+            )
+        self._model_file = os.environ.get("FGA_LOCAL_MODEL_FILE") or os.path.join(
+            os.environ.get("FGA_LOCAL_MODEL_DIR", "data/models"), MODEL_FILES[_variant]
+        )
+        self._tuples_file = os.environ.get(
+            "FGA_LOCAL_TUPLES_FILE", "data/data/initial-data.json"
+        )
+        self._model = None
+        # (type, relation) -> the relations of the type it is a computed part of
+        self._computed_in: Dict[Tuple[str, str], List[str]] = {}
+        # relation -> (type, relation, tupleset) of the tuple-to-usersets reading it
+        self._tuple_to_usersets_of: Dict[str, List[Tuple[str, str, str]]] = {}
+        self._index = _Index()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self) -> Optional[AuthorizationModel]:
+        return self._model
+
+    def load(self) -> None:
+        with self._lock:
+            if self._model is not None:
+                return
+            _model = AuthorizationModel.from_file(self._model_file)
+            _tuples: List[Any] = []
+            if self._tuples_file:
+                with open(self._tuples_file, "r") as f:
+                    _tuples = json.load(f)
+            self._model = _model
+            self._index_rewrites(_model)
+            self._apply_locked([tuple_key(t) for t in _tuples], [])
+            self._loaded_at = time.time()
+        logger.info(
+            f"Loaded {self._size} tuples from {self._tuples_file} "
+            f"for model {self._model_file}"
+        )
+
+    def _index_rewrites(self, model: AuthorizationModel) -> None:
+        for _type, _relations in model.type_definitions.items():
+            for _relation, _rewrites in _relations.items():
+                for _rewrite in _rewrites:
+                    if isinstance(_rewrite, Computed):
+                        self._computed_in.setdefault(
+                            (_type, _rewrite.relation), []
+                        ).append(_relation)
+                    elif isinstance(_rewrite, TupleToUserset):
+                        self._tuple_to_usersets_of.setdefault(
+                            _rewrite.relation, []
+                        ).append((_type, _relation, _rewrite.tupleset))
+
+    def apply(self, writes: Iterable[Any] = (), deletes: Iterable[Any] = ()) -> None:
+        """Apply tuple writes and deletes (objects or dicts) to the replica."""
+        if self._model is None:
+            return
+        with self._lock:
+            self._apply_locked(
+                [tuple_key(t) for t in writes], [tuple_key(t) for t in deletes]
+            )
+
+    def replace(self, tuples: Iterable[Any]) -> None:
+        """Replace the contents of the replica."""
+        if self._model is None:
+            return
+        with self._lock:
+            self._index = _Index()
+            self._size = 0
+            self._apply_locked([tuple_key(t) for t in tuples], [])
+            self._loaded_at = time.time()
+
+    def _apply_locked(self, writes: List[TupleKey], deletes: List[TupleKey]) -> None:
+        assert self._model is not None
+        for user, relation, object in writes:
+            if not self._model.allows(object.split(":", 1)[0], relation, user):
+                logger.warning(
+                    f"Ignoring tuple ({user}, {relation}, {object}) not allowed by the model"
+                )
+                continue
+            self._size += self._index.add(user, relation, object)
+        for user, relation, object in deletes:
+            self._size -= self._index.remove(user, relation, object)
+
+    def check(
+        self,
+        user: str,
+        relation: str,
+        object: str,
+        contextual_tuples: Iterable[Any] = (),
+    ) -> bool:
+        """Whether `user` has `relation` on `object`, like OpenFGA's Check."""
+        if self._model is None:
+            raise RuntimeError("The local tuple store has not been loaded")
+        _contextual: Optional[_Index] = None
+        for t in contextual_tuples:
+            _contextual = _contextual or _Index()
+            _contextual.add(*tuple_key(t))
+        return self._check(user, relation, object, _contextual, set(), 0)
+
+    def list_objects(
+        self,
+        user: str,
+        relation: str,
+        type: str,
+        contextual_tuples: Iterable[Any] = (),
+    ) -> Set[str]:
+        """The objects of `type` on which `user` has `relation`, like ListObjects.
+
+        Rather than checking every object, the relations of `user` are expanded
+        from its tuples through the reverse index: a relation on an object grants
+        the usersets of that relation, the relations it is computed into, and the
+        tuple-to-usersets of the objects it is linked to.
+        """
+        if self._model is None:
+            raise RuntimeError("The local tuple store has not been loaded")
+        _contextual: Optional[_Index] = None
+        for t in contextual_tuples:
+            _contextual = _contextual or _Index()
+            _contextual.add(*tuple_key(t))
+        _indexes = (self._index, _contextual) if _contextual else (self._index,)
+        _model = self._model
+
+        def _related(user: str) -> Iterator[Tuple[str, str]]:
+            for _index in _indexes:
+                yield from _index.objects.get(user, ())
+
+        def _direct(object: str, relation: str) -> bool:
+            return any(
+                isinstance(r, Direct)
+                for r in _model.rewrites(object.split(":", 1)[0], relation)
+            )
+
+        _granted: Set[Tuple[str, str]] = set()
+        _pending = [
+            _key
+            for _user in (user, f"{user.split(':', 1)[0]}:*")
+            for _key in _related(_user)
+            if _direct(*_key)
+        ]
+        while _pending:
+            _object, _relation = _key = _pending.pop()
+            if _key in _granted:
+                continue
+            _granted.add(_key)
+            _object_type = _object.split(":", 1)[0]
+            _pending.extend(
+                k for k in _related(f"{_object}#{_relation}") if _direct(*k)
+            )
+            _pending.extend(
+                (_object, r)
+                for r in self._computed_in.get((_object_type, _relation), ())
+            )
+            for _type, _ttu_relation, _tupleset in self._tuple_to_usersets_of.get(
+                _relation, ()
+            ):
+                _pending.extend(
+                    (_child, _ttu_relation)
+                    for _child, _child_tupleset in _related(_object)
+                    if _child_tupleset == _tupleset
+                    and _child.split(":", 1)[0] == _type
+                )
+        return {
+            _object
+            for _object, _relation in _granted
+            if _relation == relation and _object.split(":", 1)[0] == type
+        }
+
+    def _check(
+        self,
+        user: str,
+        relation: str,
+        object: str,
+        contextual: Optional[_Index],
+        visited: Set[TupleKey],
+        depth: int,
+    ) -> bool:
+        if depth > MAX_DEPTH:
+            raise RecursionError(
+                f"Resolution depth exceeded while checking {relation} on {object}"
+            )
+        _key = (user, relation, object)
+        if _key in visited:
+            return False
+        visited.add(_key)
+        _indexes = (self._index, contextual) if contextual else (self._index,)
+        _user_type = user.split(":", 1)[0]
+        for _rewrite in self._model.rewrites(object.split(":", 1)[0], relation):  # type: ignore
+            if isinstance(_rewrite, Direct):
+                for _index in _indexes:
+                    _users = _index.users.get((object, relation), ())
+                    if user in _users or f"{_user_type}:*" in _users:
+                        return True
+                for _index in _indexes:
+                    for _userset_object, _userset_relation in _index.usersets.get(
+                        (object, relation), ()
+                    ):
+                        if self._check(
+                            user,
+                            _userset_relation,
+                            _userset_object,
+                            contextual,
+                            visited,
+                            depth + 1,
+                        ):
+                            return True
+            elif isinstance(_rewrite, Computed):
+                if self._check(
+                    user, _rewrite.relation, object, contextual, visited, depth + 1
+                ):
+                    return True
+            elif isinstance(_rewrite, TupleToUserset):
+                for _index in _indexes:
+                    for _parent in _index.users.get((object, _rewrite.tupleset), ()):
+                        if self._check(
+                            user,
+                            _rewrite.relation,
+                            _parent,
+                            contextual,
+                            visited,
+                            depth + 1,
+                        ):
+                            return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "tuples": self._size,
+            "loaded_at": self._loaded_at,
+        }
@@ -1,36 +1,62 @@
-from typing import Any, Callable, Dict, List, Sequence, Optional
+import inspect
+import os
+import time
+from functools import partial, wraps
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Sequence,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 import fastapi
 from fastapi import FastAPI as _FastAPI, Response
 from fastapi.responses import JSONResponse
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.routing import Match
 from fastapi import HTTPException, status
 from uuid import UUID
 from chromadb.api.models.Collection import Collection
 from chromadb.api.types import GetResult, QueryResult
 from chromadb.auth import (
+    AuthorizationContext,
+    AuthzAction,
     AuthzDynamicParams,
+    AuthzResource,
     AuthzResourceActions,
     AuthzResourceTypes,
+    AuthzUser,
     DynamicAuthzResource,
+    ServerAuthCredentialsProvider,
+    ServerAuthorizationProvider,
 )
 from chromadb.auth.fastapi import (
     FastAPIChromaAuthMiddleware,
     FastAPIChromaAuthMiddlewareWrapper,
     FastAPIChromaAuthzMiddleware,
     FastAPIChromaAuthzMiddlewareWrapper,
-    authz_context,
+    FastAPIServerAuthenticationRequest,
+    authz_provider as chroma_authz_provider,
+    request_var,
     set_overwrite_singleton_tenant_database_access_from_auth,
 )
-from chromadb.auth.fastapi_utils import (
-    attr_from_collection_lookup,
-    attr_from_resource_object,
-)
+from chromadb.auth.registry import resolve_provider
+from chromadb.auth.fastapi_utils import attr_from_resource_object
 from chromadb.config import DEFAULT_DATABASE, DEFAULT_TENANT, Settings, System
 import chromadb.api
+import chromadb.auth.fastapi
 from chromadb.api import ServerAPI
 from chromadb.errors import (
+    AuthorizationError,
     ChromaError,
     InvalidDimensionException,
     InvalidHTTPVersion,
@@ -48,9 +74,26 @@ from chromadb.server.fastapi.types import (
     UpdateEmbedding,
 )
 from starlette.requests import Request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
 
 import logging
 
+from chroma_auth.authn.basic import MultiUserHtpasswdFileServerAuthCredentialsProvider
+from chroma_auth.authn.basic.verifier import AuthenticationOverloadedError
+from chroma_auth.instr.metrics import (
+    AUTHZ_SECONDS,
+    ComponentMetricsRefresher,
+    update_component_metrics,
+)
+from chroma_auth.utils import env_bool
+from chroma_auth.utils.collection_cache import CollectionMetadataCache, CollectionRef
+
 from chromadb.utils.fastapi import fastapi_json_response, string_to_uuid as _uuid
 from chromadb.telemetry.opentelemetry.fastapi import instrument_fastapi
 from chromadb.types import Database, Tenant
@@ -65,6 +108,12 @@ from chromadb.telemetry.opentelemetry import (
 
 logger = logging.getLogger(__name__)
 
+# the request header asking for a session token along with the response, and the
+# response headers carrying the token issued for the request's basic auth credentials
+SESSION_REQUEST_HEADER = "X-Chroma-Session-Request"
+SESSION_TOKEN_HEADER = "X-Chroma-Session-Token"
+SESSION_EXPIRES_HEADER = "X-Chroma-Session-Expires"
+
 
 def use_route_names_as_operation_ids(app: _FastAPI) -> None:
     """
@@ -89,6 +138,46 @@ async def catch_exceptions_middleware(
         return JSONResponse(content={"error": repr(e)}, status_code=500)
 
 
+async def catch_auth_overload_middleware(
+        request: Request, call_next: Callable[[Request], Any]
+) -> Response:
+    # Must wrap the auth middleware, whose errors bypass catch_exceptions_middleware
+    try:
+        return await call_next(request)
+    except AuthenticationOverloadedError as e:
+        response = fastapi_json_response(e)
+        response.headers["Retry-After"] = "1"
+        return response
+
+
+class ThreadpoolAuthMiddlewareWrapper(FastAPIChromaAuthMiddlewareWrapper):
+    """
+    Chroma's auth middleware, with `authenticate` run in the request threadpool
+    instead of on the event loop. A password verification (bcrypt, or waiting on
+    the verifier pool) then only holds the worker thread of its own request: other
+    logins verify concurrently, up to the pool's admission limit, and requests that
+    need no authentication (e.g. /heartbeat) are not delayed behind them.
+    """
+
+    @trace_method(
+        "ThreadpoolAuthMiddlewareWrapper.dispatch", OpenTelemetryGranularity.ALL
+    )
+    async def dispatch(
+            self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        if self._middleware.ignore_operation(request.method, request.url.path):
+            return await call_next(request)
+        # AuthenticationOverloadedError is re-raised here, for
+        # catch_auth_overload_middleware
+        response = await run_in_threadpool(
+            self._middleware.authenticate, FastAPIServerAuthenticationRequest(request)
+        )
+        if not response or not response.success():
+            return fastapi_json_response(AuthorizationError("Unauthorized"))
+        request.state.user_identity = response.get_user_identity()
+        return await call_next(request)
+
+
 async def check_http_version_middleware(
         request: Request, call_next: Callable[[Request], Any]
 ) -> Response:
@@ -98,6 +187,247 @@ async def check_http_version_middleware(
     return await call_next(request)
 
 
+AuthzSpec = Tuple[List[AuthzAction], Union[AuthzResource, DynamicAuthzResource]]
+
+
+class RouteAuthzPlan(NamedTuple):
+    """A route's authorization, compiled once: its actions, its resource and the
+    handler parameters (with their defaults) the resource may be derived from."""
+
+    route: APIRoute
+    actions: List[AuthzAction]
+    resource: Union[AuthzResource, DynamicAuthzResource]
+    params: List[Tuple[str, Any]]
+
+
+def authz_context(
+        action: Union[str, AuthzResourceActions, List[str], List[AuthzResourceActions]],
+        resource: Union[AuthzResource, DynamicAuthzResource],
+        preflight: bool = False,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Chroma's authz_context, with the route's actions built once when it is declared,
+    and that records the route's authorization spec on the handler, so it can be
+    evaluated before the handler is dispatched (see AsyncAuthzPreflightMiddleware).
+    A request authorized that way is not authorized again in the handler. Routes
+    opt in with preflight=True, which only those whose resource is derived from path
+    and query parameters may set: the body is not read before dispatch.
+    """
+    actions = [
+        a if isinstance(a, AuthzAction) else AuthzAction(id=a)
+        for a in (action if isinstance(action, list) else [action])
+    ]
+
+    def decorator(f: Callable[..., Any]) -> Callable[..., Any]:
+        _route = f.__name__
+        _authz_seconds = AUTHZ_SECONDS.labels(_route, "handler")
+
+        def _authorize(request: Request, args: Any, kwargs: Dict[str, Any]) -> bool:
+            _provider = chroma_authz_provider.get()
+            if _provider is None:
+                return False
+            identity = getattr(request.state, "user_identity", None)
+            user = (
+                AuthzUser(
+                    id=identity.get_user_id(),
+                    tenant=identity.get_user_tenant(),
+                    attributes=identity.get_user_attributes(),
+                )
+                if identity is not None
+                else AuthzUser(id="Anonymous", tenant=DEFAULT_TENANT, attributes={})
+            )
+            _resource = (
+                resource
+                if isinstance(resource, AuthzResource)
+                else resource.to_authz_resource(
+                    api=args[0]._api,
+                    function=f,
+                    function_args=args,
+                    function_kwargs=kwargs,
+                )
+            )
+            # every action is decided, as in Chroma's authz_context
+            return any(
+                [
+                    _provider.authorize(
+                        AuthorizationContext(user=user, resource=_resource, action=a)
+                    )
+                    for a in actions
+                ]
+            )
+
+        @wraps(f)
+        def wrapped(*args: Any, **kwargs: Any) -> Any:
+            request = request_var.get()
+            if request is None:
+                return f(*args, **kwargs)
+            _started_at = time.perf_counter()
+            _overwrite = (
+                chromadb.auth.fastapi.overwrite_singleton_tenant_database_access_from_auth
+            )
+            _preflight = getattr(request.state, "authz_preflight", None)
+            try:
+                # the preflight decided on the arguments before any overwrite
+                if _preflight is not None and _preflight[0] == _route and not _overwrite:
+                    allowed = _preflight[1]
+                else:
+                    allowed = _authorize(request, args, kwargs)
+            finally:
+                _authz_seconds.observe(time.perf_counter() - _started_at)
+            if not allowed:
+                raise AuthorizationError("Unauthorized")
+            if _overwrite:
+                overwrite_tenant_database_from_auth(request, kwargs)
+            return f(*args, **kwargs)
+
+        if preflight:
+            wrapped.__authz_spec__ = (actions, resource)  # type: ignore
+        return wrapped
+
+    return decorator
+
+
+def overwrite_tenant_database_from_auth(request: Request, kwargs: Dict[str, Any]) -> None:
+    """
+    Chroma's overwrite_singleton_tenant_database_access_from_auth: in a multi-tenant
+    environment users may send requests without configuring a tenant and database,
+    which are then set to the user's own.
+    """
+    identity = request.state.user_identity
+    desired_tenant = identity.get_user_tenant()
+    if desired_tenant and "tenant" in kwargs:
+        if isinstance(kwargs["tenant"], str):
+            kwargs["tenant"] = desired_tenant
+        elif isinstance(kwargs["tenant"], CreateTenant):
+            kwargs["tenant"].name = desired_tenant
+    databases = identity.get_user_databases()
+    if databases and len(databases) == 1 and "database" in kwargs:
+        desired_database = databases[0]
+        if isinstance(kwargs["database"], str):
+            kwargs["database"] = desired_database
+        elif isinstance(kwargs["database"], CreateDatabase):
+            kwargs["database"].name = desired_database
+
+
+def attr_from_collection_lookup(
+        collection_id_arg: str, **kwargs: Any
+) -> Callable[..., Dict[str, Any]]:
+    """
+    Chroma's attr_from_collection_lookup, served from the server's
+    CollectionMetadataCache instead of reading the sysdb on every request.
+    """
+    def _wrap(**kwargs: Any) -> Dict[str, Any]:
+        _server = cast(FastAPI, kwargs["function_args"][0])
+        col = _server._collections.by_id(
+            _uuid(kwargs["function_kwargs"][collection_id_arg])
+        )
+        return {"tenant": col.tenant, "database": col.database}
+
+    return partial(_wrap, **kwargs)
+
+
+class AsyncAuthzPreflightMiddleware(BaseHTTPMiddleware):
+    """
+    Authorizes a request on the event loop, before its (sync) handler is dispatched
+    to the threadpool, using a provider's `authorize_async`, so no threadpool worker
+    is held while waiting on the authorization backend. The outcome is stored in
+    request.state.authz_preflight for the route's authz_context, and the decisions
+    in request.state.authz_decisions where the provider's sync `authorize` finds
+    them. The resource is resolved from path and query parameters only, in the
+    threadpool, as it may read the sysdb.
+    """
+
+    def __init__(
+            self,
+            app: Any,
+            server: "FastAPI",
+            authz_provider: ServerAuthorizationProvider,
+    ) -> None:
+        super().__init__(app)
+        self._server = server
+        self._authz_provider = authz_provider
+        self._routes: Optional[List[RouteAuthzPlan]] = None
+
+    def _compile_routes(self) -> List[RouteAuthzPlan]:
+        _routes = []
+        for route in self._server.router.routes:
+            spec = getattr(getattr(route, "endpoint", None), "__authz_spec__", None)
+            if isinstance(route, APIRoute) and spec is not None:
+                actions, resource = spec
+                _params = [
+                    (name, param.default)
+                    for name, param in inspect.signature(
+                        route.endpoint
+                    ).parameters.items()
+                ]
+                _routes.append(RouteAuthzPlan(route, actions, resource, _params))
+        return _routes
+
+    def _contexts(
+            self, request: Request
+    ) -> Tuple[Optional[str], List[AuthorizationContext]]:
+        if self._routes is None:
+            self._routes = self._compile_routes()
+        for route, actions, resource, params in self._routes:
+            match, child_scope = route.matches(request.scope)
+            if match != Match.FULL:
+                continue
+            function_kwargs: Dict[str, Any] = dict(child_scope.get("path_params", {}))
+            for name, default in params:
+                if name in function_kwargs:
+                    continue
+                if name in request.query_params:
+                    function_kwargs[name] = request.query_params[name]
+                elif default is not inspect.Parameter.empty:
+                    function_kwargs[name] = default
+            _resource = (
+                resource
+                if isinstance(resource, AuthzResource)
+                else resource.to_authz_resource(
+                    api=self._server._api,
+                    function=route.endpoint,
+                    function_args=(self._server,),
+                    function_kwargs=function_kwargs,
+                )
+            )
+            identity = request.state.user_identity
+            user = AuthzUser(
+                id=identity.get_user_id(),
+                tenant=identity.get_user_tenant(),
+                attributes=identity.get_user_attributes(),
+            )
+            return route.name, [
+                AuthorizationContext(user=user, resource=_resource, action=a)
+                for a in actions
+            ]
+        return None, []
+
+    async def dispatch(
+            self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        if getattr(request.state, "user_identity", None) is not None:
+            _started_at = time.perf_counter()
+            try:
+                route, contexts = await run_in_threadpool(self._contexts, request)
+            except Exception as e:
+                # e.g. unknown collection; the handler reports it as usual
+                logger.debug(f"Skipping authz preflight: {repr(e)}")
+                route, contexts = None, []
+            decisions = {}
+            for context in contexts:
+                decisions[
+                    self._authz_provider.decision_key(context)  # type: ignore
+                ] = await self._authz_provider.authorize_async(context)  # type: ignore
+            request.state.authz_decisions = decisions
+            if route is not None:
+                # allowed if any of the route's actions is, as in authz_context
+                request.state.authz_preflight = (route, any(decisions.values()))
+                AUTHZ_SECONDS.labels(route, "preflight").observe(
+                    time.perf_counter() - _started_at
+                )
+        return await call_next(request)
+
+
 class ChromaAPIRouter(fastapi.APIRouter):  # type: ignore
     # A simple subclass of fastapi's APIRouter which treats URLs with a trailing "/" the
     # same as URLs without. Docs will only contain URLs without trailing "/"s.
@@ -134,6 +464,12 @@ class FastAPI(chromadb.server.Server):
         self._api: ServerAPI = self._system.instance(ServerAPI)
         from chroma_auth.authz.openfga.openfga_permissions import OpenFGAPermissionsAPI
         self._permissionsApi: OpenFGAPermissionsAPI = self._system.instance(OpenFGAPermissionsAPI)
+        from chroma_auth.authz.openfga.tuple_gc import OpenFGATupleCollector
+        # collects orphaned tuples in the background if FGA_GC_INTERVAL_SECONDS is set
+        self._system.instance(OpenFGATupleCollector)
+        self._system.instance(ComponentMetricsRefresher)
+        self._metrics_registry: Optional[CollectorRegistry] = None
+        self._collections = self._system.instance(CollectionMetadataCache)
         self._opentelemetry_client = self._api.require(OpenTelemetryClient)
         self._system.start()
 
@@ -150,15 +486,30 @@ class FastAPI(chromadb.server.Server):
         self._app.on_event("shutdown")(self.shutdown)
 
         if settings.chroma_server_authz_provider:
+            _authz_provider = self._system.instance(
+                resolve_provider(
+                    settings.chroma_server_authz_provider, ServerAuthorizationProvider
+                )
+            )
+            if hasattr(_authz_provider, "authorize_async"):
+                self._app.add_middleware(
+                    AsyncAuthzPreflightMiddleware,
+                    server=self,
+                    authz_provider=_authz_provider,
+                )
             self._app.add_middleware(
                 FastAPIChromaAuthzMiddlewareWrapper,
                 authz_middleware=self._api.require(FastAPIChromaAuthzMiddleware),
             )
         if settings.chroma_server_auth_provider:
             self._app.add_middleware(
-                FastAPIChromaAuthMiddlewareWrapper,
+                ThreadpoolAuthMiddlewareWrapper,
                 auth_middleware=self._api.require(FastAPIChromaAuthMiddleware),
             )
+            self._app.middleware("http")(catch_auth_overload_middleware)
+        self._sessions = self._session_credentials_provider(settings)
+        if self._sessions is not None:
+            self._app.middleware("http")(self.session_token_middleware)
         set_overwrite_singleton_tenant_database_access_from_auth(
             settings.chroma_overwrite_singleton_tenant_database_access_from_auth
         )
@@ -169,9 +520,20 @@ class FastAPI(chromadb.server.Server):
         self.router.add_api_route("/api/v1/reset", self.reset, methods=["POST"])
         self.router.add_api_route("/api/v1/version", self.version, methods=["GET"])
         self.router.add_api_route("/api/v1/heartbeat", self.heartbeat, methods=["GET"])
+        if env_bool("CHROMA_AUTH_METRICS_ENABLED", True):
+            self.router.add_api_route(
+                "/metrics", self.metrics, methods=["GET"], include_in_schema=False
+            )
         self.router.add_api_route(
             "/api/v1/pre-flight-checks", self.pre_flight_checks, methods=["GET"]
         )
+        if self._sessions is not None:
+            self.router.add_api_route(
+                "/api/v1/auth/session",
+                self.create_session,
+                methods=["POST"],
+                response_model=None,
+            )
 
         self.router.add_api_route(
             "/api/v1/databases",
@@ -287,12 +649,74 @@ class FastAPI(chromadb.server.Server):
         use_route_names_as_operation_ids(self._app)
         instrument_fastapi(self._app)
 
-    def shutdown(self) -> None:
+    async def shutdown(self) -> None:
+        from chroma_auth.authz.openfga.client import SharedAsyncOpenFGAClient
+        # the asyncio client must be closed on the loop it was created on
+        for component in self._system.components():
+            if isinstance(component, SharedAsyncOpenFGAClient):
+                await component.aclose()
         self._system.stop()
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            # drops the live gauges of this worker from the merged metrics
+            multiprocess.mark_process_dead(os.getpid())
 
     def app(self) -> fastapi.FastAPI:
         return self._app
 
+    def _session_credentials_provider(
+        self, settings: Settings
+    ) -> Optional[MultiUserHtpasswdFileServerAuthCredentialsProvider]:
+        """The credentials provider, if it issues session tokens."""
+        if not (
+            settings.chroma_server_auth_provider
+            and settings.chroma_server_auth_credentials_provider
+        ):
+            return None
+        _provider = self._system.instance(
+            resolve_provider(
+                settings.chroma_server_auth_credentials_provider,
+                ServerAuthCredentialsProvider,
+            )
+        )
+        if (
+            isinstance(_provider, MultiUserHtpasswdFileServerAuthCredentialsProvider)
+            and _provider.sessions_enabled
+        ):
+            return _provider
+        return None
+
+    def _issue_session(self, request: Request) -> Optional[Tuple[str, int]]:
+        # a session is opened with a verified password, never renewed with a token
+        _identity = getattr(request.state, "user_identity", None)
+        if _identity is None or not request.headers.get(
+            "Authorization", ""
+        ).startswith("Basic "):
+            return None
+        return self._sessions.issue_session_token(  # type: ignore
+            _identity.get_user_id()
+        )
+
+    async def session_token_middleware(
+        self, request: Request, call_next: Callable[[Request], Any]
+    ) -> Response:
+        # only on request: a token in every response would cost an HMAC per
+        # request and hand out fresh credentials to whatever logs the headers
+        if request.headers.get(SESSION_REQUEST_HEADER, "").lower() != "true":
+            return await call_next(request)
+        response = await call_next(request)
+        if response.status_code < 400:
+            _session = self._issue_session(request)
+            if _session is not None:
+                response.headers[SESSION_TOKEN_HEADER] = _session[0]
+                response.headers[SESSION_EXPIRES_HEADER] = str(_session[1])
+        return response
+
+    def create_session(self, request: Request) -> Dict[str, Any]:
+        _session = self._issue_session(request)
+        if _session is None:
+            raise AuthorizationError("A session is opened with basic auth credentials")
+        return {"token": _session[0], "token_type": "Bearer", "expires_at": _session[1]}
+
     def root(self) -> Dict[str, int]:
         return {"nanosecond heartbeat": self._api.heartbeat()}
 
@@ -305,6 +729,19 @@ class FastAPI(chromadb.server.Server):
     def heartbeat(self) -> Dict[str, int]:
         return self.root()
 
+    def metrics(self) -> Response:
+        update_component_metrics(self._system)
+        if self._metrics_registry is None:
+            if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+                # the metrics of every worker, merged from their files
+                self._metrics_registry = CollectorRegistry()
+                multiprocess.MultiProcessCollector(self._metrics_registry)
+            else:
+                self._metrics_registry = REGISTRY
+        return Response(
+            generate_latest(self._metrics_registry), media_type=CONTENT_TYPE_LATEST
+        )
+
     def version(self) -> str:
         return self._api.get_version()
 
@@ -333,6 +770,7 @@ class FastAPI(chromadb.server.Server):
                 arg_names=["tenant", "database"]
             ),
         ),
+        preflight=True,
     )
     def get_database(self, database: str, tenant: str = DEFAULT_TENANT) -> Database:
         return self._api.get_database(database, tenant)
@@ -343,6 +781,7 @@ class FastAPI(chromadb.server.Server):
         resource=DynamicAuthzResource(
             type=AuthzResourceTypes.TENANT,
         ),
+        preflight=True,
     )
     def create_tenant(self, tenant: CreateTenant) -> None:
         return self._api.create_tenant(tenant.name)
@@ -354,6 +793,7 @@ class FastAPI(chromadb.server.Server):
             id="*",
             type=AuthzResourceTypes.TENANT,
         ),
+        preflight=True,
     )
     def get_tenant(self, tenant: str) -> Tenant:
         return self._api.get_tenant(tenant)
@@ -368,17 +808,34 @@ class FastAPI(chromadb.server.Server):
                 arg_names=["tenant", "database"]
             ),
         ),
+        preflight=True,
     )
     def list_collections(
             self,
+            request: Request,
             limit: Optional[int] = None,
             offset: Optional[int] = None,
             tenant: str = DEFAULT_TENANT,
             database: str = DEFAULT_DATABASE,
     ) -> Sequence[Collection]:
-        return self._api.list_collections(
-            limit=limit, offset=offset, tenant=tenant, database=database
+        visible = (
+            self._permissionsApi.visible_collections(request)
+            if self._permissionsApi.filter_list_collections
+            else None
         )
+        if visible is None:
+            return self._api.list_collections(
+                limit=limit, offset=offset, tenant=tenant, database=database
+            )
+        # paginate after filtering, so that pages are not short of visible collections
+        collections = [
+            c
+            for c in self._api.list_collections(tenant=tenant, database=database)
+            if self._permissionsApi.collection_object_for_get(tenant, database, c.name)
+            in visible
+        ]
+        start = offset or 0
+        return collections[start:start + limit if limit is not None else None]
 
     @trace_method("FastAPI.count_collections", OpenTelemetryGranularity.OPERATION)
     @authz_context(
@@ -390,6 +847,7 @@ class FastAPI(chromadb.server.Server):
                 arg_names=["tenant", "database"]
             ),
         ),
+        preflight=True,
     )
     def count_collections(
             self,
@@ -408,6 +866,7 @@ class FastAPI(chromadb.server.Server):
                 arg_names=["tenant", "database"]
             ),
         ),
+        preflight=True,
     )
     def create_collection(
             self,
@@ -416,12 +875,10 @@ class FastAPI(chromadb.server.Server):
             tenant: str = DEFAULT_TENANT,
             database: str = DEFAULT_DATABASE,
     ) -> Collection:
-        existing = None
-        try:
-            existing = self._api.get_collection(collection.name, tenant=tenant, database=database)
-        except ValueError as e:
-            if "does not exist" not in str(e):
-                raise e
+        # not from the cache: another process may have created or deleted it
+        existing = self._collections.by_name(
+            collection.name, tenant=tenant, database=database, cached=False
+        )
         collection=  self._api.create_collection(
             name=collection.name,
             metadata=collection.metadata,
@@ -429,6 +886,12 @@ class FastAPI(chromadb.server.Server):
             tenant=tenant,
             database=database,
         )
+        # the Collection returned by create_collection carries no tenant/database
+        self._collections.remember(
+            CollectionRef(
+                id=collection.id, name=collection.name, tenant=tenant, database=database
+            )
+        )
         if not existing:
             self._permissionsApi.create_collection_permissions(collection=collection, request=request)
         return collection
@@ -443,6 +906,7 @@ class FastAPI(chromadb.server.Server):
                 arg_names=["tenant", "database"]
             ),
         ),
+        preflight=True,
     )
     def get_collection(
             self,
@@ -462,15 +926,18 @@ class FastAPI(chromadb.server.Server):
             type=AuthzResourceTypes.COLLECTION,
             attributes=attr_from_collection_lookup(collection_id_arg="collection_id"),
         ),
+        preflight=True,
     )
     def update_collection(
             self, collection_id: str, collection: UpdateCollection
     ) -> None:
-        return self._api._modify(
+        resp = self._api._modify(
             id=_uuid(collection_id),
             new_name=collection.new_name,
             new_metadata=collection.new_metadata,
         )
+        self._collections.invalidate(id=_uuid(collection_id))
+        return resp
 
     @trace_method("FastAPI.delete_collection", OpenTelemetryGranularity.OPERATION)
     @authz_context(
@@ -482,6 +949,7 @@ class FastAPI(chromadb.server.Server):
                 arg_names=["tenant", "database"]
             ),
         ),
+        preflight=True,
     )
     def delete_collection(
             self,
@@ -490,12 +958,21 @@ class FastAPI(chromadb.server.Server):
             tenant: str = DEFAULT_TENANT,
             database: str = DEFAULT_DATABASE,
     ) -> None:
-        collection = self._api.get_collection(collection_name, tenant=tenant, database=database)
+        # not from the cache: another process may have deleted or re-created it
+        collection = self._collections.by_name(
+            collection_name, tenant=tenant, database=database, cached=False
+        )
         resp= self._api.delete_collection(
             collection_name, tenant=tenant, database=database
         )
-
-        self._permissionsApi.delete_collection_permissions(collection=collection,request=request)
+        self._collections.invalidate(
+            id=collection.id if collection else None,
+            name=collection_name,
+            tenant=tenant,
+            database=database,
+        )
+        if collection is not None:
+            self._permissionsApi.delete_collection_permissions(collection=collection,request=request)
         return resp
 
     @trace_method("FastAPI.add", OpenTelemetryGranularity.OPERATION)
@@ -506,6 +983,7 @@ class FastAPI(chromadb.server.Server):
             type=AuthzResourceTypes.COLLECTION,
             attributes=attr_from_collection_lookup(collection_id_arg="collection_id"),
         ),
+        preflight=True,
     )
     def add(self, collection_id: str, add: AddEmbedding) -> None:
         try:
@@ -529,6 +1007,7 @@ class FastAPI(chromadb.server.Server):
             type=AuthzResourceTypes.COLLECTION,
             attributes=attr_from_collection_lookup(collection_id_arg="collection_id"),
         ),
+        preflight=True,
     )
     def update(self, collection_id: str, add: UpdateEmbedding) -> None:
         self._api._update(
@@ -548,6 +1027,7 @@ class FastAPI(chromadb.server.Server):
             type=AuthzResourceTypes.COLLECTION,
             attributes=attr_from_collection_lookup(collection_id_arg="collection_id"),
         ),
+        preflight=True,
     )
     def upsert(self, collection_id: str, upsert: AddEmbedding) -> None:
         self._api._upsert(
@@ -567,6 +1047,7 @@ class FastAPI(chromadb.server.Server):
             type=AuthzResourceTypes.COLLECTION,
             attributes=attr_from_collection_lookup(collection_id_arg="collection_id"),
         ),
+        preflight=True,
     )
     def get(self, collection_id: str, get: GetEmbedding) -> GetResult:
         return self._api._get(
@@ -588,6 +1069,7 @@ class FastAPI(chromadb.server.Server):
             type=AuthzResourceTypes.COLLECTION,
             attributes=attr_from_collection_lookup(collection_id_arg="collection_id"),
         ),
+        preflight=True,
     )
     def delete(self, collection_id: str, delete: DeleteEmbedding) -> List[UUID]:
         return self._api._delete(
@@ -605,6 +1087,7 @@ class FastAPI(chromadb.server.Server):
             type=AuthzResourceTypes.COLLECTION,
             attributes=attr_from_collection_lookup(collection_id_arg="collection_id"),
         ),
+        preflight=True,
     )
     def count(self, collection_id: str) -> int:
         return self._api._count(_uuid(collection_id))
@@ -616,9 +1099,12 @@ class FastAPI(chromadb.server.Server):
             id="*",
             type=AuthzResourceTypes.DB,
         ),
+        preflight=True,
     )
     def reset(self) -> bool:
-        return self._api.reset()
+        resp = self._api.reset()
+        self._collections.clear()
+        return resp
 
     @trace_method("FastAPI.get_nearest_neighbors", OpenTelemetryGranularity.OPERATION)
     @authz_context(
@@ -628,6 +1114,7 @@ class FastAPI(chromadb.server.Server):
             type=AuthzResourceTypes.COLLECTION,
             attributes=attr_from_collection_lookup(collection_id_arg="collection_id"),
         ),
+        preflight=True,
     )
     def get_nearest_neighbors(
             self, collection_id: str, query: QueryEmbedding
@@ -0,0 +1,173 @@
+"""
+Prometheus metrics of the server: authorization overhead per route, and the state
+of the caches, the circuit breaker, the outbox and the tuple collector, read from
+the components of the server's system into gauges by `update_component_metrics`.
+
+With several workers (`CHROMA_SERVER_WORKERS`), `PROMETHEUS_MULTIPROC_DIR` makes
+prometheus_client keep each worker's metrics in files the scraped worker merges;
+gauges of per-worker state are summed over the live workers, and those of shared
+state (the breaker, the outbox, the change feed) take the highest of them.
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from chromadb.config import Component, System
+from overrides import override
+from prometheus_client import Gauge, Histogram
+
+from chroma_auth.authz.openfga.metrics import LATENCY_BUCKETS
+from chroma_auth.utils import env_float
+
+logger = logging.getLogger(__name__)
+
+AUTHZ_SECONDS = Histogram(
+    "chroma_auth_authz_seconds",
+    "Time spent authorizing a request before its handler runs, by route and stage "
+    "(preflight on the event loop, handler within the route's authz_context).",
+    ["route", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+CACHE_HITS = Gauge(
+    "chroma_auth_cache_hits_total",
+    "Cache hits, by cache.",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+CACHE_MISSES = Gauge(
+    "chroma_auth_cache_misses_total",
+    "Cache misses, by cache.",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+CACHE_ENTRIES = Gauge(
+    "chroma_auth_cache_entries",
+    "Entries held, by cache.",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+FGA_CHECK_FLIGHTS = Gauge(
+    "chroma_auth_fga_check_flights_total",
+    "OpenFGA checks sent (leader) or answered by an identical check in flight "
+    "(coalesced).",
+    ["role"],
+    multiprocess_mode="livesum",
+)
+FGA_CIRCUIT_OPEN = Gauge(
+    "chroma_auth_fga_circuit_open",
+    "1 while the OpenFGA circuit breaker is open or half-open.",
+    multiprocess_mode="livemax",
+)
+FGA_CIRCUIT_REJECTED = Gauge(
+    "chroma_auth_fga_circuit_rejected_total",
+    "OpenFGA checks failed immediately by the open circuit breaker.",
+    multiprocess_mode="livesum",
+)
+FGA_OUTBOX_TUPLES = Gauge(
+    "chroma_auth_fga_outbox_tuples",
+    "Tuple writes queued in the outbox (pending) or given up on (dead).",
+    ["state"],
+    multiprocess_mode="livemax",
+)
+FGA_CHANGE_FEED_LAG = Gauge(
+    "chroma_auth_fga_change_feed_lag_seconds",
+    "How far behind OpenFGA's changes the change feed is.",
+    multiprocess_mode="livemax",
+)
+FGA_GC_DELETED = Gauge(
+    "chroma_auth_fga_gc_deleted_tuples_total",
+    "Orphaned tuples deleted by the tuple collector.",
+    multiprocess_mode="livesum",
+)
+
+
+def update_component_metrics(system: System) -> None:
+    """Sets the component gauges to the current state of the system's components."""
+    from chroma_auth.authz.openfga.change_feed import OpenFGAChangeFeed
+    from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+    from chroma_auth.authz.openfga.outbox import OpenFGATupleOutbox
+    from chroma_auth.authz.openfga.tuple_gc import OpenFGATupleCollector
+    from chroma_auth.utils.collection_cache import CollectionMetadataCache
+    from chroma_auth.utils.shared_cache import SharedAuthCache
+
+    _caches: Dict[str, Dict[str, Any]] = {}
+    for component in system.components():
+        if isinstance(component, OpenFGADecisionCache):
+            _caches["decisions"] = component.stats()
+        elif isinstance(component, CollectionMetadataCache):
+            _caches["collections"] = component.stats()
+        elif isinstance(component, SharedAuthCache):
+            if component.enabled:
+                _caches["shared"] = component.stats()
+        elif isinstance(component, OpenFGATupleOutbox):
+            _stats = component.stats()
+            FGA_OUTBOX_TUPLES.labels("pending").set(_stats["pending"])
+            FGA_OUTBOX_TUPLES.labels("dead").set(_stats["dead"])
+        elif isinstance(component, OpenFGAChangeFeed):
+            _stats = component.stats()
+            if _stats["enabled"] and _stats["lag_seconds"] is not None:
+                FGA_CHANGE_FEED_LAG.set(_stats["lag_seconds"])
+        elif isinstance(component, OpenFGATupleCollector):
+            FGA_GC_DELETED.set(component.stats()["deleted"])
+        if hasattr(component, "credentials_cache_stats"):
+            _caches["credentials"] = component.credentials_cache_stats()
+        if hasattr(component, "list_objects_stats"):
+            _stats = component.list_objects_stats()
+            if "hits" in _stats:
+                _caches["visible_collections"] = _stats
+        if hasattr(component, "coalescing_stats"):
+            _stats = component.coalescing_stats()
+            FGA_CHECK_FLIGHTS.labels("leader").set(_stats["leaders"])
+            FGA_CHECK_FLIGHTS.labels("coalesced").set(_stats["coalesced"])
+        if hasattr(component, "guard_stats"):
+            _stats = component.guard_stats()
+            FGA_CIRCUIT_OPEN.set(int(_stats["state"] != "closed"))
+            FGA_CIRCUIT_REJECTED.set(_stats["rejected"])
+    for cache, stats in _caches.items():
+        CACHE_HITS.labels(cache).set(stats["hits"])
+        CACHE_MISSES.labels(cache).set(stats["misses"])
+        CACHE_ENTRIES.labels(cache).set(stats["size"])
+
+
+class ComponentMetricsRefresher(Component):
+    """Keeps the component gauges of a worker current in multiprocess mode.
+
+    A scrape only runs `update_component_metrics` in the worker that serves it, so
+    with `PROMETHEUS_MULTIPROC_DIR` set every worker also updates its gauges every
+    `CHROMA_AUTH_METRICS_REFRESH_SECONDS` (5 by default), for the other workers'
+    values in the merged scrape to be at most that old.
+    """
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._interval = env_float("CHROMA_AUTH_METRICS_REFRESH_SECONDS", 5.0)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @override
+    def start(self) -> None:
+        super().start()
+        if not os.environ.get("PROMETHEUS_MULTIPROC_DIR") or self._interval <= 0:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._refresh_loop, name="metrics-refresh", daemon=True
+        )
+        self._thread.start()
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _refresh_loop(self) -> None:
+        while not self._stopped.wait(self._interval):
+            try:
+                update_component_metrics(self._system)
+            except Exception as e:
+                logger.warning(f"Failed to refresh component metrics: {e!r}")
@@ -0,0 +1,87 @@
+"""
+Deletes the orphaned tuples of an OpenFGA store: the tuples on `collection:`
+objects of collections that no longer exist in a Chroma persist directory (see
+`chroma_auth.authz.openfga.tuple_gc.OpenFGATupleCollector`):
+
+    python -m chroma_auth.tools.gc_tuples --persist-directory /chroma/chroma --dry-run
+
+With `--purge`, deletes every tuple on the given objects instead, whether their
+collection exists or not:
+
+    python -m chroma_auth.tools.gc_tuples --purge collection:t-d-1b0f...
+
+The store is configured from the environment as in the server (`FGA_API_URL`, and
+`FGA_STORE_ID`/`FGA_MODEL_ID` or `FGA_CONFIG_FILE`). Prints the statistics of the
+run as JSON.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from chromadb.config import Settings, System
+
+from chroma_auth.authz.openfga.openfga_permissions import OpenFGAPermissionsAPI
+from chroma_auth.authz.openfga.tuple_gc import OpenFGATupleCollector
+
+
+def main(args: argparse.Namespace) -> int:
+    system = System(
+        Settings(
+            is_persistent=True,
+            persist_directory=args.persist_directory,
+            chroma_server_authz_config_provider="chroma_auth.authz.openfga.OpenFGAAuthorizationConfigurationProvider",
+            anonymized_telemetry=False,
+        )
+    )
+    if args.purge:
+        permissions = system.instance(OpenFGAPermissionsAPI)
+        system.start()
+        try:
+            _tuples = permissions.object_tuples(args.purge)
+            _deleted = 0 if args.dry_run else permissions.delete(_tuples)
+        finally:
+            system.stop()
+        print(
+            json.dumps(
+                {"dry_run": args.dry_run, "found": len(_tuples), "deleted": _deleted}
+            )
+        )
+        return 0
+    if not os.path.exists(os.path.join(args.persist_directory, "chroma.sqlite3")):
+        # an empty sysdb would make every collection tuple an orphan
+        print(f"No Chroma database in {args.persist_directory}", file=sys.stderr)
+        return 1
+    collector = system.instance(OpenFGATupleCollector)
+    system.start()
+    try:
+        _run = collector.collect(dry_run=args.dry_run, min_age=args.min_age_seconds)
+    finally:
+        system.stop()
+    print(json.dumps(_run))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--persist-directory",
+        default=os.environ.get("PERSIST_DIRECTORY", "./chroma"),
+        help="The server's persist directory (default: PERSIST_DIRECTORY or ./chroma)",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Report the tuples without deleting them"
+    )
+    parser.add_argument(
+        "--min-age-seconds",
+        type=float,
+        help="Keep tuples younger than this (default: FGA_GC_MIN_AGE_SECONDS or 300)",
+    )
+    parser.add_argument(
+        "--purge", nargs="+", metavar="OBJECT", help="Delete every tuple on OBJECTs"
+    )
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,537 @@
+"""
+Bulk import of relationship tuples into OpenFGA, e.g. to bootstrap a store or to
+migrate per-collection grants:
+
+    python -m chroma_auth.tools.import_tuples data/data/initial-data.json \\
+        --checkpoint import.checkpoint
+
+Tuples are streamed from a JSON array, a JSON lines file or a CSV file (`-` reads
+standard input), so the file is never held in memory, and written in transactional
+chunks of `FGA_MAX_TUPLES_PER_WRITE` tuples by `--concurrency` parallel requests.
+Reading pauses while that many chunks are in flight. The store is configured from
+the environment as in the server (`FGA_API_URL`, and `FGA_STORE_ID`/`FGA_MODEL_ID`
+or `FGA_CONFIG_FILE`).
+
+With `--checkpoint`, the positions of the tuples known to be written are saved as
+the import progresses, and running the same command again skips them.
+Tuples that already exist are counted and skipped, so re-writing the chunks that
+were in flight when an import stopped is harmless. Tuples rejected by OpenFGA (e.g.
+an unknown relation) are reported, and written to `--rejects` if given. Failures to
+reach OpenFGA are retried; when they persist, the import stops at its checkpoint.
+
+CSV files have a header with either `user`, `relation` and `object` columns, or the
+columns of the `fga` CLI (`user_type`, `user_id`, `user_relation`, `relation`,
+`object_type`, `object_id`).
+
+Exits with 0 when every tuple is written (or already existed), 2 when some were
+rejected and 1 when the import stopped before the end of the input.
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from chromadb.config import Settings, System
+from openfga_sdk.client.models import ClientTuple, ClientWriteRequest
+from openfga_sdk.exceptions import ValidationException
+from openfga_sdk.sync import OpenFgaClient
+
+from chroma_auth.authz.openfga.client import SharedOpenFGAClient, error_message
+from chroma_auth.utils import env_int
+
+logger = logging.getLogger(__name__)
+
+Tuple3 = Tuple[str, str, str]  # (user, relation, object)
+Ranges = Dict[int, int]  # start: end of ranges of input positions
+
+FORMATS = ("json", "jsonl", "csv")
+FGA_CLI_COLUMNS = ("user_type", "user_id", "relation", "object_type", "object_id")
+
+
+def _checked(entry: Any, position: str) -> Tuple3:
+    try:
+        _tuple = (entry["user"], entry["relation"], entry["object"])
+    except (KeyError, TypeError):
+        _tuple = None
+    if _tuple is None or not all(isinstance(v, str) and v for v in _tuple):
+        raise ValueError(
+            f"Expected a tuple with a user, a relation and an object at {position}, "
+            f"got {entry!r}"
+        )
+    return _tuple  # type: ignore
+
+
+def read_json(f: IO[str], block_size: int = 1 << 16) -> Iterator[Tuple3]:
+    """The tuples of a JSON array, decoded one element at a time."""
+    _decoder = json.JSONDecoder()
+    _buffer, _at, _index = "", 0, 0
+    _expected = "["  # then a value or "]", then "," or "]"
+
+    def _fill() -> bool:
+        nonlocal _buffer, _at
+        _block = f.read(block_size)
+        _buffer, _at = _buffer[_at:] + _block, 0
+        return bool(_block)
+
+    while True:
+        while _at < len(_buffer) and _buffer[_at] in " \t\r\n\ufeff":
+            _at += 1
+        if _at == len(_buffer):
+            if not _fill():
+                raise ValueError("Unexpected end of the JSON array of tuples")
+            continue
+        _char = _buffer[_at]
+        if _expected == "[":
+            if _char != "[":
+                raise ValueError("Expected a JSON array of tuples")
+            _at += 1
+            _expected = "value"
+        elif _char == "]" and (_expected == "," or _index == 0):
+            return
+        elif _expected == ",":
+            if _char != ",":
+                raise ValueError(f"Expected , or ] after tuple {_index}")
+            _at += 1
+            _expected = "value"
+        else:
+            try:
+                _entry, _at = _decoder.raw_decode(_buffer, _at)
+            except json.JSONDecodeError:
+                # the element continues in the next block
+                if _fill():
+                    continue
+                raise
+            yield _checked(_entry, f"index {_index}")
+            _index += 1
+            _expected = ","
+
+
+def read_jsonl(f: IO[str]) -> Iterator[Tuple3]:
+    """The tuples of a file with one JSON object per line."""
+    for line_number, line in enumerate(f, 1):
+        if line.strip():
+            yield _checked(json.loads(line), f"line {line_number}")
+
+
+def read_csv(f: IO[str]) -> Iterator[Tuple3]:
+    """The tuples of a CSV file with a header (see the module documentation)."""
+    _reader = csv.DictReader(f)
+    _columns = set(_reader.fieldnames or ())
+    if {"user", "relation", "object"} <= _columns:
+        for row in _reader:
+            yield _checked(row, f"line {_reader.line_num}")
+    elif set(FGA_CLI_COLUMNS) <= _columns:
+        for row in _reader:
+            _user = f"{row['user_type']}:{row['user_id']}"
+            if row.get("user_relation"):
+                _user += f"#{row['user_relation']}"
+            yield _checked(
+                {
+                    "user": _user,
+                    "relation": row["relation"],
+                    "object": f"{row['object_type']}:{row['object_id']}",
+                },
+                f"line {_reader.line_num}",
+            )
+    else:
+        raise ValueError(
+            "Expected CSV columns user, relation and object, or "
+            + ", ".join(FGA_CLI_COLUMNS)
+        )
+
+
+def read_tuples(f: IO[str], format: str) -> Iterator[Tuple3]:
+    if format == "json":
+        return read_json(f)
+    if format == "jsonl":
+        return read_jsonl(f)
+    if format == "csv":
+        return read_csv(f)
+    raise ValueError(f"Unknown tuple format [{format}], expected one of {FORMATS}")
+
+
+def detect_format(path: str) -> str:
+    _extension = os.path.splitext(path)[1].lower()
+    if _extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if _extension == ".csv":
+        return "csv"
+    return "json"
+
+
+def chunked(
+    tuples: Iterable[Tuple3], size: int, start: int = 0, finished: Ranges = {}
+) -> Iterator[Tuple[int, int, List[Tuple3]]]:
+    """Chunks of the tuples from position `start` on, skipping the `finished` ranges
+    of positions, with the range of positions each chunk covers."""
+    _chunk: List[Tuple3] = []
+    _start = _end = start
+    for i, tuple_ in enumerate(itertools.islice(tuples, start, None), start):
+        if i < _end and not _chunk:
+            continue  # within a finished range
+        if i in finished:
+            if _chunk:
+                yield _start, _end, _chunk
+                _chunk = []
+            _end = finished[i]
+            continue
+        if not _chunk:
+            _start = i
+        _chunk.append(tuple_)
+        _end = i + 1
+        if len(_chunk) == size:
+            yield _start, _end, _chunk
+            _chunk = []
+    if _chunk:
+        yield _start, _end, _chunk
+
+
+class Checkpoint:
+    """The number of leading tuples of `source` known to be written, and the ranges
+    of tuples written after them (by chunks that finished before an earlier one), in
+    `file`.
+
+    A checkpoint only applies to the input it was saved for, identified by its path
+    and size; resuming a different input raises an error.
+    """
+
+    def __init__(self, file: str, source: str) -> None:
+        self.file = file
+        self._source = {
+            "source": os.path.abspath(source) if source != "-" else source,
+            "size": os.stat(source).st_size if source != "-" else None,
+        }
+        self._saved: Optional[Tuple[int, Ranges]] = None
+
+    def load(self) -> Tuple[int, Ranges]:
+        if not os.path.exists(self.file):
+            return 0, {}
+        with open(self.file, "r") as f:
+            _checkpoint = json.load(f)
+        if {k: _checkpoint.get(k) for k in self._source} != self._source:
+            raise ValueError(
+                f"Checkpoint {self.file} was saved for {_checkpoint.get('source')} "
+                f"({_checkpoint.get('size')} bytes); remove it or use --restart"
+            )
+        self._saved = (
+            int(_checkpoint["tuples"]),
+            {int(start): int(end) for start, end in _checkpoint.get("finished", [])},
+        )
+        return self._saved
+
+    def save(self, tuples: int, finished: Ranges) -> None:
+        # adjacent ranges are merged to keep the file small
+        _ranges: List[List[int]] = []
+        for start, end in sorted(finished.items()):
+            if _ranges and _ranges[-1][1] == start:
+                _ranges[-1][1] = end
+            else:
+                _ranges.append([start, end])
+        _saved = (tuples, {start: end for start, end in _ranges})
+        if _saved == self._saved:
+            return
+        _tmp = f"{self.file}.tmp"
+        with open(_tmp, "w") as f:
+            json.dump({**self._source, "tuples": tuples, "finished": _ranges}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(_tmp, self.file)
+        self._saved = _saved
+
+
+class TupleImporter:
+    """Writes a stream of tuples in chunks, with at most `concurrency` chunks in
+    flight, tracking the leading tuples that are known to be written."""
+
+    def __init__(
+        self,
+        client: OpenFgaClient,
+        chunk_size: int = 100,
+        concurrency: int = 8,
+        max_retries: int = 5,
+        retry_base: float = 0.5,
+        rejects: Optional[IO[str]] = None,
+        checkpoint: Optional[Checkpoint] = None,
+        interval: float = 5,
+        out: IO[str] = sys.stderr,
+    ) -> None:
+        self._client = client
+        self._chunk_size = max(1, chunk_size)
+        self._concurrency = max(1, concurrency)
+        self._max_retries = max_retries
+        self._retry_base = retry_base
+        self._rejects = rejects
+        self._checkpoint = checkpoint
+        self._interval = interval
+        self._out = out
+        self._lock = threading.Lock()
+        # written chunks behind an unfinished one
+        self._finished: Ranges = {}
+        self._done = 0
+        self._failure: Optional[Exception] = None
+        self._written = 0
+        self._existing = 0
+        self._rejected = 0
+        self._requests = 0
+        self._retries = 0
+        self._started_at = time.perf_counter()
+        self._reported_at = self._started_at
+        self._reported_tuples = 0
+
+    def run(
+        self, tuples: Iterable[Tuple3], start: int = 0, finished: Ranges = {}
+    ) -> Dict[str, Any]:
+        """Write `tuples`, except the first `start` ones and the `finished` ranges,
+        which are already written."""
+        self._done = start
+        self._finished = dict(finished)
+        while self._done in self._finished:
+            self._done = self._finished.pop(self._done)
+        self._started_at = self._reported_at = time.perf_counter()
+        _slots = threading.Semaphore(self._concurrency)
+        _executor = ThreadPoolExecutor(
+            max_workers=self._concurrency, thread_name_prefix="import-tuples"
+        )
+        _complete = False
+        try:
+            for _start, _end, chunk in chunked(
+                tuples, self._chunk_size, start, finished
+            ):
+                # backpressure: the input is not read further until a chunk finishes
+                while not _slots.acquire(timeout=self._interval):
+                    self._tick()
+                if self._failure is not None:
+                    _slots.release()
+                    break
+                _executor.submit(self._write_chunk, _start, _end, chunk, _slots)
+                if time.perf_counter() - self._reported_at >= self._interval:
+                    self._tick()
+            else:
+                _complete = True
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, waiting for the writes in flight")
+        finally:
+            _executor.shutdown(wait=True)
+            self._tick()
+        return self.stats(complete=_complete and self._failure is None)
+
+    def _write_chunk(
+        self, start: int, end: int, chunk: List[Tuple3], slots: threading.Semaphore
+    ) -> None:
+        try:
+            if self._failure is None:
+                self._write(chunk)
+                with self._lock:
+                    self._finished[start] = end
+                    while self._done in self._finished:
+                        self._done = self._finished.pop(self._done)
+        except Exception as e:
+            with self._lock:
+                if self._failure is None:
+                    self._failure = e
+            logger.error(f"Stopping the import, a write failed: {error_message(e)}")
+        finally:
+            slots.release()
+
+    def _write(self, chunk: Sequence[Tuple3]) -> None:
+        try:
+            self._send(chunk)
+        except ValidationException as e:
+            if len(chunk) == 1:
+                self._reject(chunk[0], e)
+                return
+            # a transactional write fails as a whole, so bisect to find the tuples
+            # that exist already or are invalid
+            _half = len(chunk) // 2
+            self._write(chunk[:_half])
+            self._write(chunk[_half:])
+            return
+        with self._lock:
+            self._written += len(chunk)
+
+    def _send(self, chunk: Sequence[Tuple3]) -> None:
+        _body = ClientWriteRequest(writes=[ClientTuple(u, r, o) for u, r, o in chunk])
+        for attempt in itertools.count():
+            with self._lock:
+                self._requests += 1
+            try:
+                self._client.write(_body)
+                return
+            except ValidationException:
+                raise
+            except Exception as e:
+                if attempt >= self._max_retries:
+                    raise
+                _backoff = min(30.0, self._retry_base * 2**attempt)
+                with self._lock:
+                    self._retries += 1
+                logger.warning(
+                    f"Writing {len(chunk)} tuples failed (attempt {attempt + 1}), "
+                    f"retrying in {_backoff:.1f}s: {error_message(e)}"
+                )
+                time.sleep(_backoff * random.uniform(0.5, 1.0))
+
+    def _reject(self, tuple_: Tuple3, e: ValidationException) -> None:
+        _error = error_message(e)
+        if "already exists" in _error:
+            with self._lock:
+                self._existing += 1
+            return
+        _user, _relation, _object = tuple_
+        logger.error(f"OpenFGA rejected ({_user}, {_relation}, {_object}): {_error}")
+        with self._lock:
+            self._rejected += 1
+            if self._rejects is not None:
+                self._rejects.write(
+                    json.dumps(
+                        {
+                            "user": _user,
+                            "relation": _relation,
+                            "object": _object,
+                            "error": _error,
+                        }
+                    )
+                    + "\n"
+                )
+
+    def _tick(self) -> None:
+        """Save the checkpoint and print the throughput since the last tick."""
+        _stats = self.stats()
+        if self._checkpoint is not None:
+            with self._lock:
+                _done, _finished = self._done, dict(self._finished)
+            self._checkpoint.save(_done, _finished)
+        _now = time.perf_counter()
+        _tuples = _stats["written"] + _stats["existing"] + _stats["rejected"]
+        _rate = (_tuples - self._reported_tuples) / max(_now - self._reported_at, 1e-9)
+        self._reported_at, self._reported_tuples = _now, _tuples
+        print(
+            f"{_stats['checkpoint']} done ({_stats['written']} written, "
+            f"{_stats['existing']} existing, {_stats['rejected']} rejected), "
+            f"{_rate:.0f} tuples/s now, {_stats['tuples_per_second']:.0f} tuples/s "
+            f"overall, {_stats['requests']} requests, {_stats['retries']} retries",
+            file=self._out,
+            flush=True,
+        )
+
+    def stats(self, **extra: Any) -> Dict[str, Any]:
+        _elapsed = time.perf_counter() - self._started_at
+        with self._lock:
+            _stats = {
+                "checkpoint": self._done,
+                "written": self._written,
+                "existing": self._existing,
+                "rejected": self._rejected,
+                "requests": self._requests,
+                "retries": self._retries,
+            }
+        _stats["elapsed_seconds"] = round(_elapsed, 3)
+        _stats["tuples_per_second"] = (
+            _stats["written"] + _stats["existing"] + _stats["rejected"]
+        ) / max(_elapsed, 1e-9)
+        if self._failure is not None:
+            _stats["error"] = error_message(self._failure)
+        return {**_stats, **extra}
+
+
+def fga_client(concurrency: int) -> Tuple[System, SharedOpenFGAClient]:
+    """A started system with the OpenFGA client configured as in the server."""
+    _system = System(
+        Settings(
+            chroma_server_authz_config_provider="chroma_auth.authz.openfga.OpenFGAAuthorizationConfigurationProvider",
+            anonymized_telemetry=False,
+        )
+    )
+    _fga = _system.instance(SharedOpenFGAClient)
+    _fga.configuration.connection_pool_maxsize = max(
+        _fga.configuration.connection_pool_maxsize, concurrency
+    )
+    _system.start()
+    return _system, _fga
+
+
+def main(args: argparse.Namespace) -> int:
+    _format = args.format or detect_format(args.file)
+    _checkpoint = Checkpoint(args.checkpoint, args.file) if args.checkpoint else None
+    _start, _finished = (
+        _checkpoint.load() if _checkpoint is not None and not args.restart else (0, {})
+    )
+    if _start or _finished:
+        print(
+            f"Resuming after {_start} tuples, skipping "
+            f"{sum(end - start for start, end in _finished.items())} written since",
+            file=sys.stderr,
+        )
+    _system, _fga = fga_client(args.concurrency)
+    _input = sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8")
+    _rejects = open(args.rejects, "a") if args.rejects else None
+    try:
+        _stats = TupleImporter(
+            _fga.client,
+            chunk_size=args.chunk_size,
+            concurrency=args.concurrency,
+            max_retries=args.max_retries,
+            rejects=_rejects,
+            checkpoint=_checkpoint,
+            interval=args.interval,
+        ).run(read_tuples(_input, _format), start=_start, finished=_finished)
+    finally:
+        if _input is not sys.stdin:
+            _input.close()
+        if _rejects is not None:
+            _rejects.close()
+        _system.stop()
+    print(json.dumps(_stats))
+    if not _stats["complete"]:
+        return 1
+    return 2 if _stats["rejected"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("file", help="Tuples to import, or - for standard input")
+    parser.add_argument(
+        "--format", choices=FORMATS, help="Defaults to the file's extension, or json"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=env_int("FGA_MAX_TUPLES_PER_WRITE", 100),
+        help="Tuples per write (default: FGA_MAX_TUPLES_PER_WRITE or 100)",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Max writes in flight"
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=5,
+        help="Retries of a write that failed to reach OpenFGA before stopping",
+    )
+    parser.add_argument(
+        "--checkpoint", help="Save progress to, and resume from, this file"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore an existing checkpoint"
+    )
+    parser.add_argument(
+        "--rejects", help="Append the rejected tuples to this JSONL file"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5,
+        help="Seconds between progress reports and checkpoint saves",
+    )
+    sys.exit(main(parser.parse_args()))
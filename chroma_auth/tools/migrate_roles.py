@@ -0,0 +1,215 @@
+"""
+Rewrites the collection grants of an OpenFGA store from the direct model
+(`data/models/model-article-p4.fga`, up to 24 `can_*` tuples per collection) to
+the roles model (`data/models/model-article-p4-roles.fga`, 3 tuples):
+
+    python -m chroma_auth.tools.migrate_roles --persist-directory /chroma/chroma --dry-run
+
+For each collection in the persist directory, a user or team userset granted all
+the relations of a collection's writers (or readers) becomes its `owner` or
+`writer` (or `reader`); when a team's owners, writers and readers are all
+granted, the three become a single `team` tuple. The collection is linked to its
+database and its name-keyed object to its id-keyed object, and the `can_*`
+tuples covered by the roles are deleted in the same request. Other grants are
+kept as they are. Running it again migrates only what was written since.
+
+The roles model must be written to the store first (`fga model write`), and the
+store configured from the environment as in the server (`FGA_API_URL`, and
+`FGA_STORE_ID`/`FGA_MODEL_ID` of the roles model, or `FGA_CONFIG_FILE`). Then
+start the servers with `FGA_MODEL_VARIANT=roles`. Prints the statistics of the
+migration as JSON.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from chromadb.config import Settings, System
+from chromadb.db.system import SysDB
+from openfga_sdk.client.models import ClientTuple
+
+from chroma_auth.authz.openfga.openfga_permissions import (
+    READER_NAME_RELATIONS,
+    READER_RELATIONS,
+    WRITER_NAME_RELATIONS,
+    WRITER_RELATIONS,
+    OpenFGAPermissionsAPI,
+)
+from chroma_auth.authz.openfga.tuple_store import TupleKey, tuple_key
+
+logger = logging.getLogger(__name__)
+
+TEAM_ROLES = {"owner": "owner", "writer": "writer", "reader": "reader"}
+
+
+def _role(user: str, on_object: Set[str], on_name: Set[str]) -> Optional[str]:
+    """The role of `user` given its relations on a collection's id-keyed and
+    name-keyed objects, or None when they are not those of a role."""
+    if user.endswith(":*"):
+        # the roles model does not allow wildcards
+        return None
+    if WRITER_RELATIONS <= on_object and WRITER_NAME_RELATIONS <= on_name:
+        # as written by the direct model for the creator of the collection
+        return "owner" if "#" not in user or user.endswith("#owner") else "writer"
+    if READER_RELATIONS <= on_object and READER_NAME_RELATIONS <= on_name:
+        return "reader"
+    return None
+
+
+def migrate_tuples(
+    tuples: List[ClientTuple], object: str, object_for_get: str, database: str
+) -> Tuple[List[ClientTuple], List[ClientTuple]]:
+    """The tuples to write and delete to migrate the tuples on a collection's
+    objects to the roles model."""
+    _existing: Set[TupleKey] = {tuple_key(t) for t in tuples}
+    _relations: Dict[str, Tuple[Set[str], Set[str]]] = defaultdict(
+        lambda: (set(), set())
+    )
+    for t in tuples:
+        if t.object == object:
+            _relations[t.user][0].add(t.relation)
+        elif t.object == object_for_get:
+            _relations[t.user][1].add(t.relation)
+    _roles = {}
+    for _user, (_on_object, _on_name) in _relations.items():
+        _role_of_user = _role(_user, _on_object, _on_name)
+        if _role_of_user is not None:
+            _roles[_user] = _role_of_user
+    _writes = [
+        ClientTuple(database, "database", object),
+        ClientTuple(object, "collection", object_for_get),
+    ]
+    _deletes = []
+    # a team whose owners, writers and readers have at least their role
+    _teams = {u.split("#")[0] for u in _roles if u.startswith("team:") and "#" in u}
+    for _team in _teams:
+        _implied = {f"{_team}#{r}": role for r, role in TEAM_ROLES.items()}
+        if not all(_roles.get(u) in _at_least(role) for u, role in _implied.items()):
+            continue
+        _writes.append(ClientTuple(_team, "team", object))
+        for _user, _role_of_user in _implied.items():
+            if _roles[_user] == _role_of_user:
+                # given by the team tuple
+                del _roles[_user]
+                _deletes += _covered(_user, _role_of_user, object, object_for_get)
+    for _user, _role_of_user in _roles.items():
+        _writes.append(ClientTuple(_user, _role_of_user, object))
+        _deletes += _covered(_user, _role_of_user, object, object_for_get)
+    return (
+        [t for t in _writes if tuple_key(t) not in _existing],
+        [t for t in _deletes if tuple_key(t) in _existing],
+    )
+
+
+def _at_least(role: str) -> Set[str]:
+    return {"owner": {"owner"}, "writer": {"owner", "writer"}}.get(
+        role, {"owner", "writer", "reader"}
+    )
+
+
+def _covered(
+    user: str, role: str, object: str, object_for_get: str
+) -> List[ClientTuple]:
+    _on_object, _on_name = (
+        (READER_RELATIONS, READER_NAME_RELATIONS)
+        if role == "reader"
+        else (WRITER_RELATIONS, WRITER_NAME_RELATIONS)
+    )
+    return [ClientTuple(user, r, object) for r in sorted(_on_object)] + [
+        ClientTuple(user, r, object_for_get) for r in sorted(_on_name)
+    ]
+
+
+class RolesMigration:
+    def __init__(
+        self, permissions: OpenFGAPermissionsAPI, dry_run: bool = False
+    ) -> None:
+        self._permissions = permissions
+        self._dry_run = dry_run
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            "dry_run": dry_run,
+            "collections": 0,
+            "migrated": 0,
+            "tuples_before": 0,
+            "tuples_after": 0,
+            "written": 0,
+            "deleted": 0,
+        }
+
+    def migrate(self, collection: Any) -> None:
+        _tenant, _database = collection["tenant"], collection["database"]
+        _object = f"collection:{_tenant}-{_database}-{collection['id']}"
+        _object_for_get = OpenFGAPermissionsAPI.collection_object_for_get(
+            _tenant, _database, collection["name"]
+        )
+        _tuples = self._permissions.object_tuples([_object, _object_for_get])
+        _writes, _deletes = migrate_tuples(
+            _tuples, _object, _object_for_get, f"database:{_tenant}-{_database}"
+        )
+        if (_writes or _deletes) and not self._dry_run:
+            # the role tuples are written before the tuples they replace are
+            # deleted, in the same request when they fit
+            self._permissions.write(_writes, _deletes)
+        with self._lock:
+            self.stats["collections"] += 1
+            self.stats["migrated"] += 1 if _deletes else 0
+            self.stats["tuples_before"] += len(_tuples)
+            self.stats["tuples_after"] += len(_tuples) + len(_writes) - len(_deletes)
+            self.stats["written"] += len(_writes)
+            self.stats["deleted"] += len(_deletes)
+
+
+def main(args: argparse.Namespace) -> int:
+    if not os.path.exists(os.path.join(args.persist_directory, "chroma.sqlite3")):
+        print(f"No Chroma database in {args.persist_directory}", file=sys.stderr)
+        return 1
+    system = System(
+        Settings(
+            is_persistent=True,
+            persist_directory=args.persist_directory,
+            chroma_server_authz_config_provider="chroma_auth.authz.openfga.OpenFGAAuthorizationConfigurationProvider",
+            anonymized_telemetry=False,
+        )
+    )
+    sysdb = system.instance(SysDB)
+    permissions = system.instance(OpenFGAPermissionsAPI)
+    system.start()
+    _started_at = time.perf_counter()
+    migration = RolesMigration(permissions, dry_run=args.dry_run)
+    try:
+        # no tenant and database: the collections of all of them
+        _collections = sysdb.get_collections(tenant=None, database=None)  # type: ignore
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            # list() re-raises the first failure
+            list(executor.map(migration.migrate, _collections))
+    finally:
+        system.stop()
+    migration.stats["seconds"] = time.perf_counter() - _started_at
+    print(json.dumps(migration.stats))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--persist-directory",
+        default=os.environ.get("PERSIST_DIRECTORY", "./chroma"),
+        help="The server's persist directory (default: PERSIST_DIRECTORY or ./chroma)",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Report the changes without writing them"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Collections migrated in parallel"
+    )
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,32 @@
+import os
+from typing import Optional
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer from the environment, falling back to `default`."""
+    _value = os.environ.get(name)
+    if _value is None or _value.strip() == "":
+        return default
+    try:
+        return int(_value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got [{_value}]")
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float from the environment, falling back to `default`."""
+    _value = os.environ.get(name)
+    if _value is None or _value.strip() == "":
+        return default
+    try:
+        return float(_value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got [{_value}]")
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """Read a boolean flag (true/false, 1/0, yes/no) from the environment."""
+    _value: Optional[str] = os.environ.get(name)
+    if _value is None or _value.strip() == "":
+        return default
+    return _value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,121 @@
+import logging
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from chromadb.api import ServerAPI
+from chromadb.config import DEFAULT_DATABASE, DEFAULT_TENANT, Component, System
+
+from chroma_auth.utils import env_float, env_int
+from chroma_auth.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionRef(NamedTuple):
+    """The identifying attributes of a collection, as needed for authorization."""
+
+    id: UUID
+    name: str
+    tenant: str
+    database: str
+
+
+class CollectionMetadataCache(Component):
+    """Caches collection lookups by (tenant, database, name) and by id.
+
+    Authorization resolves a collection's tenant and database (or whether it exists)
+    before most requests. This component serves those lookups from memory and is
+    shared by the authorization provider and the server, which invalidate entries
+    when they create, modify or delete a collection. Changes made by another server
+    process are picked up once the TTL expires, so the collection endpoints read
+    the sysdb (`cached=False`) before creating or deleting a collection, when its
+    permission tuples depend on the answer. Disabled unless
+    `CHROMA_AUTH_COLLECTION_CACHE_SIZE` is set.
+    """
+
+    _cache: Optional[TTLCache[Tuple[Any, ...], CollectionRef]]
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._api: ServerAPI = system.instance(ServerAPI)
+        _size = env_int("CHROMA_AUTH_COLLECTION_CACHE_SIZE", 0)
+        _ttl = env_float("CHROMA_AUTH_COLLECTION_CACHE_TTL_SECONDS", 30)
+        self._cache = TTLCache(capacity=_size, ttl=_ttl) if _size > 0 else None
+
+    def by_name(
+        self,
+        name: str,
+        tenant: str = DEFAULT_TENANT,
+        database: str = DEFAULT_DATABASE,
+        cached: bool = True,
+    ) -> Optional[CollectionRef]:
+        """Look a collection up by name; None if it does not exist. With
+        `cached=False` the sysdb is read, and the cache refreshed."""
+        _key = ("name", tenant, database, name)
+        if self._cache is not None and cached:
+            _ref = self._cache.get(_key)
+            if _ref is not None:
+                return _ref
+        try:
+            _ref = self.ref(
+                self._api.get_collection(name, tenant=tenant, database=database)
+            )
+        except ValueError as e:
+            if "does not exist" in str(e):
+                return None
+            raise
+        self.remember(_ref)
+        return _ref
+
+    def by_id(self, id: UUID) -> CollectionRef:
+        """Look a collection up by id; raises ValueError if it does not exist."""
+        if self._cache is not None:
+            _ref = self._cache.get(("id", id))
+            if _ref is not None:
+                return _ref
+        _ref = self.ref(self._api.get_collection(id=id))
+        self.remember(_ref)
+        return _ref
+
+    @staticmethod
+    def ref(collection: Any) -> CollectionRef:
+        return CollectionRef(
+            id=collection.id,
+            name=collection.name,
+            tenant=collection.tenant,
+            database=collection.database,
+        )
+
+    def remember(self, collection: Any) -> None:
+        """Cache a collection the caller has just created or read."""
+        if self._cache is None:
+            return
+        _ref = self.ref(collection)
+        self._cache.set(("name", _ref.tenant, _ref.database, _ref.name), _ref)
+        self._cache.set(("id", _ref.id), _ref)
+
+    def invalidate(
+        self,
+        id: Optional[UUID] = None,
+        name: Optional[str] = None,
+        tenant: str = DEFAULT_TENANT,
+        database: str = DEFAULT_DATABASE,
+    ) -> int:
+        """Drop the cached entries of a collection given by id or by name."""
+        if self._cache is None:
+            return 0
+        _ids = {id} if id is not None else set()
+        if name is not None:
+            _ref = self._cache.pop(("name", tenant, database, name))
+            if _ref is not None:
+                _ids.add(_ref.id)
+        return self._cache.invalidate(lambda _, ref: ref.id in _ids)
+
+    def clear(self) -> None:
+        if self._cache is not None:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        if self._cache is None:
+            return {"hits": 0, "misses": 0, "size": 0}
+        return self._cache.stats()
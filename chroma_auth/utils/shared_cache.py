@@ -0,0 +1,295 @@
+import fcntl
+import hashlib
+import hmac
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from chromadb.config import Component, System
+from overrides import override
+
+from chroma_auth.utils import env_int
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CHAUTHS1"
+# magic, slots, ways, counters, epoch, flushes
+HEADER = struct.Struct("<8sIIIxxxxQQ")
+HEADER_SIZE = 64
+COUNTER = struct.Struct("<Q")
+# key digest, expires at (wall clock), value, crc32 of the rest
+SLOT = struct.Struct("<16sdqI4x")
+WAYS = 8
+COUNTERS = 8192
+EPOCH_OFFSET = 24
+FLUSHES_OFFSET = 32
+
+
+class SharedMemoryTable:
+    """A fixed-size hash table of integer values with a TTL, in a memory-mapped file
+    shared by every process that opens it.
+
+    Keys are 16-byte digests placed in one of `slots / WAYS` buckets of `WAYS`
+    slots; a full bucket evicts its entry closest to expiry, so the table never
+    grows. Reads take no lock: every slot carries a checksum, and a slot read while
+    another process writes it fails the check and is treated as a miss. Writes are
+    serialized per bucket with a lock on the bucket's byte range of the file.
+
+    The table also holds `COUNTERS` shared counters, which callers mix into their
+    keys to invalidate groups of entries in every process at once (see `bump`).
+    """
+
+    def __init__(self, file: str, slots: int) -> None:
+        self.file = file
+        self.buckets = max(1, slots // WAYS)
+        self.slots = self.buckets * WAYS
+        self._counters_at = HEADER_SIZE
+        self._slots_at = HEADER_SIZE + COUNTERS * COUNTER.size
+        self._size = self._slots_at + self.slots * SLOT.size
+        self._lock = threading.Lock()  # record locks do not exclude threads
+        self._fd = os.open(file, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._init_file()
+            self._mm = mmap.mmap(self._fd, self._size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _init_file(self) -> None:
+        # whole-file lock: the first process to start lays the table out
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            _header = os.pread(self._fd, HEADER.size, 0)
+            _expected = (MAGIC, self.slots, WAYS, COUNTERS)
+            if (
+                os.fstat(self._fd).st_size == self._size
+                and len(_header) == HEADER.size
+                and HEADER.unpack(_header)[:4] == _expected
+            ):
+                return
+            if _header[:8] == MAGIC:
+                logger.warning(
+                    f"Re-initializing shared cache {self.file} with a new layout"
+                )
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, self._size)
+            os.pwrite(self._fd, HEADER.pack(*_expected, 0, 0), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+    @contextmanager
+    def _locked(self, offset: int, length: int) -> Iterator[None]:
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    @staticmethod
+    def _crc(digest: bytes, expires_at: float, value: int) -> int:
+        return zlib.crc32(SLOT.pack(digest, expires_at, value, 0))
+
+    def _bucket_at(self, digest: bytes) -> int:
+        return self._slots_at + (
+            int.from_bytes(digest[:8], "little") % self.buckets
+        ) * (WAYS * SLOT.size)
+
+    def get(self, digest: bytes) -> Optional[Tuple[int, float]]:
+        """The value stored for `digest` and when it expires, if present."""
+        _at = self._bucket_at(digest)
+        _now = time.time()
+        for _digest, _expires_at, _value, _crc in SLOT.iter_unpack(
+            self._mm[_at : _at + WAYS * SLOT.size]
+        ):
+            if (
+                _digest == digest
+                and _expires_at > _now
+                and _crc == self._crc(_digest, _expires_at, _value)
+            ):
+                self._hits += 1
+                return _value, _expires_at
+        self._misses += 1
+        return None
+
+    def set(self, digest: bytes, value: int, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        _at = self._bucket_at(digest)
+        _expires_at = time.time() + ttl
+        with self._locked(_at, WAYS * SLOT.size):
+            _now = time.time()
+            _victim, _victim_expires_at = 0, float("inf")
+            for i, (_digest, _slot_expires_at, _, _) in enumerate(
+                SLOT.iter_unpack(self._mm[_at : _at + WAYS * SLOT.size])
+            ):
+                if _digest == digest or _slot_expires_at <= _now:
+                    _victim = i
+                    break
+                if _slot_expires_at < _victim_expires_at:
+                    _victim, _victim_expires_at = i, _slot_expires_at
+            else:
+                self._evictions += 1
+            SLOT.pack_into(
+                self._mm,
+                _at + _victim * SLOT.size,
+                digest,
+                _expires_at,
+                value,
+                self._crc(digest, _expires_at, value),
+            )
+
+    def counter(self, name: bytes) -> int:
+        """The shared counter `name` hashes to."""
+        return COUNTER.unpack_from(self._mm, self._counter_at(name))[0]  # type: ignore
+
+    def _counter_at(self, name: bytes) -> int:
+        return self._counters_at + (zlib.crc32(name) % COUNTERS) * COUNTER.size
+
+    def bump(self, name: bytes) -> None:
+        """Increment the counter `name` hashes to, and the epoch."""
+        self._increment(self._counter_at(name))
+        self._increment(EPOCH_OFFSET)
+
+    def flush(self) -> None:
+        """Make every entry unreachable (see `flushes`)."""
+        self._increment(FLUSHES_OFFSET)
+        self._increment(EPOCH_OFFSET)
+
+    def _increment(self, offset: int) -> None:
+        with self._locked(offset, COUNTER.size):
+            COUNTER.pack_into(
+                self._mm, offset, COUNTER.unpack_from(self._mm, offset)[0] + 1
+            )
+
+    @property
+    def epoch(self) -> int:
+        """Incremented by every `bump` and `flush`, in any process."""
+        return COUNTER.unpack_from(self._mm, EPOCH_OFFSET)[0]  # type: ignore
+
+    @property
+    def flushes(self) -> int:
+        return COUNTER.unpack_from(self._mm, FLUSHES_OFFSET)[0]  # type: ignore
+
+    def __len__(self) -> int:
+        _now = time.time()
+        return sum(
+            1
+            for _, _expires_at, _, _ in SLOT.iter_unpack(
+                self._mm[self._slots_at : self._size]
+            )
+            if _expires_at > _now
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Hits and misses of this process; entries held by all of them."""
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "size": len(self),
+        }
+
+
+class SharedAuthCache(Component):
+    """Decisions and credential verifications shared by the worker processes of a
+    host, in a `SharedMemoryTable` at `CHROMA_AUTH_SHARED_CACHE_FILE` (e.g. under
+    /dev/shm). With `--workers N`, a check or a bcrypt verification made by one
+    worker then serves all of them, instead of each worker warming its own caches.
+
+    Entries are keyed on a digest of their namespace, their key and the shared
+    counters of the user and object they concern; invalidating a user or an object
+    bumps its counter, which hides its entries from every worker at once. Disabled
+    unless `CHROMA_AUTH_SHARED_CACHE_FILE` is set. Credential verifications are only
+    shared if `CHROMA_AUTH_SHARED_CACHE_SECRET` is also set, as the key of their
+    digests must not be readable from the file.
+    """
+
+    _table: Optional[SharedMemoryTable]
+
+    def __init__(self, system: System) -> None:
+        super().__init__(system)
+        self._file = os.environ.get("CHROMA_AUTH_SHARED_CACHE_FILE", "").strip()
+        self._slots = env_int("CHROMA_AUTH_SHARED_CACHE_SLOTS", 65536)
+        _secret = os.environ.get("CHROMA_AUTH_SHARED_CACHE_SECRET", "")
+        self._credentials_key = (
+            hmac.new(_secret.encode("utf-8"), b"credentials", hashlib.sha256).digest()
+            if _secret
+            else None
+        )
+        self._table = (
+            SharedMemoryTable(self._file, self._slots) if self._file else None
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._table is not None
+
+    @property
+    def credentials_key(self) -> Optional[bytes]:
+        """The key of credential verification digests, shared by all workers."""
+        return self._credentials_key if self._table is not None else None
+
+    @override
+    def stop(self) -> None:
+        super().stop()
+        if self._table is not None:
+            self._table.close()
+            self._table = None
+
+    @property
+    def epoch(self) -> int:
+        return self._table.epoch if self._table is not None else 0
+
+    def counters(self, *names: str) -> Tuple[int, ...]:
+        """The current counters of `names` (users, objects), to be part of the keys
+        of entries about them; empty if disabled."""
+        if self._table is None:
+            return ()
+        return (self._table.flushes,) + tuple(
+            self._table.counter(name.encode("utf-8")) for name in names
+        )
+
+    def invalidate(self, names: Iterable[str]) -> None:
+        """Hide the entries about any of `names` from every process."""
+        if self._table is None:
+            return
+        for name in names:
+            self._table.bump(name.encode("utf-8"))
+
+    def flush(self) -> None:
+        if self._table is not None:
+            self._table.flush()
+
+    @staticmethod
+    def digest(namespace: str, key: Tuple[object, ...]) -> bytes:
+        return hashlib.blake2b(
+            "\0".join([namespace, *map(str, key)]).encode("utf-8"), digest_size=16
+        ).digest()
+
+    def get(self, digest: bytes) -> Optional[Tuple[int, float]]:
+        if self._table is None:
+            return None
+        return self._table.get(digest)
+
+    def set(self, digest: bytes, value: int, ttl: float) -> None:
+        if self._table is not None:
+            self._table.set(digest, value, ttl)
+
+    def stats(self) -> Dict[str, int]:
+        if self._table is None:
+            return {"hits": 0, "misses": 0, "evictions": 0, "size": 0}
+        return self._table.stats()
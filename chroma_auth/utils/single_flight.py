@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class _Call(Generic[V]):
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Optional[V] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[K, V]):
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers arriving while
+    it is in flight wait for and share its result, or its exception. Nothing is kept
+    once the call completes.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[K, _Call[V]] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    def do(self, key: K, fn: Callable[[], V]) -> V:
+        with self._lock:
+            _call = self._calls.get(key)
+            _leader = _call is None
+            if _call is None:
+                _call = self._calls[key] = _Call()
+                self._leaders += 1
+            else:
+                self._coalesced += 1
+        if not _leader:
+            _call.done.wait()
+            if _call.error is not None:
+                raise _call.error
+            return _call.value  # type: ignore[return-value]
+        try:
+            _call.value = fn()
+            return _call.value
+        except BaseException as e:
+            _call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            _call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "leaders": self._leaders,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+class AsyncSingleFlight(Generic[K, V]):
+    """The asyncio counterpart of `SingleFlight`, for callers on one event loop.
+
+    The shared call runs as its own task, so cancelling one of the waiters (the
+    leader included) does not cancel it for the others.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[K, "asyncio.Task[V]"] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    async def do(self, key: K, fn: Callable[[], Awaitable[V]]) -> V:
+        _task = self._calls.get(key)
+        if _task is not None:
+            self._coalesced += 1
+        else:
+            self._leaders += 1
+            _task = asyncio.ensure_future(fn())
+            self._calls[key] = _task
+            _task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(_task)
+
+    def _forget(self, key: K, task: "asyncio.Task[V]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self._leaders,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """A thread-safe LRU cache whose entries expire after a time-to-live.
+
+    Entries are evicted least-recently-used first once `capacity` is reached, and
+    are treated as absent once their TTL elapses. Each entry may carry its own TTL.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if capacity <= 0:
+            raise ValueError("TTLCache capacity must be a positive integer")
+        self.capacity = capacity
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            _entry = self._cache.get(key)
+            if _entry is None:
+                self._misses += 1
+                return None
+            _expires_at, _value = _entry
+            if _expires_at <= self._clock():
+                del self._cache[key]
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return _value
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        _ttl = self.ttl if ttl is None else ttl
+        if _ttl <= 0:
+            return
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            elif len(self._cache) >= self.capacity:
+                self._cache.popitem(last=False)
+            self._cache[key] = (self._clock() + _ttl, value)
+
+    def pop(self, key: K) -> Optional[V]:
+        with self._lock:
+            _entry = self._cache.pop(key, None)
+            return _entry[1] if _entry is not None else None
+
+    def invalidate(self, predicate: Callable[[K, V], bool]) -> int:
+        """Remove every entry for which `predicate(key, value)` is true."""
+        with self._lock:
+            _stale = [k for k, (_, v) in self._cache.items() if predicate(k, v)]
+            for k in _stale:
+                del self._cache[k]
+            return len(_stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self._hits, "misses": self._misses, "size": len(self._cache)}
@@ -2,12 +2,14 @@
 set -e
 STORE_FILE=/data/store.json
 if test -f "$STORE_FILE"; then
-    echo "Store already exists, skipping creation and import."
+    echo "Store already exists, skipping creation."
     exit 0
 fi
 
-fga store create --model /data/models/model-article-p4.fga --name chroma-auth > $STORE_FILE
-export FGA_STORE_ID=$(jq -r .store.id $STORE_FILE)
-export FGA_MODEL_ID=$(jq -r .model.authorization_model_id $STORE_FILE)
-
-fga tuple write --file /data/data/initial-data.json
+# the tuples are then imported by the import-tuples service
+# (python -m chroma_auth.tools.import_tuples)
+MODEL_FILE=/data/models/model-article-p4.fga
+if test "$FGA_MODEL_VARIANT" = "roles"; then
+    MODEL_FILE=/data/models/model-article-p4-roles.fga
+fi
+fga store create --model $MODEL_FILE --name chroma-auth > $STORE_FILE
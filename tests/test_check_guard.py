@@ -0,0 +1,163 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from chromadb.config import Settings, System
+from openfga_sdk.exceptions import ApiException
+
+from chroma_auth.authz.openfga import check_guard
+from chroma_auth.authz.openfga.check_guard import (
+    MIN_LATENCY_SAMPLES,
+    CircuitOpenError,
+    DeadlineExceededError,
+    OpenFGACheckGuard,
+)
+from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+from chroma_auth.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        check_guard, "time", SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    return clock
+
+
+@pytest.fixture
+def released():
+    # lets the checks blocked by a test finish once it is over
+    released = threading.Event()
+    yield released
+    released.set()
+
+
+@pytest.fixture
+def make_guard(monkeypatch, clock):
+    monkeypatch.setenv("FGA_API_URL", "http://openfga.invalid")
+    monkeypatch.setenv("FGA_STORE_ID", "01HQ0000000000000000000000")
+    monkeypatch.setenv("FGA_MODEL_ID", "01HQ0000000000000000000001")
+    systems = []
+
+    def make_guard(**environ):
+        for name, value in environ.items():
+            monkeypatch.setenv(name, value)
+        system = System(
+            Settings(
+                chroma_server_authz_config_provider="chroma_auth.authz.openfga."
+                "OpenFGAAuthorizationConfigurationProvider",
+                allow_reset=True,
+            )
+        )
+        guard = system.instance(OpenFGACheckGuard)
+        system.start()
+        systems.append(system)
+        return guard
+
+    yield make_guard
+    for system in systems:
+        system.stop()
+
+
+def check(clock, seconds=0.0, result=True, error=None):
+    """A stub check taking `seconds` of the fake clock."""
+
+    def _check():
+        clock.now += seconds
+        if error is not None:
+            raise error
+        return result
+
+    return _check
+
+
+def test_gives_up_on_checks_past_the_deadline(make_guard, clock, released):
+    guard = make_guard(FGA_CHECK_DEADLINE_SECONDS="0.05")
+
+    def _slow_check():
+        clock.now += 1
+        released.wait()
+        return True
+
+    with pytest.raises(DeadlineExceededError):
+        guard.call(_slow_check)
+    assert guard.stats()["deadlines_exceeded"] == 1
+    # a timed-out check counts as a failure of OpenFGA
+    assert guard.stats()["consecutive_failures"] == 1
+    assert guard.call(check(clock, 0.01)) is True
+    assert guard.stats()["consecutive_failures"] == 0
+
+
+def test_opens_the_breaker_after_consecutive_failures(make_guard, clock):
+    guard = make_guard(
+        FGA_BREAKER_FAILURE_THRESHOLD="2", FGA_BREAKER_OPEN_SECONDS="5"
+    )
+    # a rejected request says nothing about the health of OpenFGA
+    for _ in range(3):
+        with pytest.raises(ApiException):
+            guard.call(check(clock, error=ApiException(status=400)))
+    assert guard.closed
+    for _ in range(2):
+        with pytest.raises(ApiException):
+            guard.call(check(clock, error=ApiException(status=503)))
+    assert guard.stats()["state"] == OPEN
+    with pytest.raises(CircuitOpenError):
+        guard.call(check(clock))
+    assert guard.stats()["rejected"] == 1
+    # a single trial once open for FGA_BREAKER_OPEN_SECONDS, closing it on success
+    clock.now += 5
+    assert guard.stats()["state"] == HALF_OPEN
+    assert guard.call(check(clock)) is True
+    assert guard.stats()["state"] == CLOSED
+
+
+def test_counts_slow_checks_as_failures(make_guard, clock):
+    guard = make_guard(
+        FGA_BREAKER_FAILURE_THRESHOLD="2", FGA_BREAKER_SLOW_CALL_SECONDS="1"
+    )
+    assert guard.call(check(clock, 2)) is True
+    assert guard.call(check(clock, 0.5)) is True
+    assert guard.call(check(clock, 2)) is True
+    assert guard.closed
+    assert guard.call(check(clock, 2)) is True
+    assert not guard.closed
+
+
+def test_hedges_checks_slower_than_the_percentile(make_guard, clock, released):
+    guard = make_guard(FGA_HEDGE_PERCENTILE="50")
+    for _ in range(MIN_LATENCY_SAMPLES):
+        guard.call(check(clock, 0.01))
+    assert guard.stats()["hedge_delay_seconds"] == pytest.approx(0.01)
+    _calls = []
+
+    def _check():
+        _calls.append(None)
+        if len(_calls) == 1:
+            released.wait()
+            return "primary"
+        return "hedge"
+
+    assert guard.call(_check) == "hedge"
+    assert len(_calls) == 2
+    assert guard.stats()["hedged"] == 1
+    assert guard.stats()["hedges_won"] == 1
+
+
+@pytest.mark.parametrize(
+    "mode, last_known, decision",
+    [("deny", True, False), ("last_known", True, True), ("last_known", None, False)],
+)
+def test_decides_unanswered_checks_by_the_degraded_mode(
+    make_guard, mode, last_known, decision
+):
+    guard = make_guard(FGA_DEGRADED_MODE=mode, FGA_CHECK_CACHE_SIZE="10")
+    if last_known is not None:
+        guard.require(OpenFGADecisionCache).set(
+            "user:a", "can_get_records", "collection:c", allowed=last_known
+        )
+    assert guard.degraded("user:a", "can_get_records", "collection:c") is decision
+    assert guard.stats()["degraded"] == 1
+    assert guard.stats()["degraded_served_last_known"] == int(
+        decision and mode == "last_known"
+    )
@@ -0,0 +1,32 @@
+import pytest
+from chromadb.config import Settings, System
+
+from chroma_auth.authz.openfga.decision_cache import OpenFGADecisionCache
+
+DECISION = ("user:admin", "can_query_records", "collection:t-d-c")
+
+
+@pytest.fixture(params=["local", "shared"])
+def cache(request, monkeypatch, tmp_path):
+    monkeypatch.setenv("FGA_CHECK_CACHE_SIZE", "100")
+    if request.param == "shared":
+        monkeypatch.setenv("CHROMA_AUTH_SHARED_CACHE_FILE", str(tmp_path / "cache"))
+        monkeypatch.setenv("CHROMA_AUTH_SHARED_CACHE_SLOTS", "64")
+    system = System(Settings(allow_reset=True))
+    cache = system.instance(OpenFGADecisionCache)
+    system.start()
+    yield cache
+    system.stop()
+
+
+def test_caches_decisions_after_an_invalidation(cache):
+    cache.invalidate_objects([DECISION[2]])
+    cache.set(*DECISION, allowed=True, generation=cache.generation)
+    assert cache.get(*DECISION) is True
+
+
+def test_drops_decisions_fetched_before_an_invalidation(cache):
+    _generation = cache.generation
+    cache.invalidate_objects([DECISION[2]])
+    cache.set(*DECISION, allowed=True, generation=_generation)
+    assert cache.get(*DECISION) is None
@@ -0,0 +1,100 @@
+import pytest
+
+from chroma_auth.authz.openfga.model import (
+    AuthorizationModel,
+    Computed,
+    Direct,
+    DirectType,
+    TupleToUserset,
+)
+
+DIRECT_MODEL = "data/models/model-article-p4.fga"
+ROLES_MODEL = "data/models/model-article-p4-roles.fga"
+
+
+@pytest.mark.parametrize("file", [DIRECT_MODEL, ROLES_MODEL])
+def test_parses_the_shipped_models(file):
+    model = AuthorizationModel.from_file(file)
+    assert set(model.type_definitions) == {
+        "user",
+        "team",
+        "server",
+        "tenant",
+        "database",
+        "collection",
+    }
+    assert model.rewrites("collection", "can_query_records")[0] == Direct(
+        (
+            DirectType("user"),
+            DirectType("team", "owner"),
+            DirectType("team", "writer"),
+            DirectType("team", "reader"),
+        )
+    )
+
+
+def test_parses_unions_of_computed_and_tuple_to_userset_relations():
+    model = AuthorizationModel.from_file(ROLES_MODEL)
+    assert model.rewrites("collection", "reader")[1:] == [
+        Computed("writer"),
+        TupleToUserset("reader", "team"),
+        TupleToUserset("reader", "database"),
+        TupleToUserset("reader", "collection"),
+    ]
+    assert model.rewrites("collection", "can_get_collection")[1:] == [
+        Computed("reader")
+    ]
+    assert model.rewrites("collection", "can_fly") == []
+
+
+def test_allows_only_the_type_restrictions_of_a_relation():
+    model = AuthorizationModel.parse(
+        """
+        model
+          schema 1.1
+        type user
+        type team
+          relations
+            define member: [user, user:*]
+        type doc
+          relations
+            define viewer: [team#member]
+        """
+    )
+    assert model.allows("team", "member", "user:anne")
+    assert model.allows("team", "member", "user:*")
+    assert not model.allows("team", "member", "team:a#member")
+    assert model.allows("doc", "viewer", "team:a#member")
+    assert not model.allows("doc", "viewer", "user:anne")
+    assert not model.allows("doc", "editor", "team:a#member")
+
+
+@pytest.mark.parametrize(
+    "definition",
+    [
+        "[user] and owner",
+        "[user] but not blocked",
+        "[user with in_region]",
+    ],
+)
+def test_rejects_unsupported_rewrites(definition):
+    with pytest.raises(ValueError, match="not supported"):
+        AuthorizationModel.parse(
+            f"model\n  schema 1.1\ntype user\ntype doc\n  relations\n"
+            f"    define owner: [user]\n    define viewer: {definition}\n"
+        )
+
+
+@pytest.mark.parametrize(
+    "dsl, error",
+    [
+        ("model\n  schema 1.0\ntype user\n", "unsupported schema"),
+        ("type doc\n  relations\n    define viewer: [group]\n", "undefined group"),
+        ("type doc\n  relations\n    define viewer: editor\n", "undefined doc#editor"),
+        ("type doc\n  relations\n    define viewer: [user#]\n", "invalid type"),
+        ("type doc\n  relations\n    viewer: [user]\n", "unsupported model"),
+    ],
+)
+def test_rejects_invalid_models(dsl, error):
+    with pytest.raises(ValueError, match=error):
+        AuthorizationModel.parse("type user\n" + dsl)
@@ -0,0 +1,161 @@
+from types import SimpleNamespace
+
+import pytest
+from chromadb.config import Settings, System
+from openfga_sdk.client.models import ClientTuple
+from openfga_sdk.exceptions import ValidationException
+
+from chroma_auth.authz.openfga import outbox
+from chroma_auth.authz.openfga.client import SharedOpenFGAClient
+from chroma_auth.authz.openfga.outbox import OpenFGATupleOutbox
+
+A = ClientTuple("user:a", "can_get_records", "collection:c1")
+B = ClientTuple("user:b", "can_get_records", "collection:c1")
+C = ClientTuple("user:c", "can_get_records", "collection:c2")
+
+
+class StubClient:
+    """Records the tuples of each write request, failing those `fail` returns an
+    error for."""
+
+    def __init__(self) -> None:
+        self.requests = []
+        self.fail = lambda writes, deletes: None
+
+    def write(self, body):
+        _writes = [(t.user, t.object) for t in body.writes or ()]
+        _deletes = [(t.user, t.object) for t in body.deletes or ()]
+        self.requests.append((_writes, _deletes))
+        _error = self.fail(_writes, _deletes)
+        if _error is not None:
+            raise _error
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(outbox, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = StubClient()
+    monkeypatch.setattr(SharedOpenFGAClient, "client", property(lambda self: stub))
+    return stub
+
+
+@pytest.fixture
+def make_outbox(monkeypatch, tmp_path, clock, stub):
+    monkeypatch.setenv("FGA_API_URL", "http://openfga.invalid")
+    monkeypatch.setenv("FGA_STORE_ID", "01HQ0000000000000000000000")
+    monkeypatch.setenv("FGA_MODEL_ID", "01HQ0000000000000000000001")
+    monkeypatch.setenv("FGA_OUTBOX_ENABLED", "true")
+    monkeypatch.setenv("FGA_OUTBOX_PATH", str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setenv("FGA_OUTBOX_LEASE_SECONDS", "30")
+    monkeypatch.setenv("FGA_OUTBOX_RETRY_BASE_SECONDS", "1")
+    # batches are drained by the tests, not in the background
+    monkeypatch.setattr(OpenFGATupleOutbox, "_drain_loop", lambda self: None)
+    systems = []
+
+    def make_outbox():
+        system = System(
+            Settings(
+                chroma_server_authz_config_provider="chroma_auth.authz.openfga."
+                "OpenFGAAuthorizationConfigurationProvider",
+                allow_reset=True,
+            )
+        )
+        _outbox = system.instance(OpenFGATupleOutbox)
+        system.start()
+        systems.append(system)
+        return _outbox
+
+    yield make_outbox
+    for system in systems:
+        system.stop()
+
+
+def test_drains_in_order_up_to_a_repeated_tuple(make_outbox, stub):
+    _outbox = make_outbox()
+    _outbox.enqueue(writes=[A, B])
+    _outbox.enqueue(writes=[C], deletes=[A])
+    assert _outbox.pending("collection:c1") == ([B], [A])
+    assert _outbox.drain_once() == 3
+    assert _outbox.drain_once() == 1
+    assert _outbox.drain_once() == 0
+    _a, _b, _c = [(t.user, t.object) for t in (A, B, C)]
+    assert stub.requests == [([_a, _b, _c], []), ([], [_a])]
+    assert _outbox.pending("collection:c1") == ([], [])
+    assert _outbox.stats()["drained"] == 4
+
+
+def test_retries_a_failed_batch_row_by_row(make_outbox, stub):
+    _outbox = make_outbox()
+    stub.fail = lambda writes, deletes: (
+        ValidationException(status=400, reason="invalid relation")
+        if ("user:b", "collection:c1") in writes
+        else None
+    )
+    _outbox.enqueue(writes=[A, B, C])
+    assert _outbox.drain_once() == 2
+    assert [len(w) for w, _ in stub.requests] == [3, 1, 1, 1]
+    assert _outbox.stats()["pending"] == 0
+    assert _outbox.stats()["dead"] == 1
+
+
+@pytest.mark.parametrize(
+    "reason",
+    [
+        "cannot write a tuple which already exists",
+        "cannot delete a tuple which does not exist",
+    ],
+)
+def test_treats_repeated_writes_as_done(make_outbox, stub, reason):
+    _outbox = make_outbox()
+    stub.fail = lambda writes, deletes: (
+        ValidationException(status=400, reason=reason)
+        if ("user:a", "collection:c1") in writes + deletes
+        else None
+    )
+    _outbox.enqueue(writes=[B], deletes=[A])
+    assert _outbox.drain_once() == 2
+    assert _outbox.stats()["pending"] == 0
+    assert _outbox.stats()["dead"] == 0
+
+
+def test_backs_off_then_buries_after_max_attempts(
+    make_outbox, stub, clock, monkeypatch
+):
+    monkeypatch.setenv("FGA_OUTBOX_MAX_ATTEMPTS", "2")
+    _outbox = make_outbox()
+    stub.fail = lambda writes, deletes: ConnectionError("unreachable")
+    _outbox.enqueue(writes=[A])
+    assert _outbox.drain_once() == 0
+    # still backing off: nothing is sent
+    assert _outbox.drain_once() == 0
+    assert len(stub.requests) == 1
+    assert _outbox.pending("collection:c1") == ([A], [])
+    clock.now += 1
+    assert _outbox.drain_once() == 0
+    assert len(stub.requests) == 2
+    assert _outbox.stats()["dead"] == 1
+    assert _outbox.pending("collection:c1") == ([], [])
+
+
+def test_drains_only_while_holding_the_lease(make_outbox, stub, clock):
+    first, second = make_outbox(), make_outbox()
+    assert first.drain_once() == 0
+    second.enqueue(writes=[A])
+    assert second.drain_once() == 0
+    assert stub.requests == []
+    # taken over once the holder has not renewed it for FGA_OUTBOX_LEASE_SECONDS
+    clock.now += 31
+    assert second.drain_once() == 1
+    first.enqueue(writes=[B])
+    assert first.drain_once() == 0
+    assert second.stats()["draining"] and not first.stats()["draining"]
+    # and handed over right away when the holder stops
+    second.stop()
+    assert first.drain_once() == 1
+    assert len(stub.requests) == 2
@@ -0,0 +1,122 @@
+import time
+from types import SimpleNamespace
+
+import bcrypt
+import pytest
+from chromadb.config import Settings, System
+
+from chroma_auth.authn.basic import (
+    MultiUserHtpasswdFileServerAuthCredentialsProvider,
+    session,
+)
+from chroma_auth.authn.basic.session import SessionTokenSigner, parse_secrets
+from chroma_auth.instr import FastAPI
+
+
+def htpasswd(password):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=4)).decode()
+
+
+@pytest.fixture
+def provider(monkeypatch, tmp_path):
+    monkeypatch.setenv("CHROMA_AUTH_SESSION_SECRETS", "secret")
+    (tmp_path / "server.htpasswd").write_text(f"admin:{htpasswd('pw')}\n")
+    (tmp_path / "groupfile").write_text("chroma: admin\n")
+    system = System(
+        Settings(
+            chroma_server_auth_credentials_file=str(tmp_path / "server.htpasswd"),
+            allow_reset=True,
+        )
+    )
+    provider = system.instance(MultiUserHtpasswdFileServerAuthCredentialsProvider)
+    system.start()
+    yield provider
+    system.stop()
+
+
+def test_validates_the_tokens_it_issues():
+    signer = SessionTokenSigner(["secret"], ttl=60)
+    _token, _expires_at = signer.issue("admin", "hash")
+    _claims, _result = signer.validate(_token)
+    assert _result == "valid"
+    assert _claims.username == "admin"
+    assert _claims.expires_at == _expires_at
+    assert _claims.credentials == signer.fingerprint(signer.key_id(_token), "hash")
+
+
+@pytest.mark.parametrize("tamper", ["claims", "signature"])
+def test_rejects_tampered_tokens(tamper):
+    signer = SessionTokenSigner(["secret"], ttl=60)
+    _version, _key_id, _claims, _signature = signer.issue("admin", "hash")[0].split(".")
+    if tamper == "claims":
+        _other = signer.issue("root", "hash")[0].split(".")[2]
+        _token = ".".join([_version, _key_id, _other, _signature])
+    else:
+        _flipped = "A" if _signature[0] != "A" else "B"
+        _token = ".".join([_version, _key_id, _claims, _flipped + _signature[1:]])
+    assert signer.validate(_token) == (None, "invalid")
+
+
+def test_rejects_expired_tokens(monkeypatch):
+    signer = SessionTokenSigner(["secret"], ttl=60)
+    _token, _expires_at = signer.issue("admin", "hash")
+    monkeypatch.setattr(session, "time", SimpleNamespace(time=lambda: _expires_at))
+    assert signer.validate(_token) == (None, "expired")
+
+
+def test_rejects_unknown_key_ids():
+    _token = SessionTokenSigner(["other"], ttl=60).issue("admin", "hash")[0]
+    assert SessionTokenSigner(["secret"], ttl=60).validate(_token) == (None, "invalid")
+    assert SessionTokenSigner(["secret"], ttl=60).validate("v1.zz.e30.x") == (
+        None,
+        "invalid",
+    )
+
+
+def test_rotates_keys_across_secrets():
+    _old_token = SessionTokenSigner(["old"], ttl=60).issue("admin", "hash")[0]
+    rotated = SessionTokenSigner(parse_secrets("new, old"), ttl=60)
+    assert rotated.validate(_old_token)[1] == "valid"
+    # new tokens are signed with the first secret
+    _new_token = rotated.issue("admin", "hash")[0]
+    assert SessionTokenSigner(["new"], ttl=60).validate(_new_token)[1] == "valid"
+    assert SessionTokenSigner(["new"], ttl=60).validate(_old_token)[1] == "invalid"
+
+
+def test_revokes_tokens_when_the_htpasswd_entry_changes(provider, tmp_path):
+    _token, _ = provider.issue_session_token("admin")
+    assert provider.validate_session_token(_token).get_user_id() == "admin"
+    (tmp_path / "server.htpasswd").write_text(f"admin:{htpasswd('changed')}\n")
+    assert provider.reload()
+    assert provider.validate_session_token(_token) is None
+    (tmp_path / "server.htpasswd").write_text(f"root:{htpasswd('pw')}\n")
+    assert provider.reload()
+    assert provider.validate_session_token(_token) is None
+
+
+def test_resolves_the_teams_of_the_current_groupfile(provider, tmp_path):
+    _token, _ = provider.issue_session_token("admin")
+    assert provider.validate_session_token(_token).get_user_attributes()["teams"] == (
+        "chroma",
+    )
+    (tmp_path / "groupfile").write_text("external: admin\nchroma: user1\n")
+    assert provider.reload()
+    assert provider.validate_session_token(_token).get_user_attributes()["teams"] == (
+        "external",
+    )
+
+
+@pytest.mark.parametrize(
+    "authorization, issued",
+    [("Basic YWRtaW46cHc=", True), ("Bearer {token}", False)],
+)
+def test_opens_sessions_with_basic_auth_only(provider, authorization, issued):
+    _token, _ = provider.issue_session_token("admin")
+    _request = SimpleNamespace(
+        state=SimpleNamespace(user_identity=provider.validate_session_token(_token)),
+        headers={"Authorization": authorization.format(token=_token)},
+    )
+    _session = FastAPI._issue_session(SimpleNamespace(_sessions=provider), _request)
+    assert (_session is not None) == issued
+    if issued:
+        assert _session[1] >= time.time()
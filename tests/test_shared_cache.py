@@ -0,0 +1,114 @@
+import multiprocessing
+from types import SimpleNamespace
+
+import pytest
+
+from chroma_auth.utils import shared_cache
+from chroma_auth.utils.shared_cache import SLOT, WAYS, SharedMemoryTable
+
+
+def key(i):
+    return i.to_bytes(16, "little")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(shared_cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def table(tmp_path, clock):
+    # a single bucket
+    table = SharedMemoryTable(str(tmp_path / "cache"), WAYS)
+    yield table
+    table.close()
+
+
+def test_shares_entries_between_tables_of_the_same_file(table, clock):
+    table.set(key(1), 42, ttl=10)
+    other = SharedMemoryTable(table.file, table.slots)
+    try:
+        assert other.get(key(1)) == (42, clock.now + 10)
+        other.set(key(1), 43, ttl=10)
+        assert table.get(key(1))[0] == 43
+        assert len(table) == 1
+    finally:
+        other.close()
+
+
+def test_reinitializes_a_file_with_another_layout(table):
+    table.set(key(1), 42, ttl=10)
+    other = SharedMemoryTable(table.file, 2 * WAYS)
+    try:
+        assert other.get(key(1)) is None
+    finally:
+        other.close()
+
+
+def test_expires_entries(table, clock):
+    table.set(key(1), 42, ttl=10)
+    table.set(key(2), 42, ttl=0)
+    assert table.get(key(2)) is None
+    clock.now += 10
+    assert table.get(key(1)) is None
+    assert len(table) == 0
+    assert table.stats()["hits"] == 0 and table.stats()["misses"] == 2
+
+
+def test_evicts_the_entry_closest_to_expiry_from_a_full_bucket(table, clock):
+    for i in range(WAYS):
+        table.set(key(i), i, ttl=10 + (i + 3) % WAYS)
+    # an expired slot is reused without evicting
+    clock.now += 10.5
+    table.set(key(WAYS), WAYS, ttl=100)
+    assert table.stats()["evictions"] == 0
+    assert table.get(key(WAYS - 3)) is None
+    table.set(key(WAYS + 1), WAYS + 1, ttl=100)
+    assert table.stats()["evictions"] == 1
+    # key(WAYS - 2) had the next expiry, 11
+    assert table.get(key(WAYS - 2)) is None
+    assert len(table) == WAYS
+    assert [table.get(key(i)) is not None for i in range(WAYS + 2)].count(True) == WAYS
+
+
+def test_treats_torn_slots_as_misses(table):
+    table.set(key(1), 42, ttl=10)
+    # a value half-written by another process: the checksum no longer matches
+    with open(table.file, "r+b") as f:
+        f.seek(table._bucket_at(key(1)) + SLOT.size - 16)
+        f.write(b"\xff")
+    assert table.get(key(1)) is None
+    table.set(key(1), 43, ttl=10)
+    assert table.get(key(1))[0] == 43
+
+
+def _bump(file, slots, times):
+    table = SharedMemoryTable(file, slots)
+    try:
+        for _ in range(times):
+            table.bump(b"user:admin")
+    finally:
+        table.close()
+
+
+def test_increments_counters_atomically_across_processes(tmp_path):
+    table = SharedMemoryTable(str(tmp_path / "cache"), WAYS)
+    try:
+        _context = multiprocessing.get_context("fork")
+        _processes = [
+            _context.Process(target=_bump, args=(table.file, table.slots, 500))
+            for _ in range(4)
+        ]
+        for p in _processes:
+            p.start()
+        for p in _processes:
+            p.join()
+        assert [p.exitcode for p in _processes] == [0] * 4
+        assert table.counter(b"user:admin") == 2000
+        assert table.epoch == 2000
+        table.flush()
+        assert table.flushes == 1 and table.epoch == 2001
+    finally:
+        table.close()
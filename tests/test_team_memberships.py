@@ -0,0 +1,85 @@
+import pytest
+from chromadb.config import Settings, System
+
+from chroma_auth.authz.openfga.team_memberships import (
+    ContextualTeamMemberships,
+    load_team_roles,
+)
+
+ROLES = """
+# team roles
+chroma#owner: admin
+chroma#reader: user1, user2
+chroma#writer: user2
+external#reader: *
+"""
+
+
+@pytest.fixture
+def memberships(monkeypatch, tmp_path):
+    _file = tmp_path / "teamroles"
+    _file.write_text(ROLES)
+    monkeypatch.setenv("FGA_CONTEXTUAL_TEAM_ROLES_FILE", str(_file))
+    system = System(Settings(allow_reset=True))
+    memberships = system.instance(ContextualTeamMemberships)
+    system.start()
+    yield memberships
+    system.stop()
+
+
+def relations(memberships, user, *teams):
+    return [
+        (t.relation, t.object)
+        for t in memberships.tuples(user, {"team": teams[0], "teams": teams})
+    ]
+
+
+def test_sends_the_mapped_relation_of_each_member(memberships):
+    assert relations(memberships, "admin", "chroma") == [("owner", "team:chroma")]
+    assert relations(memberships, "user1", "chroma") == [("reader", "team:chroma")]
+    assert relations(memberships, "user2", "chroma") == [
+        ("reader", "team:chroma"),
+        ("writer", "team:chroma"),
+    ]
+
+
+def test_star_maps_every_groupfile_member(memberships):
+    assert relations(memberships, "anyone", "external") == [
+        ("reader", "team:external")
+    ]
+
+
+def test_skips_teams_without_a_mapped_role(memberships):
+    assert relations(memberships, "user3", "chroma", "other") == []
+    assert relations(memberships, "admin", "public") == []
+
+
+def test_only_sends_teams_of_the_identity(memberships):
+    # mapped in the roles file, but no longer in the groupfile
+    assert relations(memberships, "admin", "other") == []
+    assert memberships.tuples("admin", {"team": "public", "teams": ("public",)}) == []
+
+
+def test_disabled_without_a_roles_file(monkeypatch):
+    monkeypatch.delenv("FGA_CONTEXTUAL_TEAM_ROLES_FILE", raising=False)
+    memberships = System(Settings(allow_reset=True)).instance(
+        ContextualTeamMemberships
+    )
+    assert not memberships.enabled
+    assert memberships.tuples("admin", {"teams": ("chroma",)}) == []
+
+
+def test_refuses_a_relation_for_every_team(monkeypatch):
+    monkeypatch.setenv("FGA_CONTEXTUAL_TEAM_RELATION", "owner")
+    with pytest.raises(ValueError):
+        System(Settings(allow_reset=True)).instance(ContextualTeamMemberships)
+
+
+@pytest.mark.parametrize(
+    "line", ["chroma#admin: user1", "chroma: user1", "chroma#owner user1", "chroma#owner:"]
+)
+def test_rejects_malformed_entries(tmp_path, line):
+    _file = tmp_path / "teamroles"
+    _file.write_text(line + "\n")
+    with pytest.raises(ValueError):
+        load_team_roles(str(_file))
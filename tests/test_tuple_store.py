@@ -0,0 +1,213 @@
+import itertools
+
+import pytest
+from chromadb.auth import SimpleUserIdentity
+from chromadb.config import Settings, System
+from openfga_sdk.client.models import ClientTuple
+
+from chroma_auth.authz.openfga.openfga_permissions import OpenFGAPermissionsAPI
+from chroma_auth.authz.openfga.tuple_store import MAX_DEPTH, LocalTupleStore
+from chroma_auth.utils.collection_cache import CollectionRef
+
+DIRECT_MODEL = "data/models/model-article-p4.fga"
+ROLES_MODEL = "data/models/model-article-p4-roles.fga"
+INITIAL_DATA = "data/data/initial-data.json"
+
+WILDCARD_MODEL = """
+model
+  schema 1.1
+type user
+type doc
+  relations
+    define viewer: [user, user:*]
+"""
+
+
+@pytest.fixture
+def make_store(monkeypatch, tmp_path):
+    systems = []
+
+    def make_store(model_file, tuples_file=""):
+        monkeypatch.setenv("FGA_LOCAL_MODEL_FILE", model_file)
+        monkeypatch.setenv("FGA_LOCAL_TUPLES_FILE", tuples_file)
+        system = System(Settings(allow_reset=True))
+        store = system.instance(LocalTupleStore)
+        system.start()
+        systems.append(system)
+        store.load()
+        return store
+
+    yield make_store
+    for system in systems:
+        system.stop()
+
+
+def collection_tuples(variant):
+    return OpenFGAPermissionsAPI.collection_tuples(
+        SimpleUserIdentity("admin", attributes={"team": "chroma"}),
+        "t",
+        "d",
+        CollectionRef("c1", "docs", "t", "d"),
+        variant,
+    )
+
+
+def test_checks_team_usersets_of_the_initial_data(make_store):
+    store = make_store(DIRECT_MODEL, INITIAL_DATA)
+    _database = "database:default_tenant-default_database"
+    assert store.check("user:admin", "can_create_collection", _database)
+    assert store.check("user:user1", "can_list_collections", _database)
+    assert not store.check("user:user1", "can_create_collection", _database)
+    assert not store.check("user:admin-ext", "can_get_database", "tenant:other")
+    assert not store.check("user:nobody", "can_get_tenant", "server:localhost")
+
+
+def test_ignores_tuples_not_allowed_by_the_model(make_store):
+    store = make_store(DIRECT_MODEL)
+    store.apply([ClientTuple("user:anne", "can_fly", "collection:c")])
+    store.apply([ClientTuple("team:a#member", "can_get_records", "collection:c")])
+    assert store.stats()["tuples"] == 0
+
+
+def test_checks_contextual_tuples(make_store):
+    store = make_store(DIRECT_MODEL, INITIAL_DATA)
+    _database = "database:default_tenant-default_database"
+    assert not store.check("user:user2", "can_create_collection", _database)
+    assert store.check(
+        "user:user2",
+        "can_create_collection",
+        _database,
+        [ClientTuple("user:user2", "owner", "team:chroma")],
+    )
+    assert not store.check("user:user2", "can_create_collection", _database)
+
+
+def test_checks_wildcards(make_store, tmp_path):
+    _model = tmp_path / "wildcard.fga"
+    _model.write_text(WILDCARD_MODEL)
+    store = make_store(str(_model))
+    store.apply([{"user": "user:*", "relation": "viewer", "object": "doc:public"}])
+    assert store.check("user:anne", "viewer", "doc:public")
+    assert not store.check("user:anne", "viewer", "doc:private")
+    assert store.list_objects("user:anne", "viewer", "doc") == {"doc:public"}
+
+
+def test_checks_unions_and_tuple_to_usersets(make_store):
+    store = make_store(ROLES_MODEL)
+    store.apply(
+        [
+            ClientTuple("user:dana", "owner", "database:t-d"),
+            ClientTuple("database:t-d", "database", "collection:c1"),
+            ClientTuple("user:wes", "writer", "collection:c2"),
+            ClientTuple("collection:c1", "collection", "collection:docs"),
+        ]
+    )
+    # owner from database, then writer and reader through `or owner`/`or writer`
+    assert store.check("user:dana", "can_query_records", "collection:c1")
+    assert store.check("user:dana", "can_delete_collection", "collection:docs")
+    assert store.check("user:wes", "can_add_records", "collection:c2")
+    assert store.check("user:wes", "can_get_records", "collection:c2")
+    assert not store.check("user:wes", "owner", "collection:c2")
+    assert not store.check("user:wes", "can_get_records", "collection:c1")
+
+
+def test_stops_at_the_depth_limit(make_store):
+    store = make_store(ROLES_MODEL)
+    _links = [
+        ClientTuple(f"collection:c{i + 1}", "collection", f"collection:c{i}")
+        for i in range(MAX_DEPTH + 5)
+    ]
+    store.apply(
+        _links + [ClientTuple("user:anne", "reader", f"collection:c{MAX_DEPTH + 5}")]
+    )
+    assert store.check("user:anne", "reader", f"collection:c{MAX_DEPTH // 2}")
+    with pytest.raises(RecursionError):
+        store.check("user:anne", "reader", "collection:c0")
+
+
+def test_lists_objects_like_checks(make_store):
+    store = make_store(ROLES_MODEL)
+    _tuples, _ = collection_tuples("roles")
+    store.apply(
+        _tuples
+        + [
+            ClientTuple("user:admin", "owner", "team:chroma"),
+            ClientTuple("user:user1", "reader", "team:chroma"),
+            ClientTuple("user:anne", "writer", "collection:t-d-c2"),
+        ]
+    )
+    assert store.list_objects("user:user1", "can_get_collection", "collection") == {
+        "collection:t-d-c1",
+        "collection:t-d-docs",
+    }
+    assert store.list_objects("user:user1", "can_add_records", "collection") == set()
+    assert store.list_objects("user:anne", "can_add_records", "collection") == {
+        "collection:t-d-c2"
+    }
+    assert store.list_objects(
+        "user:user2",
+        "can_add_records",
+        "collection",
+        [ClientTuple("user:user2", "writer", "team:chroma")],
+    ) == {"collection:t-d-c1", "collection:t-d-docs"}
+
+
+def test_roles_model_grants_the_access_of_the_direct_model(make_store):
+    _memberships = [
+        ClientTuple("user:o", "owner", "team:chroma"),
+        ClientTuple("user:w", "writer", "team:chroma"),
+        ClientTuple("user:r", "reader", "team:chroma"),
+        ClientTuple("user:x", "owner", "team:external"),
+    ]
+    _direct_tuples, _objects = collection_tuples("direct")
+    direct = make_store(DIRECT_MODEL)
+    direct.apply(_direct_tuples + _memberships)
+    _roles_tuples, _ = collection_tuples("roles")
+    roles = make_store(ROLES_MODEL)
+    roles.apply(_roles_tuples + _memberships)
+    # the relations the direct model grants on each object, as checked by the server
+    _checked = {(t.relation, t.object) for t in _direct_tuples}
+    assert {o for _, o in _checked} == set(_objects)
+    for user, (relation, object) in itertools.product(
+        ["user:o", "user:w", "user:r", "user:x"], sorted(_checked)
+    ):
+        assert direct.check(user, relation, object) == roles.check(
+            user, relation, object
+        ), (user, relation, object)
+
+
+@pytest.mark.parametrize("variant, roles", [("direct", False), ("roles", True)])
+def test_loads_the_model_of_the_variant(monkeypatch, variant, roles):
+    monkeypatch.delenv("FGA_LOCAL_MODEL_FILE", raising=False)
+    monkeypatch.setenv("FGA_LOCAL_TUPLES_FILE", "")
+    monkeypatch.setenv("FGA_MODEL_VARIANT", variant)
+    store = System(Settings(allow_reset=True)).instance(LocalTupleStore)
+    store.load()
+    assert ("team" in store.model.type_definitions["collection"]) is roles
+
+
+def test_lists_the_objects_every_check_allows(make_store):
+    store = make_store(ROLES_MODEL, INITIAL_DATA)
+    _tuples, _objects = collection_tuples("roles")
+    store.apply(
+        _tuples
+        + [
+            ClientTuple("user:user2", "writer", "team:chroma"),
+            ClientTuple("user:dana", "reader", "database:t-d"),
+            ClientTuple("database:t-d", "database", "collection:t-d-c3"),
+            ClientTuple("team:external#owner", "owner", "collection:t-d-c3"),
+            ClientTuple("collection:t-d-c3", "collection", "collection:t-d-c3-name"),
+        ]
+    )
+    _objects += ["collection:t-d-c3", "collection:t-d-c3-name"]
+    _listed = 0
+    for user, relation in itertools.product(
+        ["user:admin", "user:user1", "user:user2", "user:dana", "user:admin-ext"],
+        ["can_get_collection", "can_add_records", "owner"],
+    ):
+        _objects_listed = store.list_objects(user, relation, "collection")
+        assert _objects_listed == {
+            o for o in _objects if store.check(user, relation, o)
+        }, (user, relation)
+        _listed += len(_objects_listed)
+    assert _listed > 10